@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2014 Dariusz Suchojad <dsuch at zato.io>
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+# stdlib
+from httplib import BAD_REQUEST, CONFLICT, NOT_FOUND, OK, responses
+from json import dumps, loads
+from logging import getLogger
+from traceback import format_exc
+from urlparse import parse_qs
+
+# ConfigObj
+from configobj import ConfigObj
+
+# Zato
+from zato.apimox.timing import DEFAULT_PROFILE_SECONDS
+
+# ################################################################################################################################
+
+logger = getLogger(__name__)
+
+# ################################################################################################################################
+
+DEFAULT_ADMIN_PREFIX = '/__apimox'
+
+class AdminError(Exception):
+    def __init__(self, status, msg):
+        super(AdminError, self).__init__(msg)
+        self.status = status
+
+def to_str(value):
+    """ Returns UTF-8 bytes of a value, which is what mocks are made of, given either bytes or unicode.
+    """
+    return value.encode('utf-8') if isinstance(value, unicode) else value
+
+# ################################################################################################################################
+
+class AdminAPI(object):
+    """ Lets the state of a running HTTPServer be inspected and changed over HTTP, under a reserved path prefix.
+    All responses are JSON.
+    """
+    def __init__(self, server, prefix=DEFAULT_ADMIN_PREFIX):
+        self.server = server
+        self.prefix = prefix.rstrip('/')
+        self.handlers = {
+            ('GET', '/state'): self.on_get_state,
+            ('POST', '/state/reset'): self.on_reset_state,
+            ('GET', '/mocks'): self.on_get_mocks,
+            ('POST', '/mocks'): self.on_update_mocks,
+            ('DELETE', '/mocks'): self.on_delete_mocks,
+            ('GET', '/journal'): self.on_get_journal,
+            ('GET', '/journal/count'): self.on_count_journal,
+            ('DELETE', '/journal'): self.on_clear_journal,
+            ('GET', '/timings'): self.on_get_timings,
+            ('DELETE', '/timings'): self.on_reset_timings,
+            ('POST', '/profile'): self.on_start_profile,
+        }
+
+    def handles(self, path):
+        return path == self.prefix or path.startswith(self.prefix + '/')
+
+# ################################################################################################################################
+
+    def on_request(self, environ, start_response):
+        """ Handles a request or, if there are several workers, has the cluster handle it in all of them.
+        """
+        method = environ['REQUEST_METHOD']
+        path = environ['PATH_INFO'][len(self.prefix):]
+        body = environ['wsgi.input'].read()
+
+        if self.server.cluster:
+            status, data = self.server.cluster.on_admin(method, path, environ['QUERY_STRING'], body)
+        else:
+            status, data = self.handle(method, path, environ['QUERY_STRING'], body)
+
+        start_response('{} {}'.format(status, responses[status]), [('Content-Type', 'application/json')])
+        return [dumps(data) + '\n']
+
+    def handle(self, method, path, qs, body):
+        """ Returns status and data of the response to a request, as handled by this process alone.
+        """
+        qs = dict((key, value[0]) for key, value in parse_qs(qs).items())
+
+        try:
+            handler = self.handlers.get((method, path))
+            if not handler:
+                raise AdminError(NOT_FOUND, 'No such admin endpoint `{} {}`'.format(method, path))
+
+            return OK, handler(qs, body)
+
+        except AdminError, e:
+            return e.status, {'error': e.args[0]}
+
+        except Exception, e:
+            logger.warn('Admin request failed, e:`{}`'.format(format_exc(e)))
+            return BAD_REQUEST, {'error': e.args[0] if e.args else repr(e)}
+
+# ################################################################################################################################
+
+    def get_mock(self, name):
+        mock = self.server.config.mocks_config.get(name)
+        if not mock or name == 'apimox':
+            raise AdminError(NOT_FOUND, 'No such mock `{}`'.format(name))
+        return mock
+
+    def get_scenario(self, name):
+        scenario = self.server.scenarios.get(name)
+        if not scenario:
+            raise AdminError(NOT_FOUND, 'No such scenario `{}`'.format(name))
+        return scenario
+
+# ################################################################################################################################
+
+    def on_get_state(self, qs, body):
+        """ Returns current states of all scenarios and positions of all sequences.
+        """
+        return {
+            'scenarios': dict((name, scenario.get_current()) for name, scenario in self.server.scenarios.items()),
+            'sequences': dict((config.name, config.sequence.state.get(config.sequence.slot))
+                for config in self.server.get_mocks() if config.sequence),
+        }
+
+    def on_reset_state(self, qs, body):
+        """ Resets a scenario or a mock's sequence if either is given in query string, or all of them otherwise.
+        """
+        if 'scenario' in qs:
+            self.get_scenario(qs['scenario']).reset()
+
+        if 'mock' in qs:
+            mock = self.get_mock(qs['mock'])
+            if not mock.sequence:
+                raise AdminError(BAD_REQUEST, 'Mock `{}` has no sequence of responses'.format(qs['mock']))
+            mock.sequence.reset()
+
+        if not ('scenario' in qs or 'mock' in qs):
+            self.server.state.reset()
+
+        return {'ok': True}
+
+# ################################################################################################################################
+
+    def on_get_mocks(self, qs, body):
+        return {'mocks': sorted(config.name for config in self.server.get_mocks())}
+
+    def on_update_mocks(self, qs, body):
+        """ Adds, replaces or deletes mocks in one batch. The request is either a JSON object of
+        {"upsert": {"mock name": {"url_path": "/foo", ...}}, "delete": ["mock name"]} or INI sections
+        which are all upserted. Either way, keys are the same as in config.ini.
+        """
+        if body.lstrip().startswith('{'):
+            data = loads(body)
+            upsert = {}
+            delete = [to_str(name) for name in data.get('delete', [])]
+
+            # JSON strings are unicode whereas mocks, e.g. their responses, are bytes
+            for name, config in data.get('upsert', {}).items():
+                upsert[to_str(name)] = dict((to_str(key), to_str(value if isinstance(value, basestring) else dumps(value)))
+                    for key, value in config.items())
+        else:
+            upsert = ConfigObj(body.splitlines()).dict()
+            delete = []
+
+        self.server.update_mocks(upsert, delete)
+
+        return {'upserted': len(upsert), 'deleted': len(delete)}
+
+    def on_delete_mocks(self, qs, body):
+        """ Deletes a mock given on input or all of them if none is.
+        """
+        delete = [qs['name']] if 'name' in qs else [config.name for config in self.server.get_mocks()]
+        self.server.update_mocks(delete=delete)
+
+        return {'deleted': len(delete)}
+
+# ################################################################################################################################
+
+    def get_journal_query(self, qs):
+        """ Turns query string into journal criteria - mock, path and method are matched as they are
+        while qs.name and header.name match query string parameters and headers of requests.
+        """
+        query = {
+            'mock_name': qs.get('mock'),
+            'path': qs.get('path'),
+            'method': qs.get('method'),
+            'qs': {},
+            'headers': {},
+        }
+
+        for key, value in qs.items():
+            for prefix, name in (('qs.', 'qs'), ('header.', 'headers')):
+                if key.startswith(prefix):
+                    query[name][key.replace(prefix, '', 1)] = value
+
+        return query
+
+    def on_get_journal(self, qs, body):
+        """ Returns requests matching criteria from query string, oldest first, up to limit if one is given.
+        """
+        records = self.server.journal.find(limit=int(qs.get('limit', 0)), **self.get_journal_query(qs))
+        return {'count': len(records), 'requests': [record.to_dict() for record in records]}
+
+    def on_count_journal(self, qs, body):
+        return {'count': self.server.journal.count(**self.get_journal_query(qs))}
+
+    def on_clear_journal(self, qs, body):
+        self.server.journal.clear()
+        return {'ok': True}
+
+# ################################################################################################################################
+
+    def get_timings(self):
+        if not self.server.timings:
+            raise AdminError(NOT_FOUND, 'Timings are not enabled, set timing=True in config.ini')
+        return self.server.timings
+
+    def on_get_timings(self, qs, body):
+        """ Returns histograms of how long each phase of handling requests took, in microseconds.
+        """
+        return {'phases': self.get_timings().to_dict()}
+
+    def on_reset_timings(self, qs, body):
+        self.get_timings().reset()
+        return {'ok': True}
+
+    def on_start_profile(self, qs, body):
+        """ Profiles the server for a number of seconds given in query string, saving stats to the logs directory.
+        """
+        if self.server.profile.is_running():
+            raise AdminError(CONFLICT, 'A profiling session is already running, stats will be saved to `{}`'.format(
+                self.server.profile.path))
+
+        seconds = float(qs.get('seconds', DEFAULT_PROFILE_SECONDS))
+        return {'seconds': seconds, 'path': self.server.profile.start(seconds)}
+
+# ################################################################################################################################
@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2014 Dariusz Suchojad <dsuch at zato.io>
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+# stdlib
+import re
+from itertools import combinations, product
+from urllib import urlencode
+from uuid import uuid4
+
+# Zato
+from zato.apimox.common import get_qs_score
+
+# ################################################################################################################################
+
+# Stands for a query string parameter in requests that is not absent but has a value no mock expects
+_OTHER = 'x' + uuid4().hex[:8]
+
+# Stands for a query string parameter which is not sent in requests at all
+_ABSENT = object()
+
+# Samples used for each {field} in url_path when looking for a path two mocks can both match
+_PATH_SAMPLES = ('1', 'x')
+
+# How many query string combinations to try for a pair of mocks before giving up and assuming they can conflict
+MAX_QS_COMBINATIONS = 10000
+
+_field_re = re.compile(r'\{[^{}]*\}')
+
+# ################################################################################################################################
+
+class Conflict(object):
+    """ Two mocks that can be both the best match for a request, along with an example of such a request.
+    """
+    def __init__(self, method, name1, name2, path=None, qs=None, score=None):
+        self.method = method
+        self.name1 = name1
+        self.name2 = name2
+        self.path = path
+        self.qs = qs
+        self.score = score
+
+    def __repr__(self):
+        return '<{} at {} {}/{}>'.format(self.__class__.__name__, hex(id(self)), self.name1, self.name2)
+
+    def get_example(self):
+        if self.path is None:
+            return '(no example found)'
+
+        qs = urlencode(sorted(self.qs.items()))
+        return '{} {}{}'.format(self.method, self.path, '?' + qs if qs else '')
+
+# ################################################################################################################################
+
+def _split_path(url_path):
+    """ Returns a url_path's literal prefix and suffix, i.e. parts before the first and after the last {field},
+    and whether it has any fields at all. Case is ignored because parse matches paths case-insensitively.
+    """
+    url_path = url_path.lower()
+    fields = _field_re.findall(url_path)
+
+    if not fields:
+        return url_path, url_path, False
+
+    prefix = url_path[:url_path.find(fields[0])]
+    suffix = url_path[url_path.rfind(fields[-1]) + len(fields[-1]):]
+
+    return prefix, suffix, True
+
+def paths_disjoint(url_path1, url_path2):
+    """ Returns True if there is certainly no path that both url_path patterns match. False means they may overlap.
+    """
+    prefix1, suffix1, has_fields1 = _split_path(url_path1)
+    prefix2, suffix2, has_fields2 = _split_path(url_path2)
+
+    if not (has_fields1 or has_fields2):
+        return prefix1 != prefix2
+
+    if not (prefix1.startswith(prefix2) or prefix2.startswith(prefix1)):
+        return True
+
+    if not (suffix1.endswith(suffix2) or suffix2.endswith(suffix1)):
+        return True
+
+    return False
+
+def get_common_path(config1, config2):
+    """ Returns a path both mocks match or None if none could be found.
+    """
+    for config in (config1, config2):
+        for sample in _PATH_SAMPLES:
+            path = _field_re.sub(sample, config.url_path)
+            if config1.url_path_compiled.parse(path) and config2.url_path_compiled.parse(path):
+                return path
+
+def scenarios_exclusive(config1, config2):
+    """ Returns True if two mocks require the same scenario to be in different states, i.e. they are never active at once.
+    """
+    scenario = config1.get('scenario')
+
+    return bool(scenario) and scenario is config2.get('scenario') \
+        and None not in (config1.scenario_state_id, config2.scenario_state_id) \
+        and config1.scenario_state_id != config2.scenario_state_id
+
+# ################################################################################################################################
+
+def get_qs_tie(config1, config2, others):
+    """ Looks for a query string that makes both mocks score the same while no other mock scores higher.
+    Returns a (qs, score) tuple if one is found, (None, None) if there is no such query string
+    and (False, None) if the search had to be given up on.
+    """
+    keys = sorted(set(config1.qs_values) | set(config2.qs_values))
+
+    # Each key can be absent, have a value any of the two mocks expects or a value none of them does
+    candidates = []
+    for key in keys:
+        values = [_ABSENT, _OTHER]
+        for config in (config1, config2):
+            value = config.qs_values.get(key)
+            if value and value not in values:
+                values.append(value)
+        candidates.append(values)
+
+    total = 1
+    for values in candidates:
+        total *= len(values)
+
+    if total > MAX_QS_COMBINATIONS:
+        return False, None
+
+    # Keys only other mocks expect are never sent - that can only lower the other mocks' scores
+    # so if a tie cannot be found without them, it cannot be found with them either.
+    for values in product(*candidates):
+        qs = dict((key, value) for key, value in zip(keys, values) if value is not _ABSENT)
+
+        score = get_qs_score(config1.qs_values, qs)
+        if score != get_qs_score(config2.qs_values, qs):
+            continue
+
+        if any(get_qs_score(other.qs_values, qs) > score for other in others):
+            continue
+
+        return qs, score
+
+    return None, None
+
+# ################################################################################################################################
+
+def get_buckets(configs):
+    """ Groups mocks into buckets such that mocks which may possibly match the same request are always in the same bucket.
+    Mocks in different namespaces never do because no request is ever matched against more than one namespace.
+    Two mocks may match the same path only if literal prefix of one of their url_paths starts with the other one's,
+    so, with prefixes sorted, each mock needs to be joined only with the nearest preceding mock whose prefix it starts with.
+    """
+    parent = dict((config.name, config.name) for config in configs)
+
+    def find(name):
+        while parent[name] != name:
+            parent[name] = parent[parent[name]]
+            name = parent[name]
+        return name
+
+    groups = {}
+    for config in configs:
+        groups.setdefault((config.namespace, config.method), []).append((_split_path(config.url_path)[0], config.name))
+
+    for items in groups.values():
+        stack = []
+        for prefix, name in sorted(items):
+            while stack and not prefix.startswith(stack[-1][0]):
+                stack.pop()
+
+            if stack:
+                parent[find(name)] = find(stack[-1][1])
+
+            stack.append((prefix, name))
+
+    buckets = {}
+    for config in configs:
+        buckets.setdefault(find(config.name), []).append(config)
+
+    return sorted(buckets.values(), key=lambda bucket: bucket[0].name)
+
+def get_conflicts(bucket):
+    """ Returns a list of conflicts between mocks in a bucket and whether the bucket is known to be free of them,
+    which can be False even if no conflicts with an example request were found.
+    """
+    conflicts = []
+    is_unambiguous = True
+
+    for config1, config2 in combinations(bucket, 2):
+
+        if paths_disjoint(config1.url_path, config2.url_path) or scenarios_exclusive(config1, config2):
+            continue
+
+        # Any pair that can tie makes the bucket ambiguous, regardless of whether other mocks would win over them
+        qs, score = get_qs_tie(config1, config2, [])
+
+        if qs is None:
+            continue
+
+        is_unambiguous = False
+
+        # We can't tell if they conflict because there were too many query string combinations to check
+        if qs is False:
+            conflicts.append(Conflict(config1.method, config1.name, config2.name))
+            continue
+
+        path = get_common_path(config1, config2)
+        if not path:
+            continue
+
+        # Now, it's a conflict only if no other mock matching the same path scores higher
+        others = [config for config in bucket
+            if config is not config1 and config is not config2 and config.url_path_compiled.parse(path)]
+
+        qs, score = get_qs_tie(config1, config2, others)
+        if qs is not None:
+            conflicts.append(Conflict(config1.method, config1.name, config2.name, path, qs, score))
+
+    return conflicts, is_unambiguous
+
+def analyze(configs):
+    """ Finds all conflicts among compiled mocks and marks each one's config with an .is_unambiguous flag,
+    True only if no request can ever make it tie with another mock.
+    """
+    out = []
+
+    for bucket in get_buckets(configs):
+        conflicts, is_unambiguous = get_conflicts(bucket)
+        out.extend(conflicts)
+
+        for config in bucket:
+            config.is_unambiguous = is_unambiguous
+
+    return out
+
+# ################################################################################################################################
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2014 Dariusz Suchojad <dsuch at zato.io>
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+# stdlib
+import mmap
+from hashlib import sha1
+from tempfile import TemporaryFile
+
+# ################################################################################################################################
+
+class Arena(object):
+    """ Response bodies laid out one after another in a single read-only memory map, each one handed out
+    as a buffer, i.e. a slice of the map rather than a copy of it. The map is backed by an unlinked temporary file
+    so its pages are the operating system's page cache - processes forked after the arena has been sealed
+    all share them and, unlike with str objects, reference counting never writes to them, so they are never copied.
+    Identical bodies are stored once.
+    """
+    def __init__(self):
+        self.chunks = []
+        self.offsets = {}
+        self.size = 0
+        self.map = None
+
+    def __repr__(self):
+        return '<{} at {} size:{} bodies:{} sealed:{}>'.format(
+            self.__class__.__name__, hex(id(self)), self.size, len(self.offsets), self.map is not None)
+
+    def add(self, data):
+        """ Adds a body and returns its (offset, size) in the arena.
+        """
+        if self.map is not None:
+            raise ValueError('Arena is already sealed')
+
+        key = sha1(data).digest()
+        offset = self.offsets.get(key)
+
+        if offset is None:
+            offset = self.offsets[key] = self.size
+            self.chunks.append(data)
+            self.size += len(data)
+
+        return offset, len(data)
+
+    def seal(self):
+        """ Writes out all bodies and maps them, after which no more can be added.
+        """
+        f = TemporaryFile()
+
+        try:
+            for chunk in self.chunks:
+                f.write(chunk)
+            f.flush()
+
+            # A map can't be empty
+            self.map = mmap.mmap(f.fileno(), self.size, access=mmap.ACCESS_READ) if self.size else ''
+
+        finally:
+            f.close()
+
+        self.chunks = []
+
+    def get(self, offset, size):
+        return buffer(self.map, offset, size)
+
+# ################################################################################################################################
@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2014 Dariusz Suchojad <dsuch at zato.io>
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+# stdlib
+from cStringIO import StringIO
+from httplib import BAD_REQUEST, INTERNAL_SERVER_ERROR, responses
+from logging import getLogger
+from socket import error as socket_error
+from traceback import format_exc
+from urllib import unquote
+
+# gevent
+from gevent import pywsgi
+from gevent.server import StreamServer
+
+# ################################################################################################################################
+
+logger = getLogger(__name__)
+
+# ################################################################################################################################
+
+BACKEND_PYWSGI = 'pywsgi'
+BACKEND_STREAM = 'stream'
+
+DEFAULT_BACKEND = BACKEND_PYWSGI
+
+# Longest request line or header accepted, and the most headers in a request
+MAX_LINE = 65536
+MAX_HEADERS = 100
+
+_BAD_REQUEST = '{} {}'.format(BAD_REQUEST, responses[BAD_REQUEST])
+_INTERNAL_SERVER_ERROR = '{} {}'.format(INTERNAL_SERVER_ERROR, responses[INTERNAL_SERVER_ERROR])
+
+# ################################################################################################################################
+
+class BadRequest(Exception):
+    pass
+
+# ################################################################################################################################
+
+class PyWSGIBackend(object):
+    """ Serves requests through gevent's WSGI server which implements all of HTTP/1.1 and WSGI.
+    Listener is either a (host, port) tuple or a socket already listening, e.g. a Unix domain one.
+    Each request is written to stderr, as by pywsgi, unless access_log is False.
+    """
+    def __init__(self, app, listener, tls_args, access_log=True):
+        self.server = pywsgi.WSGIServer(listener, app, log='default' if access_log else None, **tls_args)
+
+    def __repr__(self):
+        return '<{} at {} address:{}>'.format(self.__class__.__name__, hex(id(self)), self.server.address)
+
+    def init_socket(self):
+        self.server.init_socket()
+
+    def start(self):
+        self.server.start()
+
+    def serve_forever(self):
+        self.server.serve_forever()
+
+# ################################################################################################################################
+
+class StreamBackend(object):
+    """ Serves requests through a lean HTTP/1.1 handler on top of gevent's StreamServer. It builds only the part
+    of a WSGI environ that mocks need, so it's the same engine that handles requests under either backend,
+    but it skips everything else pywsgi does, e.g. Expect: 100-continue, chunked responses or access logs.
+    Requests with chunked bodies are supported and so are persistent connections. An exception raised by the app
+    is logged and turned into a 500 response after which the connection is closed.
+    """
+    def __init__(self, app, listener, tls_args, access_log=True):
+        self.app = app
+        self.server = StreamServer(listener, self.handle, **tls_args)
+
+        if isinstance(listener, tuple):
+            self.server_name, self.server_port = listener[0], str(listener[1])
+        else:
+            self.server_name, self.server_port = listener.getsockname(), ''
+
+    def __repr__(self):
+        return '<{} at {} address:{}>'.format(self.__class__.__name__, hex(id(self)), self.server.address)
+
+    def init_socket(self):
+        self.server.init_socket()
+
+    def start(self):
+        self.server.start()
+
+    def serve_forever(self):
+        self.server.serve_forever()
+
+# ################################################################################################################################
+
+    def read_line(self, rfile):
+        line = rfile.readline(MAX_LINE + 1)
+        if len(line) > MAX_LINE:
+            raise BadRequest('Line too long')
+        return line
+
+    def read_chunked(self, rfile):
+        out = []
+
+        while True:
+            size = self.read_line(rfile).split(b';', 1)[0].strip()
+            try:
+                size = int(size, 16)
+            except ValueError:
+                raise BadRequest('Invalid chunk size `{}`'.format(size))
+
+            if not size:
+                break
+
+            out.append(rfile.read(size))
+            rfile.readline()
+
+        # Trailers, if any, are ignored
+        while self.read_line(rfile).strip():
+            pass
+
+        return b''.join(out)
+
+    def get_environ(self, rfile, address):
+        """ Returns a WSGI environ for the next request on a connection or None if the client closed it.
+        """
+        request_line = self.read_line(rfile)
+        if not request_line:
+            return None
+
+        try:
+            method, uri, version = request_line.split()
+        except ValueError:
+            raise BadRequest('Invalid request line `{}`'.format(request_line.strip()))
+
+        path, _, qs = uri.partition('?')
+
+        # Same as under pywsgi, the path is decoded whereas the query string is not
+        environ = {
+            'REQUEST_METHOD': method,
+            'PATH_INFO': unquote(path),
+            'QUERY_STRING': qs,
+            'SERVER_PROTOCOL': version,
+            'SERVER_NAME': self.server_name,
+            'SERVER_PORT': self.server_port,
+            'REMOTE_ADDR': address[0] if isinstance(address, tuple) else '',
+            'wsgi.url_scheme': 'https' if self.server.ssl_enabled else 'http',
+        }
+
+        for _ in xrange(MAX_HEADERS + 1):
+            line = self.read_line(rfile)
+            if not line.strip():
+                break
+
+            name, _, value = line.partition(b':')
+            name = name.strip().upper().replace('-', '_')
+            if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+                name = 'HTTP_' + name
+
+            value = value.strip()
+            environ[name] = environ[name] + ',' + value if name in environ else value
+        else:
+            raise BadRequest('Too many headers')
+
+        if environ.get('HTTP_TRANSFER_ENCODING', '').lower() == 'chunked':
+            body = self.read_chunked(rfile)
+        else:
+            try:
+                length = int(environ.get('CONTENT_LENGTH') or 0)
+            except ValueError:
+                length = -1
+
+            # A negative length would mean reading until the client closed the connection
+            if length < 0:
+                raise BadRequest('Invalid Content-Length')
+
+            body = rfile.read(length)
+
+        environ['wsgi.input'] = StringIO(body)
+
+        return environ
+
+    def keep_alive(self, environ):
+        connection = environ.get('HTTP_CONNECTION', '').lower()
+
+        if environ['SERVER_PROTOCOL'] == 'HTTP/1.0':
+            return connection == 'keep-alive'
+
+        return connection != 'close'
+
+    def write_response(self, sock, environ, keep_alive, status, headers, result):
+        """ Sends headers and body at once. Body is a list of chunks, each either str or a buffer, e.g. a slice of the arena.
+        """
+        out = ['{} {}\r\n'.format(environ.get('SERVER_PROTOCOL', 'HTTP/1.1'), status)]
+
+        for key, value in headers:
+            out.append('{}: {}\r\n'.format(key, value))
+
+        out.append('Content-Length: {}\r\n'.format(sum(len(chunk) for chunk in result)))
+        if not keep_alive:
+            out.append('Connection: close\r\n')
+
+        out.append('\r\n')
+
+        data = bytearray(b''.join(out))
+        for chunk in result:
+            data.extend(chunk)
+
+        sock.sendall(data)
+
+# ################################################################################################################################
+
+    def handle(self, sock, address):
+        rfile = sock.makefile('rb', -1)
+
+        try:
+            while True:
+                try:
+                    environ = self.get_environ(rfile, address)
+                except BadRequest, e:
+                    self.write_response(sock, {}, False, _BAD_REQUEST, [('Content-Type', 'text/plain')], [e.args[0] + '\n'])
+                    return
+
+                if not environ:
+                    return
+
+                response = {}
+
+                def start_response(status, headers):
+                    response['status'] = status
+                    response['headers'] = headers
+
+                try:
+                    result = self.app(environ, start_response)
+                except Exception:
+                    logger.warn('Could not handle `%s %s`, e:`%s`', environ['REQUEST_METHOD'], environ['PATH_INFO'], format_exc())
+                    self.write_response(sock, environ, False, _INTERNAL_SERVER_ERROR, [('Content-Type', 'text/plain')],
+                        ['Internal Server Error\n'])
+                    return
+
+                keep_alive = self.keep_alive(environ)
+
+                try:
+                    self.write_response(sock, environ, keep_alive, response['status'], response['headers'], result)
+                finally:
+                    if hasattr(result, 'close'):
+                        result.close()
+
+                if not keep_alive:
+                    return
+
+        except socket_error:
+            pass # Client went away
+
+        finally:
+            rfile.close()
+            sock.close()
+
+# ################################################################################################################################
+
+BACKENDS = {
+    BACKEND_PYWSGI: PyWSGIBackend,
+    BACKEND_STREAM: StreamBackend,
+}
+
+# ################################################################################################################################
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2014 Dariusz Suchojad <dsuch at zato.io>
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+# stdlib
+import logging, socket
+from itertools import count
+from multiprocessing import Process
+from urllib import urlencode
+
+# gevent
+from gevent import joinall, reinit, sleep, socket as gsocket, spawn
+
+# Zato
+from zato.apimox.backend import BACKENDS
+from zato.apimox.http import HTTPServer
+from zato.apimox.timing import monotonic
+
+# ################################################################################################################################
+
+DEFAULT_REQUESTS = 10000
+DEFAULT_CONCURRENCY = 50
+
+# How long to wait for a server to start listening, in seconds
+START_TIMEOUT = 10
+
+# ################################################################################################################################
+
+def get_free_port():
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+
+    return port
+
+def get_requests(server):
+    """ Returns request lines of all mocks whose url_path has no fields in it, query strings included,
+    so that the same requests are sent to each backend.
+    """
+    out = []
+
+    for config in server.get_mocks():
+        if '{' in config.url_path:
+            continue
+
+        qs = sorted((key, value if value != '' else 'x') for key, value in config.qs_values.items())
+        out.append(b'{} {}{} HTTP/1.1\r\nHost: 127.0.0.1\r\nContent-Length: 0\r\n\r\n'.format(
+            config.method, config.url_path, '?' + urlencode(qs) if qs else ''))
+
+    return out
+
+# ################################################################################################################################
+
+def serve(server, backend, port):
+    """ Runs in a child process - the hub it inherited needs to be reinitialized first and neither backend
+    logs each request, so that both do the same work.
+    """
+    reinit()
+
+    server.backend = backend
+    server.port = port
+    server.access_log = False
+    server.run()
+
+def wait_for(port):
+    until = monotonic() + START_TIMEOUT
+
+    while monotonic() < until:
+        try:
+            gsocket.create_connection(('127.0.0.1', port)).close()
+        except socket.error:
+            sleep(0.1)
+        else:
+            return
+
+    raise Exception('Server did not start listening on port {} in {}s'.format(port, START_TIMEOUT))
+
+# ################################################################################################################################
+
+def client(port, requests, counter, total, latencies, statuses):
+    """ Sends requests over a single persistent connection until there are no more left to send.
+    """
+    sock = gsocket.create_connection(('127.0.0.1', port))
+    rfile = sock.makefile('rb', -1)
+
+    try:
+        for idx in counter:
+            if idx >= total:
+                return
+
+            start = monotonic()
+            sock.sendall(requests[idx % len(requests)])
+
+            status = rfile.readline().split(b' ', 2)[1]
+            content_length = 0
+
+            while True:
+                line = rfile.readline()
+                if not line.strip():
+                    break
+
+                name, _, value = line.partition(b':')
+                if name.lower() == b'content-length':
+                    content_length = int(value)
+
+            rfile.read(content_length)
+
+            latencies.append(monotonic() - start)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    finally:
+        rfile.close()
+        sock.close()
+
+def run_backend(server, backend, requests, total, concurrency):
+    port = get_free_port()
+    process = Process(target=serve, args=(server, backend, port))
+    process.daemon = True
+    process.start()
+
+    try:
+        wait_for(port)
+
+        counter = count()
+        latencies = []
+        statuses = {}
+
+        start = monotonic()
+        joinall([spawn(client, port, requests, counter, total, latencies, statuses) for _ in xrange(concurrency)], raise_error=True)
+        elapsed = monotonic() - start
+
+    finally:
+        process.terminate()
+        process.join()
+
+    latencies.sort()
+
+    return {
+        'backend': backend,
+        'requests': len(latencies),
+        'seconds': elapsed,
+        'req_per_sec': len(latencies) / elapsed,
+        'p50_ms': latencies[len(latencies) // 2] * 1000,
+        'p99_ms': latencies[int(len(latencies) * 0.99)] * 1000,
+        'statuses': statuses,
+    }
+
+# ################################################################################################################################
+
+def handle(path, total=DEFAULT_REQUESTS, concurrency=DEFAULT_CONCURRENCY, backends=None):
+    """ Sends the same requests to each backend in turn, each serving the same mocks in a process of its own,
+    and returns how fast each one was. Only warnings are logged so that it's the backends and the engine
+    behind them that are measured rather than writing out logs.
+    """
+    server = HTTPServer(False, False, 'plain', path)
+    logging.getLogger('zato').setLevel(logging.WARNING)
+
+    requests = get_requests(server)
+    if not requests:
+        raise Exception('No mocks with url_path without fields to send requests to')
+
+    return [run_backend(server, backend, requests, total, concurrency) for backend in backends or sorted(BACKENDS)]
+
+# ################################################################################################################################
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2014 Dariusz Suchojad <dsuch at zato.io>
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+# stdlib
+import os
+from struct import Struct
+from threading import Event, Lock, Thread
+from time import time
+
+# ################################################################################################################################
+
+# Each capture file starts with it
+MAGIC = b'APIMOXCAP1\n'
+
+# How often to fsync a capture file, in seconds, unless configured otherwise
+DEFAULT_FSYNC_INTERVAL = 1.0
+
+# Size of the write buffer in front of a capture file
+BUFFER_SIZE = 1024 * 1024
+
+# Message header - timestamp and number of frames, followed by each frame's length and its bytes
+_msg_header = Struct(b'>dI')
+_frame_header = Struct(b'>I')
+
+# ################################################################################################################################
+
+class CaptureError(Exception):
+    pass
+
+# ################################################################################################################################
+
+class CaptureWriter(object):
+    """ Appends messages to a capture file, each with its timestamp and all of its frames length-prefixed.
+    Writes are buffered and a background thread flushes and fsyncs the file every fsync_interval seconds.
+    """
+    def __init__(self, path, fsync_interval=DEFAULT_FSYNC_INTERVAL):
+        self.path = path
+        self.fsync_interval = fsync_interval
+        self.lock = Lock()
+        self.closed = Event()
+
+        is_new = not os.path.exists(path) or not os.path.getsize(path)
+        self.file = open(path, 'ab', BUFFER_SIZE)
+        if is_new:
+            self.file.write(MAGIC)
+
+        self.syncer = Thread(target=self._sync_forever, name='apimox-capture-sync')
+        self.syncer.daemon = True
+        self.syncer.start()
+
+    def __repr__(self):
+        return '<{} at {} path:{}>'.format(self.__class__.__name__, hex(id(self)), self.path)
+
+    def write(self, frames, timestamp=None):
+        """ Appends a single message, a list of frames which are either bytes or zmq.Frame objects.
+        """
+        out = [_msg_header.pack(timestamp or time(), len(frames))]
+
+        for frame in frames:
+            data = frame if isinstance(frame, bytes) else frame.bytes
+            out.append(_frame_header.pack(len(data)))
+            out.append(data)
+
+        with self.lock:
+            self.file.write(b''.join(out))
+
+    def _sync(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def sync(self):
+        with self.lock:
+
+            # The file may have been closed while the lock was waited for
+            if self.closed.is_set():
+                return
+
+            self._sync()
+
+    def _sync_forever(self):
+        while not self.closed.wait(self.fsync_interval):
+            self.sync()
+
+    def close(self):
+        with self.lock:
+            if self.closed.is_set():
+                return
+
+            self.closed.set()
+            self._sync()
+            self.file.close()
+
+# ################################################################################################################################
+
+def read_capture(path):
+    """ Yields (timestamp, frames) tuples of all messages in a capture file, in the order they were written.
+    A message cut short at the end of the file, e.g. because its writer was killed, is ignored.
+    """
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise CaptureError('Not a capture file `{}`'.format(path))
+
+        while True:
+            header = f.read(_msg_header.size)
+            if len(header) < _msg_header.size:
+                return
+
+            timestamp, count = _msg_header.unpack(header)
+            frames = []
+
+            for _ in xrange(count):
+                frame_header = f.read(_frame_header.size)
+                if len(frame_header) < _frame_header.size:
+                    return
+
+                size, = _frame_header.unpack(frame_header)
+                data = f.read(size)
+                if len(data) < size:
+                    return
+
+                frames.append(data)
+
+            yield timestamp, frames
+
+# ################################################################################################################################
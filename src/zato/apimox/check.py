@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2014 Dariusz Suchojad <dsuch at zato.io>
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# Originally part of Zato - open-source ESB, SOA, REST, APIs and cloud integrations in Python
+# https://zato.io
+
+from __future__ import absolute_import, division, print_function
+
+# Zato
+from zato.apimox.http import HTTPServer
+
+def handle(path):
+    """ Returns all conflicts between HTTP mocks found in path.
+    """
+    return HTTPServer(config_dir=path, log_type='plain').conflicts
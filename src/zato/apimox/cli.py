@@ -21,11 +21,13 @@ import click
 import pkg_resources
 
 # Zato
-from zato.apimox import init as _init, run as _run
+from zato.apimox import bench as _bench, check as _check, init as _init, openapi as _openapi, replay as _replay, run as _run
+from zato.apimox.backend import BACKENDS
 
 # ################################################################################################################################
 
-_mock_types = 'http-plain', 'http-tls', 'http-tls-client-certs', 'zmq-pull', 'zmq-sub'
+_mock_types = 'http-plain', 'http-tls', 'http-tls-client-certs', 'zmq-pull', 'zmq-sub', 'zmq-rep', 'zmq-router', \
+    'zmq-pub', 'zmq-push'
 
 def print_version(ctx, param, value):
     if not value or ctx.resilient_parsing:
@@ -78,9 +80,67 @@ def demo(ctx, path):
     cli_init(ctx, path, False)
     _run.handle(path)
 
+@click.command()
+@click.argument('path', type=click.Path(exists=True, file_okay=False, resolve_path=True))
+@click.option('-n', '--requests', type=int, default=_bench.DEFAULT_REQUESTS, help='How many requests to send to each backend')
+@click.option('-c', '--concurrency', type=int, default=_bench.DEFAULT_CONCURRENCY, help='How many connections to send them over')
+@click.option('-b', '--backend', type=click.Choice(sorted(BACKENDS)), multiple=True, help='Backends to compare, all by default')
+@click.pass_context
+def bench(ctx, path, requests, concurrency, backend):
+    for result in _bench.handle(path, requests, concurrency, backend):
+        click.echo('{backend:<10} {requests} requests in {seconds:.2f}s, {req_per_sec:.0f} req/s, '
+            'p50 {p50_ms:.2f} ms, p99 {p99_ms:.2f} ms, statuses {statuses}'.format(**result))
+
+@click.command()
+@click.argument('path', type=click.Path(exists=True, file_okay=False, resolve_path=True))
+@click.pass_context
+def check(ctx, path):
+    conflicts = _check.handle(path)
+
+    if not conflicts:
+        click.echo('OK, no conflicting mocks found.')
+        return
+
+    for conflict in conflicts:
+        click.echo('`{}` and `{}` conflict, e.g. {}'.format(conflict.name1, conflict.name2, conflict.get_example()))
+
+    click.echo('\nError: found {} conflict(s).'.format(len(conflicts)))
+    sys.exit(1)
+
+@click.command('import-openapi')
+@click.argument('path', type=click.Path(exists=True, file_okay=False, resolve_path=True))
+@click.argument('spec', type=click.Path(exists=True, dir_okay=False, resolve_path=True))
+@click.option('-o', '--output', help='Config file to write mocks to, relative to http/, named after the spec by default')
+@click.option('-n', '--namespace', help='Namespace to put all mocks in')
+@click.option('-b', '--base-path', help='Prefix of all paths, taken from the spec by default')
+@click.pass_context
+def import_openapi(ctx, path, spec, output, namespace, base_path):
+    try:
+        importer = _openapi.handle(path, spec, output, namespace, base_path)
+    except _openapi.SpecError, e:
+        click.echo('Error: {}'.format(e.args[0]))
+        sys.exit(1)
+
+    click.echo('OK, imported {} operation(s) to `{}`{}.'.format(importer.count, importer.output_path,
+        ', skipped {}'.format(importer.skipped) if importer.skipped else ''))
+    click.echo('Add `include={}` to [apimox] in config.ini to use them.'.format(os.path.basename(importer.output_path)))
+
+@click.command()
+@click.argument('path', type=click.Path(exists=True, file_okay=False, resolve_path=True))
+@click.argument('capture', type=click.Path(exists=True, dir_okay=False, resolve_path=True))
+@click.option('-t', '--type', type=click.Choice(('zmq-push', 'zmq-pub')), default='zmq-push')
+@click.option('-s', '--speed', type=float, default=1.0, help='How many times faster than originally, 0 for no delays')
+@click.pass_context
+def replay(ctx, path, capture, type, speed):
+    _replay.handle(path, capture, type, speed)
+
+main.add_command(bench)
+main.add_command(check)
+main.add_command(import_openapi)
 main.add_command(init)
 main.add_command(run)
 main.add_command(demo)
+main.add_command(replay)
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,365 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2014 Dariusz Suchojad <dsuch at zato.io>
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+# stdlib
+import os, socket
+from errno import ECHILD
+from httplib import BAD_REQUEST, OK, SERVICE_UNAVAILABLE
+from json import dumps, loads
+from logging import getLogger
+from operator import itemgetter
+from shutil import rmtree
+from signal import SIG_DFL, SIGINT, signal, SIGTERM
+from tempfile import mkdtemp
+from traceback import format_exc
+from urlparse import parse_qs
+
+# gevent
+from gevent import joinall, reinit, sleep, socket as gsocket, spawn
+from gevent.lock import Semaphore
+from gevent.pool import Pool
+from gevent.server import StreamServer
+
+# Zato
+from zato.apimox.timing import Timings
+
+# ################################################################################################################################
+
+logger = getLogger(__name__)
+
+# ################################################################################################################################
+
+# How long to wait before restarting a worker that exited, in seconds, so that one failing on start-up doesn't spin
+RESTART_DELAY = 1
+
+# How long to wait for a response on a control socket, in seconds
+CONTROL_TIMEOUT = 10
+
+# How often workers check if the parent process is still running, in seconds
+PARENT_CHECK_INTERVAL = 1
+
+# How often the parent checks if any worker exited, in seconds
+REAP_INTERVAL = 0.1
+
+# ################################################################################################################################
+
+def merge_journal(results, qs):
+    """ Returns requests from journals of all workers, oldest first, each with the index of the worker it's from.
+    """
+    requests = []
+
+    for idx, data in results:
+        for record in data['requests']:
+            record['worker'] = idx
+            requests.append(record)
+
+    requests.sort(key=itemgetter('timestamp'))
+
+    limit = int(qs.get('limit', 0))
+    if limit:
+        requests = requests[:limit]
+
+    return {'count': len(requests), 'requests': requests}
+
+def merge_count(results, qs):
+    return {'count': sum(data['count'] for _, data in results)}
+
+def merge_timings(results, qs):
+    timings = Timings()
+
+    for _, data in results:
+        timings.update(data['phases'])
+
+    return {'phases': timings.to_dict()}
+
+def merge_profile(results, qs):
+    return {'seconds': results[0][1]['seconds'], 'paths': sorted(data['path'] for _, data in results)}
+
+# Admin requests about what each worker keeps for itself - they are sent to workers only and their results are merged
+MERGED = {
+    ('GET', '/journal'): merge_journal,
+    ('GET', '/journal/count'): merge_count,
+    ('GET', '/timings'): merge_timings,
+    ('POST', '/profile'): merge_profile,
+}
+
+# ################################################################################################################################
+
+def get_control_socket(path):
+    if os.path.exists(path):
+        os.unlink(path)
+
+    sock = gsocket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.bind(path)
+    sock.listen(socket.SOMAXCONN)
+
+    return sock
+
+def call(path, request):
+    """ Sends a request to a control socket and returns the response, each being a JSON object on a line of its own.
+    """
+    sock = gsocket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(CONTROL_TIMEOUT)
+
+    try:
+        sock.connect(path)
+        sock.sendall(dumps(request) + '\n')
+
+        f = sock.makefile('rb')
+        try:
+            line = f.readline()
+        finally:
+            f.close()
+
+    finally:
+        sock.close()
+
+    if not line:
+        raise socket.error('No response from `{}`'.format(path))
+
+    return loads(line)
+
+# ################################################################################################################################
+
+class Cluster(object):
+    """ Forks workers that serve requests on sockets opened before, restarts each one that exits and keeps mocks
+    of all of them the same. The parent process serves no requests itself. Workers forward admin requests to it
+    over a Unix domain socket and it applies changes to its own mocks first, so that workers restarted later on
+    have them too, and then to each worker's, one change at a time. Journals, timings and profiles are each
+    worker's own, so queries about them are sent to all workers and their results are merged. Sequence positions,
+    scenario states and limits are in shared memory, which all processes see the same.
+    """
+    def __init__(self, server, size):
+        self.server = server
+        self.size = size
+        self.dir = mkdtemp(prefix='apimox-')
+        self.parent_pid = os.getpid()
+        self.pids = {}
+        self.lock = Semaphore()
+        self.pool = Pool()
+        self.control = None
+        self.is_stopping = False
+
+        # Index of the worker this process is, None in the parent
+        self.idx = None
+
+    def __repr__(self):
+        return '<{} at {} size:{} idx:{}>'.format(self.__class__.__name__, hex(id(self)), self.size, self.idx)
+
+    def get_path(self, idx=None):
+        return os.path.join(self.dir, 'worker-{}.sock'.format(idx) if idx else 'parent.sock')
+
+# ################################################################################################################################
+
+    def start(self):
+        """ Forks all workers and supervises them until the parent is stopped. Returns None in the parent,
+        once all workers have exited, and in each worker, its index, starting from 1.
+        """
+        self.control = StreamServer(get_control_socket(self.get_path()), self.on_control, spawn=self.pool)
+        self.control.start()
+
+        signal(SIGTERM, self.on_stop)
+        signal(SIGINT, self.on_stop)
+
+        for idx in xrange(1, self.size + 1):
+            if not self.fork(idx):
+                return idx
+
+        while self.pids:
+            pid, status = self.reap()
+            if not pid:
+                sleep(REAP_INTERVAL)
+                continue
+
+            idx = self.pids.pop(pid, None)
+            if idx is None or self.is_stopping:
+                continue
+
+            logger.warn('Worker %s (pid %s) exited with status %s, restarting it', idx, pid, status)
+            sleep(RESTART_DELAY)
+
+            if not self.is_stopping and not self.fork(idx):
+                return idx
+
+        self.control.close()
+        rmtree(self.dir, True)
+
+        logger.info('All workers stopped')
+
+    def reap(self):
+        """ Returns PID and exit status of a worker that exited, or (0, 0) if none has. Workers are polled for
+        rather than waited for, as older versions of gevent have no cooperative waitpid, and they are forked
+        with os.fork so that newer ones don't reap them on their own.
+        """
+        try:
+            return os.waitpid(-1, os.WNOHANG)
+        except OSError, e:
+            if e.errno != ECHILD:
+                raise
+
+            # Nothing is left to wait for, e.g. because SIGCHLD is ignored and workers are reaped as they exit
+            self.pids.clear()
+            return 0, 0
+
+    def fork(self, idx):
+        """ Forks a worker and returns its PID in the parent and 0 in the worker. Its control socket listens
+        before it's forked, so that no change sent to it while it's starting is lost.
+        """
+        sock = get_control_socket(self.get_path(idx))
+
+        # Waits for the change being applied, if there is one, so that the worker has all of it or none of it
+        with self.lock:
+            pid = os.fork()
+
+            # Same as gevent.os.fork would, except for watching the worker, the event loop is set up anew in the worker
+            if not pid:
+                reinit()
+
+        if pid:
+            sock.close()
+            self.pids[pid] = idx
+            logger.info('Worker %s started (pid %s)', idx, pid)
+            return pid
+
+        self.set_up_worker(idx, sock)
+        return 0
+
+    def set_up_worker(self, idx, sock):
+        self.idx = idx
+        self.pids.clear()
+
+        signal(SIGTERM, SIG_DFL)
+        signal(SIGINT, SIG_DFL)
+
+        # Admin requests the parent was handling are for the parent to respond to
+        self.control.close()
+        self.pool.kill(block=False)
+
+        self.server.setup_logging(idx)
+
+        self.control = StreamServer(sock, self.on_control)
+        self.control.start()
+
+        spawn(self.watch_parent)
+
+    def watch_parent(self):
+        while os.getppid() == self.parent_pid:
+            sleep(PARENT_CHECK_INTERVAL)
+
+        logger.warn('Parent process %s exited, stopping worker %s', self.parent_pid, self.idx)
+        os._exit(1)
+
+    def on_stop(self, signum, frame):
+        """ Stops all workers, after which the parent exits too.
+        """
+        self.is_stopping = True
+
+        for pid in self.pids:
+            try:
+                os.kill(pid, SIGTERM)
+            except OSError:
+                pass # Already exited
+
+# ################################################################################################################################
+
+    def on_control(self, sock, address):
+        """ Handles an admin request, either one forwarded by a worker to the parent or one the parent sends to workers.
+        """
+        f = sock.makefile('rb')
+
+        try:
+            request = loads(f.readline())
+            args = [request[name].encode('utf-8') for name in ('method', 'path', 'qs', 'body')]
+
+            if self.idx:
+                status, data = self.server.admin.handle(*args)
+            else:
+                status, data = self.on_admin(*args)
+
+            sock.sendall(dumps({'status': status, 'data': data}) + '\n')
+
+        except Exception:
+            logger.warn('Could not handle control request, e:`%s`', format_exc())
+
+        finally:
+            f.close()
+            sock.close()
+
+    def on_admin(self, method, path, qs, body):
+        """ Returns status and data of the response to an admin request, as handled by the whole cluster.
+        """
+        if self.idx:
+            return self.call_parent(method, path, qs, body)
+
+        merge = MERGED.get((method, path))
+
+        if merge:
+            results = []
+
+            for idx, status, data in self.broadcast(method, path, qs, body):
+                if status != OK:
+                    return status, data
+                results.append((idx, data))
+
+            if not results:
+                return SERVICE_UNAVAILABLE, {'error': 'No worker responded'}
+
+            return OK, merge(results, dict((key, value[0]) for key, value in parse_qs(qs).items()))
+
+        if method == 'GET':
+            return self.server.admin.handle(method, path, qs, body)
+
+        # Only one change is applied at a time so that all workers apply them in the same order
+        with self.lock:
+            status, data = self.server.admin.handle(method, path, qs, body)
+
+            if status == OK:
+                for idx, worker_status, worker_data in self.broadcast(method, path, qs, body):
+                    if worker_status != OK:
+                        logger.warn('Worker %s could not apply `%s %s`, e:`%s`', idx, method, path, worker_data.get('error'))
+
+            return status, data
+
+    def call_parent(self, method, path, qs, body):
+        try:
+            response = call(self.get_path(), {'method': method, 'path': path, 'qs': qs, 'body': body})
+        except UnicodeDecodeError:
+            return BAD_REQUEST, {'error': 'Admin requests must be UTF-8'}
+        except socket.error, e:
+            return SERVICE_UNAVAILABLE, {'error': 'Could not reach the parent process, e:`{}`'.format(e)}
+
+        return response['status'], response['data']
+
+    def broadcast(self, method, path, qs, body):
+        """ Sends a request to all workers at once and returns index, status and data of each one that responded.
+        """
+        request = {'method': method, 'path': path, 'qs': qs, 'body': body}
+
+        def _call(idx):
+            try:
+                response = call(self.get_path(idx), request)
+            except socket.error, e:
+                logger.warn('Worker %s did not respond to `%s %s`, e:`%s`', idx, method, path, e)
+            else:
+                return idx, response['status'], response['data']
+
+        greenlets = [spawn(_call, idx) for idx in sorted(self.pids.values())]
+        joinall(greenlets)
+
+        return [greenlet.value for greenlet in greenlets if greenlet.value]
+
+    def update_mocks(self, upsert=None, delete=None):
+        """ Has mocks changed in all workers, e.g. when a worker records a response from an upstream server.
+        """
+        status, data = self.on_admin('POST', '/mocks', '', dumps({'upsert': upsert or {}, 'delete': delete or []}))
+        if status != OK:
+            raise ValueError(data['error'])
+
+# ################################################################################################################################
@@ -10,7 +10,9 @@ from __future__ import absolute_import, division, print_function
 
 # stdlib
 import logging, os
-from logging.handlers import RotatingFileHandler
+from string import digits
+from traceback import format_exc
+from uuid import uuid4
 
 # Bunch
 from bunch import Bunch, bunchify
@@ -18,6 +20,69 @@ from bunch import Bunch, bunchify
 # ConfigObj
 from configobj import ConfigObj
 
+# Zato
+from zato.apimox.log import get_file_handler, get_formatter, get_worker_path, LOG_FORMAT_JSON, LOG_FORMAT_TEXT
+
+# ################################################################################################################################
+
+logger = logging.getLogger(__name__)
+
+# ################################################################################################################################
+
+_EMPTY = uuid4().int
+
+# Responses starting with any of these are given inline, anything else is the name of a file a response is in
+JSON_CHAR = '{"[' + digits
+XML_CHAR = '<'
+JSON_XML = JSON_CHAR + XML_CHAR
+
+# Namespace of mocks that don't name one, served by the main port and by each Host a vhost_ key doesn't map
+DEFAULT_NAMESPACE = 'default'
+
+# Score added for a query string parameter whose value is exactly what the config expects
+QS_VALUE_SCORE = 200
+
+# Score added for a query string parameter whose config allows for any value
+QS_ANY_VALUE_SCORE = 1
+
+# ################################################################################################################################
+
+def get_qs_score(config_qs, request_qs):
+    """ Assign 200 if a query string's element matched exactly what we've got in config,
+    and 1 if the config allows for any value as long as keys are the same. It follows then
+    that we allow for up to 200 query parameters on input which should be well enough.
+    """
+    score = 0
+
+    # Go through the request's parameters and add score for each element matching the config
+    for request_key, request_value in request_qs.items():
+        if request_key in config_qs:
+
+            config_value = config_qs.get(request_key, _EMPTY)
+
+            # Config requires an exact value
+            if config_value and config_value != _EMPTY:
+                if config_value == request_value:
+                    score += QS_VALUE_SCORE
+
+            # Config requires any value
+            else:
+                score += QS_ANY_VALUE_SCORE
+
+    # Now go through the config and substract score for each element in config which is not present in request
+    for config_key in config_qs:
+        config_value = config_qs.get(config_key, _EMPTY)
+
+        if config_key not in request_qs:
+            if config_value != _EMPTY:
+                score -= QS_VALUE_SCORE
+            else:
+                score -= QS_ANY_VALUE_SCORE
+
+    return score
+
+# ################################################################################################################################
+
 class BaseServer(object):
 
     SERVER_TYPE = None
@@ -28,6 +93,7 @@ class BaseServer(object):
         self.config.dir = None
         self.config.mocks = Bunch()
         self.config.mocks_config = self.get_mocks_config(config_dir)
+        self.log_handlers = []
         self.setup_logging()
 
     def get_mocks_config(self, config_dir):
@@ -49,27 +115,56 @@ class BaseServer(object):
 
         return bunchify(ConfigObj(config_paths))
 
-    def setup_logging(self):
+    def setup_logging(self, worker_idx=None):
+        """ Log files rotate by size or time, as configured, and optionally are compressed. With log_format=json
+        each entry, including request/response dumps, is a single line of JSON rather than free-form text.
+        Forked workers call it again with their indexes so that each logs to, and rotates, a file of its own.
+        """
         config = self.config.mocks_config.apimox
 
         log_level = getattr(logging, config.log_level)
+        self.log_json = config.get('log_format', LOG_FORMAT_TEXT) == LOG_FORMAT_JSON
 
         logger = logging.getLogger('zato')
         logger.setLevel(log_level)
 
-        rfh = RotatingFileHandler(os.path.join(self.config.dir, 'logs', getattr(config, 'log_file_{}'.format(self.log_type))))
+        for handler in self.log_handlers:
+            logger.removeHandler(handler)
+            handler.close()
+
+        path = os.path.join(self.config.dir, 'logs', getattr(config, 'log_file_{}'.format(self.log_type)))
+        if worker_idx:
+            path = get_worker_path(path, worker_idx)
+
+        fh = get_file_handler(path, config)
         sh = logging.StreamHandler()
 
-        rfh.setLevel(log_level)
+        fh.setLevel(log_level)
         sh.setLevel(log_level)
 
-        formatter = logging.Formatter('%(asctime)s %(name)s %(message)s', '%Y-%m-%d %H:%M:%S')
+        formatter = get_formatter(config.get('log_format', LOG_FORMAT_TEXT))
 
-        rfh.setFormatter(formatter)
+        fh.setFormatter(formatter)
         sh.setFormatter(formatter)
 
-        logger.addHandler(rfh)
+        logger.addHandler(fh)
         logger.addHandler(sh)
 
+        self.log_handlers[:] = [fh, sh]
+
+    def get_file(self, config, name, default=''):
+
+        ext = name.split('.')[-1]
+        resp_dir = os.path.join(self.config.dir, 'response', ext)
+
+        try:
+            full_path = os.path.join(resp_dir, name)
+            data = open(full_path).read()
+        except IOError, e:
+            logger.warn('Could not open `{}`, e:`{}`'.format(full_path, format_exc(e)))
+            return False, ext, default
+        else:
+            return True, ext, data
+
     def set_up(self):
         raise NotImplementedError('Must be implemented in subclasses')
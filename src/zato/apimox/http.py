@@ -9,26 +9,38 @@ Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
 from __future__ import absolute_import, division, print_function
 
 # stdlib
-import os, ssl
+import os, socket, ssl
 from ast import literal_eval
-from httplib import INTERNAL_SERVER_ERROR, OK, PRECONDITION_FAILED, responses
+from httplib import INTERNAL_SERVER_ERROR, OK, PRECONDITION_FAILED, responses, SERVICE_UNAVAILABLE
 from logging import getLogger
-from string import digits
-from traceback import format_exc
+from math import ceil
 from urlparse import parse_qs
-from uuid import uuid4
+
+# Bunch
+from bunch import bunchify
 
 # gevent
-from gevent import pywsgi
+from gevent import socket as gsocket
 
 # parse
 from parse import compile as parse_compile
 
 # Validate
-from validate import is_integer, VdtTypeError
+from validate import is_boolean, is_integer, VdtTypeError
 
 # Zato
-from zato.apimox.common import BaseServer
+from zato.apimox.admin import AdminAPI, DEFAULT_ADMIN_PREFIX
+from zato.apimox.ambiguity import analyze
+from zato.apimox.arena import Arena
+from zato.apimox.backend import BACKENDS, DEFAULT_BACKEND
+from zato.apimox.common import BaseServer, DEFAULT_NAMESPACE, get_qs_score, JSON_XML, XML_CHAR
+from zato.apimox.journal import DEFAULT_JOURNAL_SIZE, get_headers, Journal
+from zato.apimox.proxy import DEFAULT_POOL_SIZE, DEFAULT_RECORD_FILE, DEFAULT_TIMEOUT, Proxy
+from zato.apimox.route import RouteIndex
+from zato.apimox.state import ConcurrencyLimit, DEFAULT_STATE_SIZE, Limits, Scenario, Sequence, SEQUENCE_MODES, \
+     SEQUENCE_ROUND_ROBIN, SharedState, TokenBucket
+from zato.apimox.template import Template
+from zato.apimox.timing import monotonic, ProfileSession, Timings
 
 # ################################################################################################################################
 
@@ -36,14 +48,20 @@ logger = getLogger(__name__)
 
 # ################################################################################################################################
 
-_EMPTY = uuid4().int
 _PRECONDITION_FAILED = '{} {}'.format(PRECONDITION_FAILED, responses[PRECONDITION_FAILED])
 
 DEFAULT_CONTENT_TYPE = 'text/plain'
 
-JSON_CHAR = '{"[' + digits
-XML_CHAR = '<'
-JSON_XML = JSON_CHAR + XML_CHAR
+# Listeners whose address starts with it are Unix domain sockets
+UDS_PREFIX = 'unix:'
+
+TOO_MANY_REQUESTS = 429
+
+# Statuses that requests over rate limits or concurrency caps can be rejected with
+LIMIT_STATUS = {
+    TOO_MANY_REQUESTS: '{} Too Many Requests'.format(TOO_MANY_REQUESTS),
+    SERVICE_UNAVAILABLE: '{} {}'.format(SERVICE_UNAVAILABLE, responses[SERVICE_UNAVAILABLE]),
+}
 
 JSON_CONTENT_TYPE = 'application/json'
 XML_CONTENT_TYPE = 'text/xml'
@@ -58,20 +76,38 @@ CONTENT_TYPE = {
 # ################################################################################################################################
 
 class MatchData(object):
-    def __init__(self, match, name=None, status=None, content_type=None, response=None):
+    def __init__(self, match, name=None, status=None, content_type=None, response=None, is_conflict=False, headers=None,
+            is_limited=False):
         self.match = match
         self.name = name
         self.status = status
         self.content_type = content_type
         self.response = response
+        self.is_conflict = is_conflict
+        self.headers = headers or []
+        self.is_limited = is_limited
+
+# ################################################################################################################################
+
+class Response(list):
+    """ A WSGI response which calls each of its callbacks once the server is done writing it out and closes it.
+    """
+    def __init__(self, data, callbacks):
+        super(Response, self).__init__(data)
+        self.callbacks = callbacks
+
+    def close(self):
+        for callback in self.callbacks:
+            callback()
 
 # ################################################################################################################################
 
 class RequestMatch(object):
 
-    def __init__(self, config, wsgi_environ):
+    def __init__(self, config, wsgi_environ, path_params=None):
         self.config = config
         self.wsgi_environ = wsgi_environ
+        self.path_params = path_params or {}
         self.wsgi_environ_qs = self.get_qs_from_environ()
         self.status = '{} {}'.format(config.status, responses[config.status])
         self.content_type = config.content_type
@@ -112,39 +148,7 @@ class RequestMatch(object):
 # ################################################################################################################################
 
     def get_score(self):
-        """ Assign 200 if a query string's element matched exactly what we've got in config,
-        and 1 if the config allows for any value as long as keys are the same. It follows then
-        that we allow for up to 200 query parameters on input which should be well enough.
-        """
-        any_value_add = 1
-        value_add = 200
-
-        score = 0
-
-        # Go through the request's parameters and add score for each element matching the config
-        for wsgi_key, wsgi_value in self.wsgi_environ_qs.items():
-            if wsgi_key in self.config.qs_values:
-
-                config_value = self.config.qs_values.get(wsgi_key, _EMPTY)
-
-                # Config requires an exact value
-                if config_value and config_value != _EMPTY:
-                    if config_value == wsgi_value:
-                        score += value_add
-
-                # Config requires any value
-                else:
-                    score += any_value_add
-
-        # Now go through the config and substract score for each element in config which is not present in request
-        for config_key in self.config.qs_values:
-            config_value = self.config.qs_values.get(config_key, _EMPTY)
-
-            if config_key not in self.wsgi_environ_qs:
-                if config_value != _EMPTY:
-                    score -= value_add
-                else:
-                    score -= any_value_add
+        score = get_qs_score(self.config.qs_values, self.wsgi_environ_qs)
 
         logger.info('Score {} for `{}` ({} {})'.format(
             score, self.config.name, self.wsgi_environ['PATH_INFO'], self.wsgi_environ_qs))
@@ -157,6 +161,12 @@ class HTTPServer(BaseServer):
 
     SERVER_TYPE = 'http'
 
+    # What requests forwarded to an upstream server are logged and journaled as
+    PROXY_MOCK_NAME = '(proxy)'
+
+    # What requests rejected by global limits are logged and journaled as
+    LIMITED_MOCK_NAME = '(limited)'
+
     def __init__(self, needs_tls=False, require_certs=False, log_type=None, config_dir=None):
         super(HTTPServer, self).__init__(log_type, config_dir)
 
@@ -176,8 +186,131 @@ class HTTPServer(BaseServer):
         self.needs_tls = needs_tls
         self.require_certs = ssl.CERT_REQUIRED if require_certs else ssl.CERT_OPTIONAL
         self.full_address = 'http{}://{}:{}'.format('s' if needs_tls else '', config.host, self.port)
+        self.backend = config.get('http_backend', DEFAULT_BACKEND)
+
+        if self.backend not in BACKENDS:
+            raise ValueError('Unrecognized http_backend `{}`, expected one of {}'.format(self.backend, sorted(BACKENDS)))
+
+        self.skip_conflict_scan = is_boolean(config.get('skip_conflict_scan', False))
+        self.conflicts = []
+        self.state = SharedState(int(config.get('state_size', DEFAULT_STATE_SIZE)))
+        self.limits = self.get_limits(self.get_limit_config(config), ('global',))
+        self.scenarios = {}
+        self.routes = {}
+        self.vhosts = self.get_vhosts(config)
+        self.listeners = self.get_listeners(config)
+        self.journal = Journal(int(config.get('journal_size', DEFAULT_JOURNAL_SIZE)))
+        self.admin = AdminAPI(self, config.get('admin_prefix', DEFAULT_ADMIN_PREFIX))
+        self.proxy = self.get_proxy(config)
+        self.workers = int(config.get('workers', 1))
+        self.cluster = None
+        self.access_log = is_boolean(config.get('access_log', True))
+        self.arena = Arena() if is_boolean(config.get('response_arena', self.workers > 1)) else None
+        self.timings = Timings(is_boolean(config.get('timing_trace', False))) if is_boolean(config.get('timing', False)) else None
+        self.profile = ProfileSession(os.path.join(self.config.dir, 'logs'))
         self.set_up()
 
+# ################################################################################################################################
+
+    def get_limit_config(self, config):
+        """ Returns limits configured either in [apimox], in which case they apply to all requests, or in a mock's section.
+        Over rate_limit requests a second, up to rate_burst of them at once, or over max_in_flight requests at a time,
+        requests are rejected with limit_status, 429 by default, and Retry-After of retry_after seconds
+        or the number of seconds until the rate limit lets one in again.
+        """
+        rate = float(config.get('rate_limit', 0))
+        max_in_flight = int(config.get('max_in_flight', 0))
+
+        if not (rate or max_in_flight):
+            return None
+
+        status = int(config.get('limit_status', TOO_MANY_REQUESTS))
+        if status not in LIMIT_STATUS:
+            raise ValueError('Unrecognized limit_status `{}`, expected one of {}'.format(status, sorted(LIMIT_STATUS)))
+
+        return rate, int(config.get('rate_burst', 0)), max_in_flight, LIMIT_STATUS[status], float(config.get('retry_after', 0))
+
+    def get_limits(self, limit_config, name):
+        """ Returns Limits out of what get_limit_config returned, allocating state slots they need.
+        """
+        if not limit_config:
+            return None
+
+        rate, burst, max_in_flight, status, retry_after = limit_config
+
+        return Limits(
+            TokenBucket(self.state, name, rate, burst) if rate else None,
+            ConcurrencyLimit(self.state, name, max_in_flight) if max_in_flight else None,
+            status, retry_after)
+
+    def acquire(self, limits, acquired, name):
+        """ Returns MatchData to reject a request with if it's over limits, otherwise adds them to the ones acquired.
+        """
+        retry_after = limits.acquire()
+
+        if retry_after is None:
+            acquired.append(limits)
+            return None
+
+        return MatchData(None, name, limits.status, DEFAULT_CONTENT_TYPE, 'Limit exceeded, retry later\n',
+            headers=[('Retry-After', str(int(ceil(retry_after))))], is_limited=True)
+
+    def get_proxy(self, config):
+        """ Returns a Proxy to forward requests no mock matched to, if there is an upstream server configured.
+        """
+        upstream = config.get('proxy_upstream')
+        if not upstream:
+            return None
+
+        return Proxy(self, upstream, CONTENT_TYPE,
+            int(config.get('proxy_pool_size', DEFAULT_POOL_SIZE)),
+            float(config.get('proxy_timeout', DEFAULT_TIMEOUT)),
+            is_boolean(config.get('proxy_record', True)),
+            config.get('proxy_record_file', DEFAULT_RECORD_FILE),
+            is_boolean(config.get('proxy_dedupe', True)))
+
+# ################################################################################################################################
+
+    def get_vhosts(self, config):
+        """ Returns namespaces that requests are mapped to by their Host headers, e.g. vhost_api.example.com=billing.
+        """
+        return dict((key.replace('vhost_', '', 1).lower(), value) for key, value in config.items() if key.startswith('vhost_'))
+
+    def get_listeners(self, config):
+        """ Returns namespaces and addresses of listeners other than the main port, e.g. listen_billing=45333, unix:/tmp/b.sock
+        """
+        out = []
+
+        for key, value in sorted(config.items()):
+            if key.startswith('listen_'):
+                for address in value if isinstance(value, list) else [value]:
+                    out.append((key.replace('listen_', '', 1), address.strip()))
+
+        return out
+
+    def get_routes(self, namespace):
+        routes = self.routes.get(namespace)
+        if routes is None:
+            routes = self.routes[namespace] = RouteIndex()
+        return routes
+
+    def get_app(self, namespace):
+        """ Returns a WSGI app serving mocks of a given namespace.
+        """
+        def app(environ, start_response):
+            return self.on_request(environ, start_response, namespace)
+        return app
+
+    def get_uds(self, path):
+        if os.path.exists(path):
+            os.unlink(path)
+
+        sock = gsocket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.bind(path)
+        sock.listen(socket.SOMAXCONN)
+
+        return sock
+
 # ################################################################################################################################
 
     def run(self):
@@ -194,21 +327,69 @@ class HTTPServer(BaseServer):
                 'server_side': True,
             })
 
-        msg = '{}{} listening on {}'.format('TLS ' if self.needs_tls else '', self.__class__.__name__, self.full_address)
+        msg = '{}{} listening on {} ({})'.format(
+            'TLS ' if self.needs_tls else '', self.__class__.__name__, self.full_address, self.backend)
         if self.needs_tls:
             msg += ' (client certs: {})'.format('required' if self._require_certs else 'optional')
 
         logger.info(msg)
 
-        server = pywsgi.WSGIServer((self.config.mocks_config.apimox.host, int(self.port)), self.on_request, **tls_args)
-        server.serve_forever()
+        backend = BACKENDS[self.backend]
+        host = self.config.mocks_config.apimox.host
+
+        servers = []
+
+        # Unix domain sockets are never TLS ones
+        for namespace, address in self.listeners:
+            if address.startswith(UDS_PREFIX):
+                servers.append(backend(self.get_app(namespace), self.get_uds(address.replace(UDS_PREFIX, '', 1)), {},
+                    self.access_log))
+            else:
+                servers.append(backend(self.get_app(namespace), (host, int(address)), tls_args, self.access_log))
+
+            logger.info('Namespace `%s` listening on %s', namespace, address)
+
+        servers.append(backend(self.on_request, (host, int(self.port)), tls_args, self.access_log))
+
+        # All workers accept connections on the same sockets, opened before they are forked,
+        # while the parent process only supervises them and returns once they have all been stopped.
+        if self.workers > 1:
+
+            # Imported only here so that servers with one worker don't need anything forking does
+            from zato.apimox.cluster import Cluster
+
+            for server in servers:
+                server.init_socket()
+
+            self.cluster = Cluster(self, self.workers)
+            if not self.cluster.start():
+                return
+
+        for server in servers[:-1]:
+            server.start()
+
+        servers[-1].serve_forever()
 
 # ################################################################################################################################
 
-    def log_req_resp(self, mock_name, status, response, resp_headers, environ):
-        """ Log both request and response in an easy to read format.
+    def log_req_resp(self, mock_name, status, response, resp_headers, environ, body=None):
+        """ Log both request and response in an easy to read format, or as a single line of JSON if so configured.
         """
-        req = [' Body=`{}`'.format(environ['wsgi.input'].read())]
+        if self.log_json:
+            logger.info('Request', extra={'data': {
+                'mock': mock_name,
+                'status': status,
+                'method': environ['REQUEST_METHOD'],
+                'path': environ['PATH_INFO'],
+                'qs': environ['QUERY_STRING'],
+                'req_headers': get_headers(environ),
+                'req_body': environ['wsgi.input'].read() if body is None else body,
+                'resp_headers': dict(resp_headers),
+                'resp_body': response,
+            }})
+            return
+
+        req = [' Body=`{}`'.format(environ['wsgi.input'].read() if body is None else body)]
         for key, value in sorted(environ.items()):
             if key[0] == key[0].upper():
                 req.append('  {}=`{}`'.format(key, value))
@@ -241,50 +422,127 @@ class HTTPServer(BaseServer):
 
 # ################################################################################################################################
 
-    def on_request(self, environ, start_response):
+    def get_match_response(self, match):
+        """ Returns the response to a request that matched a mock, moving its scenario to the next state, if any.
+        """
+        config = match.config
+
+        if config.sequence:
+            response, template = config.sequence.get_next()
+        else:
+            response, template = config.response, config.template
+
+        if config.scenario and config.scenario_next_id is not None:
+            config.scenario.move(config.scenario_state_id, config.scenario_next_id)
 
-        data = self.match(environ)
+        return template.render(match) if template else response
+
+# ################################################################################################################################
+
+    def on_request(self, environ, start_response, namespace=DEFAULT_NAMESPACE):
+
+        if self.admin.handles(environ['PATH_INFO']):
+            return self.admin.on_request(environ, start_response)
+
+        # Each phase is timed only if timings are enabled
+        timer = self.timings.get_timer() if self.timings else None
+
+        body = environ['wsgi.input'].read()
+        timer and timer.mark('read')
+
+        # Listeners of the default namespace serve other ones too, depending on Host
+        if namespace == DEFAULT_NAMESPACE and self.vhosts:
+            namespace = self.vhosts.get(environ.get('HTTP_HOST', '').split(':')[0].lower(), DEFAULT_NAMESPACE)
+
+        # Limits that let the request through, to be released once the response has been written out
+        acquired = []
+
+        try:
+            status, resp_headers, response = self.handle(environ, body, namespace, timer, acquired)
+        except Exception:
+            for limits in acquired:
+                limits.release()
+            raise
+
+        start_response(status, resp_headers)
+
+        # The server closes the response once it's written it out, which is when writing is timed
+        callbacks = [limits.release for limits in acquired]
+        if timer:
+            callbacks.append(timer.close)
+
+        return Response([response], callbacks) if callbacks else [response]
+
+    def handle(self, environ, body, namespace, timer, acquired):
+
+        # Requests over global limits are rejected without looking for mocks they match
+        data = self.acquire(self.limits, acquired, self.LIMITED_MOCK_NAME) if self.limits else None
+
+        if not data:
+            data = self.match(environ, timer, namespace)
+            timer and timer.mark('match')
+
+            if data.match and data.match.config.limits:
+                data = self.acquire(data.match.config.limits, acquired, data.match.config.name) or data
+
+        # Nothing matched so the upstream server's response is what we return
+        if self.proxy and not (data.match or data.is_conflict or data.is_limited):
+            name = self.PROXY_MOCK_NAME
+            status, resp_headers, response = self.proxy.forward(environ, body, namespace)
+            timer and timer.mark('proxy')
 
         # We don't know if we match anything or perhaps more than one thing
-        if data.match:
+        elif data.match:
             name = data.match.config.name
             status = data.match.status
             content_type = data.match.content_type
-            response = data.match.response
+            response = self.get_match_response(data.match)
+            timer and timer.mark('response')
+
+            # Set response headers, if any
+            resp_headers = self.set_resp_headers(data.match.config, environ, content_type)
+            timer and timer.mark('headers')
+
         else:
             name = data.name
             status = data.status
-            content_type = data.content_type
             response = data.response
+            resp_headers = data.headers
 
-        # Set response headers, if any
-        resp_headers = self.set_resp_headers(data.match.config, environ, content_type) if data.match else []
+        # Now only bookkeeping is left
+        self.journal.add(name, environ['REQUEST_METHOD'], environ['PATH_INFO'],
+            dict((key, value[0]) for key, value in parse_qs(environ['QUERY_STRING']).items()), get_headers(environ), body)
+        timer and timer.mark('journal')
 
-        # Now only logging is left
-        self.log_req_resp(name, status, response, resp_headers, environ)
+        self.log_req_resp(name, status, response, resp_headers, environ, body)
+        timer and timer.mark('log')
 
-        start_response(status, resp_headers)
-        return [response]
+        return status, resp_headers, response
 
 # ################################################################################################################################
 
-    def match(self, environ):
+    def match(self, environ, timer=None, namespace=DEFAULT_NAMESPACE):
         matches = []
 
-        for name, item in self.config.mocks_config.items():
+        routes = self.routes.get(namespace)
+        candidates = routes.get_candidates(environ['REQUEST_METHOD'], environ['PATH_INFO']) if routes else []
 
-            # Ignore our own config
-            if name == 'apimox':
-                continue
+        for item in candidates:
 
-            if not item.url_path_compiled.parse(environ['PATH_INFO']):
+            path_match = item.url_path_compiled.parse(environ['PATH_INFO'])
+            if not path_match:
                 continue
 
-            method = item.get('method')
-            if method and method != environ['REQUEST_METHOD']:
+            # Mocks that are part of a scenario are active only if it's in the state they require
+            if item.scenario and item.scenario_state_id is not None and not item.scenario.is_in(item.scenario_state_id):
                 continue
 
-            matches.append(RequestMatch(item, environ))
+            if timer:
+                start = monotonic()
+                matches.append(RequestMatch(item, environ, path_match.named))
+                timer.add('score', start)
+            else:
+                matches.append(RequestMatch(item, environ, path_match.named))
 
         if not matches:
             return MatchData(None, None, _PRECONDITION_FAILED, DEFAULT_CONTENT_TYPE, 'No matching mock found\n')
@@ -292,6 +550,11 @@ class HTTPServer(BaseServer):
         # Find the max match match and then make sure it's only one of that score
         # If it isn't, it's a 409 Conflict because we don't know which response to serve.
         match = max(matches)
+
+        # No need to look for other mocks of the same score if set_up found that none can ever tie with this one
+        if self.skip_conflict_scan and match.config.is_unambiguous:
+            return MatchData(match)
+
         found = 0
         conflicting = []
         for m in matches:
@@ -301,26 +564,10 @@ class HTTPServer(BaseServer):
 
         if found > 1:
             return MatchData(None, None, _PRECONDITION_FAILED, DEFAULT_CONTENT_TYPE, 'Multiple mocks matched request: {}\n'.format(
-                sorted([m.config.name for m in conflicting])))
+                sorted([m.config.name for m in conflicting])), True)
 
         return MatchData(match)
 
-# ################################################################################################################################
-
-    def get_file(self, config, name, default=''):
-
-        ext = name.split('.')[-1]
-        resp_dir = os.path.join(self.config.dir, 'response', ext)
-
-        try:
-            full_path = os.path.join(resp_dir, name)
-            data = open(full_path).read()
-        except IOError, e:
-            logger.warn('Could not open `{}`, e:`{}`'.format(full_path, format_exc(e)))
-            return False, ext, default
-        else:
-            return True, ext, data
-
 # ################################################################################################################################
 
     def get_qs_values(self, config):
@@ -348,8 +595,8 @@ class HTTPServer(BaseServer):
 
         return qs_values
 
-    def get_response(self, config):
-        response = config.get('response')
+    def get_response(self, config, response=None):
+        response = response or config.get('response')
 
         if response:
             has_inline_resp = response[0] in JSON_XML
@@ -370,6 +617,72 @@ class HTTPServer(BaseServer):
 
         return response or ''
 
+    def get_template(self, config, response):
+        return Template(response) if config.is_template else None
+
+    def get_sequence_items(self, config):
+        """ Returns responses and weights of a mock which has more than one response, i.e. response_1, response_2
+        and so on, in which case response, if given, is the same as response_0. Each can have its weight_N, 1 by default.
+        """
+        items = {}
+        weights = {}
+
+        for key, value in config.items():
+            for prefix, container in (('response_', items), ('weight_', weights)):
+                if key.startswith(prefix):
+                    container[int(key.replace(prefix, '', 1))] = value
+                    config.pop(key)
+
+        # The first response in a sequence is also what content type of all of them is guessed from
+        if items and not config.get('response'):
+            first = min(items)
+            config.response = items.pop(first)
+            weights[0] = weights.pop(first, 1)
+
+        return items, weights
+
+    def get_sequence_config(self, config, items, weights):
+        """ Returns mode, responses and weights of a mock's sequence, if it has one.
+        """
+        if not items:
+            return None
+
+        mode = config.pop('sequence', SEQUENCE_ROUND_ROBIN)
+        if mode not in SEQUENCE_MODES:
+            raise ValueError('Unrecognized sequence `{}`, expected one of {}'.format(mode, SEQUENCE_MODES))
+
+        responses = [(config.response, config.template)]
+        for idx in sorted(items):
+            response = self.get_response(config, items[idx])
+            responses.append((response, self.get_template(config, response)))
+
+        return mode, responses, [int(weights.get(idx, 1)) for idx in [0] + sorted(items)]
+
+    def get_sequence(self, config):
+        if not config.sequence_config:
+            return None
+
+        mode, responses, weights = config.sequence_config
+        return Sequence(self.state, config.name, mode, responses, weights)
+
+    def set_scenario(self, config):
+        """ Assigns a mock its scenario, the state it requires the scenario to be in (scenario_state)
+        and the one it moves the scenario to after serving a response (scenario_next).
+        """
+        name = config.get('scenario')
+
+        if not name:
+            config.scenario = None
+            return
+
+        scenario = self.scenarios.get(name)
+        if not scenario:
+            scenario = self.scenarios[name] = Scenario(self.state, name)
+
+        config.scenario = scenario
+        config.scenario_state_id = scenario.get_state_id(config.scenario_state) if config.get('scenario_state') else None
+        config.scenario_next_id = scenario.get_state_id(config.scenario_next) if config.get('scenario_next') else None
+
     def get_resp_headers(self, config):
         resp_headers = {}
 
@@ -409,15 +722,142 @@ class HTTPServer(BaseServer):
             if name == 'apimox':
                 continue
 
-            config.name = name
-            config.url_path_compiled = parse_compile(config.url_path)
-            config.status = int(config.get('status', OK))
-            config.method = config.get('method', 'GET')
-            config.qs_values = self.get_qs_values(config)
-            config.response = self.get_response(config)
-            config.resp_headers = self.get_resp_headers(config)
+            self.set_up_mock(name, config)
+            self.get_routes(config.namespace).add(config)
+
+        self.check_conflicts()
+
+        if self.arena:
+            self.share_responses()
+
+    def share_responses(self):
+        """ Moves responses of all mocks, other than templates, to the arena so that all workers share them.
+        Mocks added later on, e.g. through the admin API, keep their responses to themselves.
+        """
+        slices = []
+
+        for config in self.get_mocks():
+            if not config.template:
+                slices.append((config, None, self.arena.add(config.response)))
+
+            if config.sequence:
+                for idx, (response, template) in enumerate(config.sequence.responses):
+                    if not template:
+                        slices.append((config, idx, self.arena.add(response)))
+
+        self.arena.seal()
+
+        for config, idx, (offset, size) in slices:
+            response = self.arena.get(offset, size)
+
+            if idx is None:
+                config.response = response
+            else:
+                config.sequence.responses[idx] = (response, None)
+
+        logger.info('Shared %s response(s), %s bytes, through %r', len(slices), self.arena.size, self.arena)
+
+    def set_up_mock(self, name, config):
+        """ Compiles a single mock's config in place and assigns it the state it needs.
+        """
+        self.compile_mock(name, config)
+        self.bind_mock(config)
+
+    def compile_mock(self, name, config):
+        """ Compiles a single mock's config in place, validating it but not allocating any state yet.
+        """
+        config.name = name
+        config.url_path_compiled = parse_compile(config.url_path)
+        config.status = int(config.get('status', OK))
+        config.method = config.get('method', 'GET')
+        config.namespace = config.get('namespace', DEFAULT_NAMESPACE)
+        config.limit_config = self.get_limit_config(config)
+        config.qs_values = self.get_qs_values(config)
+        items, weights = self.get_sequence_items(config)
+        config.response = self.get_response(config)
+        config.resp_headers = self.get_resp_headers(config)
+        config.is_template = is_boolean(config.pop('template', False))
+        config.template = self.get_template(config, config.response)
+        config.sequence_config = self.get_sequence_config(config, items, weights)
+        config.is_unambiguous = False
+
+    def get_templates(self, config):
+        """ Returns all templates of a mock, each with the index of the response it's of.
+        """
+        responses = config.sequence_config[1] if config.sequence_config else [(config.response, config.template)]
+        return [(idx, template) for idx, (_, template) in enumerate(responses) if template]
+
+    def bind_mock(self, config):
+        """ Allocates state of a compiled mock - its limits, sequence, scenario and counters of its templates.
+        """
+        config.limits = self.get_limits(config.limit_config, ('mock', config.name))
+        config.sequence = self.get_sequence(config)
+        self.set_scenario(config)
+
+        for idx, template in self.get_templates(config):
+            template.bind(self.state, ('counter', config.name, idx))
+
+        qs_info = '(qs: {})'.format(config.qs_values)
+        ns_info = ' (namespace: {})'.format(config.namespace) if config.namespace != DEFAULT_NAMESPACE else ''
+        logger.info('`{}`: {}{} {}{}'.format(config.name, self.full_address, config.url_path, qs_info, ns_info))
+
+    def update_mocks(self, upsert=None, delete=None):
+        """ Adds or replaces mocks from upsert, a dict of INI sections, and deletes the ones named in delete.
+        All new mocks are compiled first and only if all of them are valid are they assigned state,
+        so if any of them is invalid, none of the changes is applied and nothing is left behind.
+        Deleting mocks that don't exist is not an error.
+        """
+        upsert = upsert or {}
+        delete = delete or []
+
+        if 'apimox' in upsert or 'apimox' in delete:
+            raise ValueError('Name `apimox` is reserved')
+
+        new = {}
+        for name, config in sorted(upsert.items()):
+            new[name] = config = bunchify(dict(config))
+            self.compile_mock(name, config)
+
+        for name, config in sorted(new.items()):
+            self.bind_mock(config)
+
+        # Nothing below blocks so no other greenlet will see the changes half-applied
+        mocks = self.config.mocks_config
+
+        for name in set(delete) | set(new):
+            config = mocks.pop(name, None)
+            if config:
+                self.get_routes(config.namespace).remove(config)
+
+        for name, config in new.items():
+            mocks[name] = config
+            routes = self.get_routes(config.namespace)
+            routes.add(config)
+
+            if config.sequence:
+                config.sequence.reset()
+
+            for _, template in self.get_templates(config):
+                template.reset()
+
+            # We don't know if the new mock conflicts with any of the ones that may match the same requests
+            for neighbour in routes.get_neighbours(config):
+                neighbour.is_unambiguous = False
+
+        changed = set(delete) | set(new)
+        self.conflicts[:] = [conflict for conflict in self.conflicts
+            if conflict.name1 not in changed and conflict.name2 not in changed]
+
+    def get_mocks(self):
+        return [config for name, config in sorted(self.config.mocks_config.items()) if name != 'apimox']
+
+    def check_conflicts(self):
+        """ Finds mocks that can be matched by the same request with the same score - such requests
+        would be rejected at runtime so they are reported upfront.
+        """
+        self.conflicts[:] = analyze(self.get_mocks())
 
-            qs_info = '(qs: {})'.format(config.qs_values)
-            logger.info('`{}`: {}{} {}'.format(name, self.full_address, config.url_path, qs_info))
+        for conflict in self.conflicts:
+            logger.warn('Mocks `{}` and `{}` may both match `{}`'.format(conflict.name1, conflict.name2, conflict.get_example()))
 
 # ################################################################################################################################
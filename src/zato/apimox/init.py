@@ -24,6 +24,15 @@ log_level=INFO
 log_file_plain=plain_http.log
 log_file_tls=tls_http.log
 log_file_tls_client_certs=client_certs_tls_http.log
+log_max_bytes=20000000
+log_backup_count=10
+log_compress=False
+log_format=text
+timing=False
+timing_trace=False
+http_backend=pywsgi
+access_log=True
+workers=1
 
 [JSON Demo - 01]
 url_path=/demo
@@ -39,6 +48,11 @@ response=demo2.json
 url_path=/something/{anything}
 response='{"Responses can be":"provided inline"}'
 
+[JSON Demo - 04]
+url_path=/template/{user_id}
+template=True
+response='{"user_id":"{{path.user_id}}", "lang":"{{qs.lang}}", "request_no":{{counter}}}'
+
 [XML Demo - 01]
 url_path=/demo
 qs_format=xml
@@ -51,9 +65,36 @@ host=0.0.0.0
 pull_port=55000
 sub_port=55111
 sub_prefix=
+rep_port=55222
+router_port=55333
+pub_port=55444
+push_port=55555
+rate=1
 log_level=INFO
 log_file_pull=pull_zmq.log
 log_file_sub=sub_zmq.log
+log_file_rep=rep_zmq.log
+log_file_router=router_zmq.log
+log_file_pub=pub_zmq.log
+log_file_push=push_zmq.log
+log_max_bytes=20000000
+log_backup_count=10
+log_compress=False
+log_format=text
+
+[Ping]
+match=ping
+response=pong.txt
+
+[Get user]
+match=get_user:(?P<user_id>\d+)
+match_type=regex
+template=True
+response='{"user_id":{{path.user_id}}, "request_no":{{counter}}}'
+
+[Event]
+message='{"event_id":"{{uuid}}", "event_no":{{counter}}, "created":"{{now}}"}'
+template=True
 """.strip()
 
 CA_CERT="""
@@ -304,6 +345,12 @@ def handle(base_path):
     open(os.path.join(response_xml_dir, 'demo1.xml'), 'w').write(
         """<?xml version="1.0" encoding="utf-8"?>\n<root>\n <element>Greetings!</element>\n</root>\n""")
 
+    # ZMQ responses
+    zmq_response_txt_dir = os.path.join(base_path, 'zmq', 'response', 'txt')
+    os.makedirs(zmq_response_txt_dir)
+
+    open(os.path.join(zmq_response_txt_dir, 'pong.txt'), 'w').write('pong')
+
     # Config files
     open(os.path.join(http_dir, 'config.ini'), 'w').write(HTTP_CONFIG_INI)
     open(os.path.join(zmq_dir, 'config.ini'), 'w').write(ZMQ_CONFIG_INI)
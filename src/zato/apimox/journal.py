@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2014 Dariusz Suchojad <dsuch at zato.io>
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+# stdlib
+from collections import deque
+from hashlib import sha1
+from itertools import count
+from time import time
+
+# ################################################################################################################################
+
+# How many requests are kept, unless configured otherwise
+DEFAULT_JOURNAL_SIZE = 10000
+
+# ################################################################################################################################
+
+def normalize_header_name(name):
+    """ Turns a header name into its usual form, e.g. x_request_id and X-REQUEST-ID both become X-Request-Id.
+    """
+    return '-'.join(elem.capitalize() for elem in name.replace('_', '-').split('-'))
+
+def get_headers(environ):
+    """ Returns request headers out of a WSGI environ, with names in their usual form.
+    """
+    out = {}
+    for key, value in environ.items():
+        if key.startswith('HTTP_'):
+            key = key[5:]
+        elif key not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            continue
+        out[normalize_header_name(key)] = value
+
+    return out
+
+# ################################################################################################################################
+
+class Record(object):
+    """ A request received, along with the mock it matched, if any.
+    """
+    __slots__ = ('id', 'mock_name', 'method', 'path', 'qs', 'headers', 'body_digest', 'body_size', 'timestamp')
+
+    def __init__(self, id, mock_name, method, path, qs, headers, body):
+        self.id = id
+        self.mock_name = mock_name
+        self.method = method
+        self.path = path
+        self.qs = qs
+        self.headers = headers
+        self.body_digest = sha1(body).hexdigest()
+        self.body_size = len(body)
+        self.timestamp = time()
+
+    def __repr__(self):
+        return '<{} at {} id:{} mock:{} {} {}>'.format(
+            self.__class__.__name__, hex(id(self)), self.id, self.mock_name, self.method, self.path)
+
+    def to_dict(self):
+        return dict((name, getattr(self, name)) for name in self.__slots__)
+
+# ################################################################################################################################
+
+class Journal(object):
+    """ A ring buffer of the most recent requests, indexed by mock name and path. Each index keeps IDs of records
+    in the order they were added so the oldest record, the one evicted when the buffer is full,
+    is always the leftmost one in both of its indexes.
+    """
+    def __init__(self, size=DEFAULT_JOURNAL_SIZE):
+        self.size = size
+        self.clear()
+
+    def __repr__(self):
+        return '<{} at {} size:{} len:{}>'.format(self.__class__.__name__, hex(id(self)), self.size, len(self.records))
+
+    def clear(self):
+        self.records = {}
+        self.by_mock = {}
+        self.by_path = {}
+        self.ids = count()
+
+    def _index(self, index, key, record_id):
+        ids = index.get(key)
+        if ids is None:
+            ids = index[key] = deque()
+        ids.append(record_id)
+
+    def _unindex(self, index, key):
+        ids = index[key]
+        ids.popleft()
+        if not ids:
+            del index[key]
+
+    def add(self, mock_name, method, path, qs, headers, body):
+        if not self.size:
+            return
+
+        record = Record(next(self.ids), mock_name, method, path, qs, headers, body)
+
+        oldest = self.records.pop(record.id - self.size, None)
+        if oldest:
+            self._unindex(self.by_mock, oldest.mock_name)
+            self._unindex(self.by_path, oldest.path)
+
+        self.records[record.id] = record
+        self._index(self.by_mock, mock_name, record.id)
+        self._index(self.by_path, path, record.id)
+
+    def count(self, mock_name=None, path=None, **kwargs):
+        """ Returns the number of records matching all criteria given, without looking through any
+        if only one of mock_name or path is. Empty criteria, e.g. qs={}, are the same as none given.
+        """
+        if not any(kwargs.values()):
+            if path is None and mock_name is not None:
+                return len(self.by_mock.get(mock_name, ()))
+
+            if mock_name is None and path is not None:
+                return len(self.by_path.get(path, ()))
+
+        return len(self.find(mock_name, path, **kwargs))
+
+    def find(self, mock_name=None, path=None, method=None, qs=None, headers=None, limit=None):
+        """ Returns records matching all criteria given, oldest first. Only records from the smallest index
+        that applies are looked through, or all of them if neither mock_name nor path is given.
+        """
+        candidates = []
+
+        if mock_name is not None:
+            candidates.append(self.by_mock.get(mock_name, ()))
+
+        if path is not None:
+            candidates.append(self.by_path.get(path, ()))
+
+        if candidates:
+            ids = min(candidates, key=len)
+        else:
+            ids = sorted(self.records)
+
+        out = []
+
+        for record_id in ids:
+            record = self.records[record_id]
+
+            if mock_name is not None and record.mock_name != mock_name:
+                continue
+
+            if path is not None and record.path != path:
+                continue
+
+            if method is not None and record.method != method:
+                continue
+
+            if qs and any(record.qs.get(key) != value for key, value in qs.items()):
+                continue
+
+            if headers and any(record.headers.get(normalize_header_name(key)) != value for key, value in headers.items()):
+                continue
+
+            out.append(record)
+
+            if limit and len(out) == limit:
+                break
+
+        return out
+
+# ################################################################################################################################
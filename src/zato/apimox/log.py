@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2014 Dariusz Suchojad <dsuch at zato.io>
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+# stdlib
+import gzip, logging, os
+from datetime import datetime
+from glob import glob
+from json import dumps
+from logging.handlers import RotatingFileHandler, TimedRotatingFileHandler
+from Queue import Queue
+from shutil import copyfileobj
+from threading import Thread
+from traceback import format_exc
+
+# validate
+from validate import is_boolean
+
+# ################################################################################################################################
+
+logger = logging.getLogger(__name__)
+
+# ################################################################################################################################
+
+# Rotate log files once they reach that many bytes, unless configured otherwise
+DEFAULT_MAX_BYTES = 20000000
+
+# How many rotated log files to keep, unless configured otherwise
+DEFAULT_BACKUP_COUNT = 10
+
+LOG_FORMAT_JSON = 'json'
+LOG_FORMAT_TEXT = 'text'
+
+# ################################################################################################################################
+
+def to_text(value):
+    """ Returns value as unicode, replacing what isn't UTF-8, so that binary data never breaks JSON output.
+    Buffers, e.g. responses shared through an arena, are turned into unicode too, and so are all keys and items
+    of dicts, lists and tuples, e.g. paths or headers of requests logged.
+    """
+    if isinstance(value, dict):
+        return dict((to_text(key), to_text(item)) for key, item in value.items())
+
+    if isinstance(value, (list, tuple)):
+        return [to_text(item) for item in value]
+
+    if isinstance(value, buffer):
+        value = str(value)
+
+    return value.decode('utf-8', 'replace') if isinstance(value, bytes) else value
+
+# ################################################################################################################################
+
+class JSONFormatter(logging.Formatter):
+    """ Formats each record as a single line of JSON. Structured data can be logged along with the message
+    through extra={'data': {...}} in which case it's output as a JSON object rather than text.
+    """
+    def format(self, record):
+        out = {
+            'time': self.formatTime(record, self.datefmt),
+            'level': record.levelname,
+            'name': record.name,
+            'msg': to_text(record.getMessage()),
+        }
+
+        data = getattr(record, 'data', None)
+        if data is not None:
+            out['data'] = to_text(data)
+
+        if record.exc_info:
+            out['exc'] = self.formatException(record.exc_info)
+
+        return dumps(out)
+
+# ################################################################################################################################
+
+class Compressor(Thread):
+    """ Compresses rotated log files with gzip in background and then removes the oldest compressed ones
+    so that no more than backup_count of them are kept.
+    """
+    def __init__(self):
+        super(Compressor, self).__init__(name='apimox-log-compressor')
+        self.daemon = True
+        self.queue = Queue()
+
+    def put(self, path, base_path, backup_count):
+        self.queue.put((path, base_path, backup_count))
+
+    def compress(self, path, base_path, backup_count):
+        with open(path, 'rb') as f_in:
+            f_out = gzip.open(path + '.gz', 'wb')
+            try:
+                copyfileobj(f_in, f_out)
+            finally:
+                f_out.close()
+
+        os.remove(path)
+
+        # Names of rotated files end with timestamps so sorting them puts the oldest ones first
+        if backup_count:
+            for old_path in sorted(glob(base_path + '.*.gz'))[:-backup_count]:
+                os.remove(old_path)
+
+    def run(self):
+        while True:
+            try:
+                self.compress(*self.queue.get())
+            except Exception, e:
+                logger.warn('Could not compress log file, e:`%s`', format_exc(e))
+
+# ################################################################################################################################
+
+class CompressingRotatingFileHandler(RotatingFileHandler):
+    """ Rotates by size like its base class but renames each rotated file with a timestamp suffix
+    and has it compressed in background rather than renaming all backups on each rollover.
+    """
+    def __init__(self, filename, max_bytes, backup_count):
+        RotatingFileHandler.__init__(self, filename, maxBytes=max_bytes, backupCount=backup_count)
+
+    def doRollover(self):
+        if self.stream:
+            self.stream.close()
+            self.stream = None
+
+        rotated = '{}.{}'.format(self.baseFilename, datetime.now().strftime('%Y%m%d-%H%M%S-%f'))
+        os.rename(self.baseFilename, rotated)
+        get_compressor().put(rotated, self.baseFilename, self.backupCount)
+
+        self.stream = self._open()
+
+class CompressingTimedRotatingFileHandler(TimedRotatingFileHandler):
+    """ Rotates at given times like its base class and has each rotated file compressed in background.
+    Old backups are removed by the compressor because the base class only knows of uncompressed ones.
+    """
+    def __init__(self, filename, when, interval, backup_count):
+        TimedRotatingFileHandler.__init__(self, filename, when=when, interval=interval, backupCount=0)
+        self.keep_count = backup_count
+
+    def doRollover(self):
+        before = set(glob(self.baseFilename + '.*'))
+        TimedRotatingFileHandler.doRollover(self)
+
+        for path in set(glob(self.baseFilename + '.*')) - before:
+            if not path.endswith('.gz'):
+                get_compressor().put(path, self.baseFilename, self.keep_count)
+
+# ################################################################################################################################
+
+_compressor = None
+_compressor_pid = None
+
+def get_compressor():
+    """ Returns the one compressor thread all handlers of a process share, starting it the first time it's needed.
+    Threads don't survive fork so a forked process starts a compressor of its own.
+    """
+    global _compressor, _compressor_pid
+
+    pid = os.getpid()
+
+    if pid != _compressor_pid:
+        _compressor = Compressor()
+        _compressor.start()
+        _compressor_pid = pid
+
+    return _compressor
+
+def get_worker_path(path, worker_idx):
+    """ Returns path of the log file of a given worker, e.g. logs/plain_http.worker-1.log for logs/plain_http.log.
+    """
+    base, ext = os.path.splitext(path)
+    return '{}.worker-{}{}'.format(base, worker_idx, ext)
+
+def get_file_handler(path, config):
+    """ Returns a handler for a log file, rotated by time if log_rotate_when is set (e.g. midnight or H,
+    as in TimedRotatingFileHandler, every log_rotate_interval units), by size otherwise.
+    Rotated files are compressed if log_compress is True.
+    """
+    backup_count = int(config.get('log_backup_count', DEFAULT_BACKUP_COUNT))
+    when = config.get('log_rotate_when')
+    compress = is_boolean(config.get('log_compress', False))
+
+    if when:
+        interval = int(config.get('log_rotate_interval', 1))
+        if compress:
+            return CompressingTimedRotatingFileHandler(path, when, interval, backup_count)
+        return TimedRotatingFileHandler(path, when=when, interval=interval, backupCount=backup_count)
+
+    max_bytes = int(config.get('log_max_bytes', DEFAULT_MAX_BYTES))
+    if compress:
+        return CompressingRotatingFileHandler(path, max_bytes, backup_count)
+    return RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count)
+
+def get_formatter(log_format):
+    if log_format == LOG_FORMAT_JSON:
+        return JSONFormatter(datefmt='%Y-%m-%dT%H:%M:%S')
+
+    return logging.Formatter('%(asctime)s %(name)s %(message)s', '%Y-%m-%d %H:%M:%S')
+
+# ################################################################################################################################
@@ -0,0 +1,462 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2014 Dariusz Suchojad <dsuch at zato.io>
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+# stdlib
+import os, re
+from collections import OrderedDict
+from hashlib import sha1
+from json import dumps, JSONDecoder
+from logging import getLogger
+from urlparse import urlparse
+
+# ConfigObj
+from configobj import ConfigObj
+
+# ################################################################################################################################
+
+logger = getLogger(__name__)
+
+# ################################################################################################################################
+
+# How much of a spec to read at a time, more is read if a single value doesn't fit in it
+CHUNK_SIZE = 1024 * 1024
+
+# How deep to follow nested schemas when generating an example out of them
+MAX_SCHEMA_DEPTH = 8
+
+METHODS = ('get', 'put', 'post', 'delete', 'options', 'head', 'patch', 'trace')
+
+# Top-level members of a spec that $ref's may point to, anything else apart from paths is skipped
+REF_MEMBERS = ('components', 'definitions', 'parameters', 'responses')
+
+# Media types to take examples from, in order of preference, and extensions of response files they are saved to
+MEDIA_TYPES = (
+    ('application/json', 'json'),
+    ('application/xml', 'xml'),
+    ('text/xml', 'xml'),
+    ('text/csv', 'csv'),
+    ('text/plain', 'txt'),
+)
+
+SCHEMA_EXAMPLES = {
+    'string': 'string',
+    'integer': 0,
+    'number': 0.0,
+    'boolean': True,
+}
+
+_ws = ' \t\n\r'
+
+# Characters that may continue a number, e.g. 12 of 12.5 or 1.5 of 1.5e-3 - none of them can follow a complete value
+_number_cont = '.eE+-'
+
+_status_range_re = re.compile(r'^[1-5]XX$', re.IGNORECASE)
+_field_name_re = re.compile(r'{([^}]*)}')
+_not_word_re = re.compile(r'\W')
+
+# ################################################################################################################################
+
+class SpecError(Exception):
+    pass
+
+# ################################################################################################################################
+
+class JSONReader(object):
+    """ Reads a JSON document incrementally - members of objects are iterated over one by one
+    and only a single value is ever decoded and kept in memory at a time.
+    """
+    def __init__(self, f, chunk_size=CHUNK_SIZE):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+        self.decoder = JSONDecoder()
+
+    def fill(self):
+        """ Reads more of the document, at least as much as is buffered already, and returns False if there was nothing left.
+        """
+        if self.eof:
+            return False
+
+        data = self.f.read(max(self.chunk_size, len(self.buf) - self.pos))
+        if not data:
+            self.eof = True
+            return False
+
+        self.buf = self.buf[self.pos:] + data
+        self.pos = 0
+
+        return True
+
+    def peek(self):
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _ws:
+                self.pos += 1
+
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+
+            if not self.fill():
+                raise SpecError('Unexpected end of document')
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise SpecError('Expected `{}` instead of `{}` at `{}`'.format(char, self.buf[self.pos], self.buf[self.pos:][:50]))
+        self.pos += 1
+
+    def read_value(self):
+        """ Decodes the next value. A value counts as complete only if something other than the rest of a number
+        follows it, e.g. a comma, because otherwise a number could be cut short at the end of what is buffered.
+        """
+        self.peek()
+
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+            except ValueError:
+                if not self.fill():
+                    raise
+            else:
+                if (end < len(self.buf) and self.buf[end] not in _number_cont) or not self.fill():
+                    self.pos = end
+                    return value
+
+    def iter_object(self):
+        """ Yields keys of an object - each time, the value the key points to must be consumed before getting the next key,
+        either through read_value or through another iter_object if the value is an object itself.
+        """
+        self.expect('{')
+
+        if self.peek() == '}':
+            self.pos += 1
+            return
+
+        while True:
+            key = self.read_value()
+            self.expect(':')
+
+            yield key
+
+            char = self.peek()
+            self.pos += 1
+
+            if char == '}':
+                return
+
+            if char != ',':
+                raise SpecError('Expected `,` or `}}` instead of `{}`'.format(char))
+
+# ################################################################################################################################
+
+def get_url_path(base_path, path):
+    """ Turns an OpenAPI path into a url_path - fields become {names} that parse accepts, i.e. made of word characters only.
+    """
+    return base_path + _field_name_re.sub(lambda match: '{' + (_not_word_re.sub('_', match.group(1)) or 'field') + '}', path)
+
+def get_status(responses):
+    """ Returns the key of the response a mock is made of and the status it's given. Explicit 2xx codes come first,
+    then the 2XX range and default, both of which become 200, and then any other code or range, e.g. 4XX becomes 400.
+    """
+    codes = sorted(code for code in responses if str(code).isdigit())
+
+    success = [code for code in codes if str(code).startswith('2')]
+    if success:
+        return success[0], str(success[0])
+
+    for code in sorted(responses):
+        if str(code).upper() == '2XX':
+            return code, '200'
+
+    if 'default' in responses:
+        return 'default', '200'
+
+    ranges = sorted(code for code in responses if _status_range_re.match(str(code)))
+    if codes or ranges:
+        code = (codes + ranges)[0]
+        return code, str(code)[0] + '00' if code in ranges else str(code)
+
+    return None, None
+
+def get_ext(media_type):
+    for value, ext in MEDIA_TYPES:
+        if media_type.split(';')[0].strip() == value:
+            return ext
+
+    return 'json' if media_type.endswith('+json') else 'txt'
+
+# ################################################################################################################################
+
+class Importer(object):
+    """ Turns operations of an OpenAPI 3 or Swagger 2 spec into mocks. The spec is read twice, first to collect
+    what $ref's may point to and then to go through paths, one at a time, so that each mock is written out
+    as soon as it's generated. Responses are examples from the spec or, if there are none, are generated out of schemas.
+    """
+    def __init__(self, config_dir, spec_path, output, namespace=None, base_path=None):
+        self.config_dir = config_dir
+        self.spec_path = spec_path
+        self.output_path = os.path.join(config_dir, output)
+        self.namespace = namespace
+        self.base_path = base_path
+        self.refs = {}
+
+        # Section names already used, including the one reserved for apimox itself
+        self.names = {'apimox'}
+        self.count = 0
+        self.skipped = 0
+
+    def __repr__(self):
+        return '<{} at {} spec:{} count:{}>'.format(self.__class__.__name__, hex(id(self)), self.spec_path, self.count)
+
+# ################################################################################################################################
+
+    def resolve(self, item, depth=0):
+        """ Returns what a $ref points to, following further $ref's if need be, or item itself if it's not a $ref.
+        """
+        while isinstance(item, dict) and '$ref' in item and depth < MAX_SCHEMA_DEPTH:
+            ref = item['$ref']
+            if not ref.startswith('#/'):
+                return {}
+
+            item = self.refs
+            for elem in ref[2:].split('/'):
+                item = item.get(elem.replace('~1', '/').replace('~0', '~'), {}) if isinstance(item, dict) else {}
+
+            depth += 1
+
+        return item
+
+    def get_schema_example(self, schema, depth=0):
+        schema = self.resolve(schema)
+
+        if not isinstance(schema, dict) or depth > MAX_SCHEMA_DEPTH:
+            return None
+
+        for key in ('example', 'default'):
+            if key in schema:
+                return schema[key]
+
+        if schema.get('enum'):
+            return schema['enum'][0]
+
+        for key in ('allOf', 'oneOf', 'anyOf'):
+            if schema.get(key):
+                if key != 'allOf':
+                    return self.get_schema_example(schema[key][0], depth + 1)
+
+                out = {}
+                for item in schema[key]:
+                    value = self.get_schema_example(item, depth + 1)
+                    if isinstance(value, dict):
+                        out.update(value)
+                return out
+
+        _type = schema.get('type', 'object' if 'properties' in schema else None)
+
+        if _type == 'object':
+            return dict((name, self.get_schema_example(value, depth + 1))
+                for name, value in schema.get('properties', {}).items())
+
+        if _type == 'array':
+            return [self.get_schema_example(schema.get('items', {}), depth + 1)]
+
+        return SCHEMA_EXAMPLES.get(_type)
+
+    def get_example(self, response):
+        """ Returns media type and example of a response, either given explicitly or generated out of its schema.
+        """
+        response = self.resolve(response)
+
+        # OpenAPI 3
+        if 'content' in response:
+            content = response['content'] or {}
+            media_types = [value for value, _ in MEDIA_TYPES if value in content] + sorted(content)
+            if not media_types:
+                return None, None
+
+            media_type = media_types[0]
+            item = content[media_type] or {}
+
+            if 'example' in item:
+                return media_type, item['example']
+
+            if item.get('examples'):
+                example = self.resolve(sorted(item['examples'].items())[0][1])
+                return media_type, example.get('value')
+
+            return media_type, self.get_schema_example(item.get('schema'))
+
+        # Swagger 2
+        examples = response.get('examples') or {}
+        media_types = [value for value, _ in MEDIA_TYPES if value in examples] + sorted(examples)
+        if media_types:
+            return media_types[0], examples[media_types[0]]
+
+        if response.get('schema'):
+            return 'application/json', self.get_schema_example(response['schema'])
+
+        return None, None
+
+# ################################################################################################################################
+
+    def get_name(self, method, path, operation):
+        name = operation.get('operationId') or '{} {}'.format(method.upper(), path)
+        name = name.replace('[', '(').replace(']', ')')
+
+        unique, idx = name, 1
+        while unique in self.names:
+            idx += 1
+            unique = '{} ({})'.format(name, idx)
+
+        self.names.add(unique)
+        return unique
+
+    def save_response(self, media_type, example):
+        """ Saves an example to a response file, named after its contents so the same examples share a file,
+        and returns the file's name.
+        """
+        ext = get_ext(media_type)
+
+        if isinstance(example, basestring):
+            data = example.encode('utf-8') if isinstance(example, unicode) else example
+        else:
+            data = dumps(example, indent=2, sort_keys=True, separators=(',', ': '))
+
+        file_name = 'openapi-{}.{}'.format(sha1(data).hexdigest(), ext)
+        resp_dir = os.path.join(self.config_dir, 'response', ext)
+
+        if not os.path.exists(resp_dir):
+            os.makedirs(resp_dir)
+
+        full_path = os.path.join(resp_dir, file_name)
+        if not os.path.exists(full_path):
+            with open(full_path, 'wb') as f:
+                f.write(data)
+
+        return file_name
+
+    def get_section(self, method, path, path_item, operation):
+        section = OrderedDict()
+        section['url_path'] = get_url_path(self.base_path, path)
+        section['method'] = method.upper()
+
+        if self.namespace:
+            section['namespace'] = self.namespace
+
+        # Path-level parameters apply to all operations unless overridden
+        params = {}
+        for param in (path_item.get('parameters') or []) + (operation.get('parameters') or []):
+            param = self.resolve(param)
+            params[(param.get('in'), param.get('name'))] = param
+
+        for (_in, name), param in sorted(params.items()):
+            if _in == 'query' and param.get('required'):
+                section['qs_{}'.format(name)] = ''
+
+        responses = operation.get('responses') or {}
+        code, status = get_status(responses)
+
+        if code is None:
+            return section
+
+        section['status'] = status
+
+        media_type, example = self.get_example(responses[code])
+        if media_type:
+            section['content_type'] = media_type
+
+            if example is not None:
+                section['response'] = self.save_response(media_type, example)
+
+        return section
+
+# ################################################################################################################################
+
+    def iter_spec(self):
+        """ Yields top-level members of the spec, paths ones being an iterator of (path, path item) pairs.
+        """
+        with open(self.spec_path, 'rb') as f:
+            reader = JSONReader(f)
+
+            for key in reader.iter_object():
+                if key == 'paths':
+                    yield key, ((path, reader.read_value()) for path in reader.iter_object())
+                else:
+                    yield key, reader.read_value()
+
+    def set_up(self):
+        """ Collects what $ref's may point to and the base path all paths are relative to.
+        """
+        for key, value in self.iter_spec():
+            if key == 'paths':
+                for _ in value:
+                    pass
+
+            elif key in REF_MEMBERS:
+                self.refs[key] = value
+
+            elif self.base_path is None:
+                if key == 'basePath':
+                    self.base_path = value
+                elif key == 'servers' and value:
+                    self.base_path = urlparse(value[0].get('url', '')).path
+
+        self.base_path = (self.base_path or '').rstrip('/')
+
+    def run(self):
+        """ Writes out mocks of all operations in the spec and returns the path to the config file they were written to.
+        """
+        if os.path.splitext(self.spec_path)[1].lower() in ('.yaml', '.yml'):
+            raise SpecError('Only JSON specs can be imported, convert `{}` to JSON first'.format(self.spec_path))
+
+        self.set_up()
+
+        with open(self.output_path, 'w') as out:
+            out.write('# Generated by apimox import-openapi from {}\n'.format(os.path.basename(self.spec_path)))
+
+            for key, value in self.iter_spec():
+                if key != 'paths':
+                    continue
+
+                for path, path_item in value:
+                    path_item = self.resolve(path_item)
+
+                    for method in METHODS:
+                        operation = path_item.get(method)
+                        if not isinstance(operation, dict):
+                            continue
+
+                        try:
+                            section = self.get_section(method, path, path_item, operation)
+                        except Exception, e:
+                            self.skipped += 1
+                            logger.warn('Skipped `%s %s`, e:`%s`', method.upper(), path, e)
+                            continue
+
+                        config = ConfigObj()
+                        config[self.get_name(method, path, operation)] = section
+
+                        data = '\n' + '\n'.join(config.write()) + '\n'
+                        out.write(data.encode('utf-8') if isinstance(data, unicode) else data)
+
+                        self.count += 1
+
+        return self.output_path
+
+# ################################################################################################################################
+
+def handle(path, spec_path, output=None, namespace=None, base_path=None):
+    output = output or os.path.splitext(os.path.basename(spec_path))[0] + '.ini'
+    importer = Importer(os.path.join(path, 'http'), spec_path, output, namespace, base_path)
+    importer.run()
+
+    return importer
+
+# ################################################################################################################################
@@ -0,0 +1,292 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2014 Dariusz Suchojad <dsuch at zato.io>
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+# stdlib
+import os
+from errno import ECONNRESET, EPIPE
+from fcntl import flock, LOCK_EX
+from hashlib import sha1
+from httplib import BadStatusLine, HTTPConnection, HTTPException, responses
+from logging import getLogger
+from urlparse import parse_qs, urlparse
+
+# ConfigObj
+from configobj import ConfigObj
+
+# gevent
+from gevent import socket as gsocket
+from gevent.lock import BoundedSemaphore
+from gevent.queue import Empty, LifoQueue
+from gevent.ssl import wrap_socket
+
+# Zato
+from zato.apimox.common import DEFAULT_NAMESPACE
+from zato.apimox.journal import get_headers
+
+# ################################################################################################################################
+
+logger = getLogger(__name__)
+
+# ################################################################################################################################
+
+DEFAULT_POOL_SIZE = 10
+DEFAULT_TIMEOUT = 10
+DEFAULT_RECORD_FILE = 'recorded.ini'
+
+# Headers that are not recorded because they are set by the server each time anyway
+NOT_RECORDED = {'date', 'server', 'content-type'}
+
+# Headers that apply to a single connection only and must not be passed on
+HOP_BY_HOP = {'connection', 'keep-alive', 'proxy-authenticate', 'proxy-authorization', 'te', 'trailers',
+    'transfer-encoding', 'upgrade', 'content-length', 'host'}
+
+# Methods that may be sent again if an upstream server closed the connection before responding to them
+IDEMPOTENT = {'GET', 'HEAD', 'OPTIONS', 'TRACE', 'PUT', 'DELETE'}
+
+# What is returned if a request cannot be forwarded at all
+BAD_GATEWAY = '502 Bad Gateway'
+BAD_GATEWAY_RESPONSE = 'Could not forward request to upstream server\n'
+
+# ################################################################################################################################
+
+def is_closed_by_peer(e):
+    """ Returns True if an exception means the other side closed the connection before sending anything back.
+    """
+    if isinstance(e, BadStatusLine):
+        return not e.line or e.line == "''" or e.line.startswith('No status line received')
+
+    return isinstance(e, gsocket.error) and e.errno in (ECONNRESET, EPIPE)
+
+# ################################################################################################################################
+
+class _HTTPConnection(HTTPConnection):
+    """ A connection that uses gevent sockets, so waiting for upstream servers never blocks other greenlets.
+    """
+    def connect(self):
+        self.sock = gsocket.create_connection((self.host, self.port), self.timeout)
+
+class _HTTPSConnection(_HTTPConnection):
+
+    default_port = 443
+
+    def connect(self):
+        super(_HTTPSConnection, self).connect()
+        self.sock = wrap_socket(self.sock)
+
+# ################################################################################################################################
+
+class ConnectionPool(object):
+    """ Keep-alive connections to an upstream server, at most size of them in use at a time.
+    """
+    def __init__(self, address, size=DEFAULT_POOL_SIZE, timeout=DEFAULT_TIMEOUT):
+        parsed = urlparse(address)
+
+        self.address = address
+        self.host = parsed.hostname
+        self.port = parsed.port
+        self.base_path = parsed.path.rstrip('/')
+        self.conn_class = _HTTPSConnection if parsed.scheme == 'https' else _HTTPConnection
+        self.timeout = timeout
+        self.idle = LifoQueue()
+        self.in_use = BoundedSemaphore(size)
+
+    def __repr__(self):
+        return '<{} at {} address:{} idle:{}>'.format(self.__class__.__name__, hex(id(self)), self.address, self.idle.qsize())
+
+    def _new_conn(self):
+        return self.conn_class(self.host, self.port, timeout=self.timeout)
+
+    def _get_conn(self):
+        """ Returns a connection along with whether it's an idle one from the pool rather than a new one.
+        """
+        try:
+            return self.idle.get_nowait(), True
+        except Empty:
+            return self._new_conn(), False
+
+    def _send(self, conn, method, path, body, headers, is_idle):
+        """ Returns a response and its body or None if an idle connection turned out to have been closed by the upstream
+        server before it responded and the request can be safely sent again. Any other failure is raised.
+        """
+        try:
+            conn.request(method, self.base_path + path, body, headers)
+        except (gsocket.error, HTTPException):
+            conn.close()
+            if is_idle:
+                return None
+            raise
+
+        try:
+            response = conn.getresponse()
+        except (gsocket.error, HTTPException) as e:
+            conn.close()
+
+            # Non-idempotent requests may have been acted upon already
+            if is_idle and method in IDEMPOTENT and is_closed_by_peer(e):
+                return None
+            raise
+
+        try:
+            return response, response.read()
+        except (gsocket.error, HTTPException):
+            conn.close()
+            raise
+
+    def request(self, method, path, body, headers):
+        """ Returns status, headers and body of the upstream server's response. An idle connection that turns out
+        to have been closed by the upstream server in the meantime is retried once with a new one, but only if it's
+        known that the upstream server did not respond, which for non-idempotent methods means it didn't get the request.
+        Raises socket.error or HTTPException if the request cannot be forwarded.
+        """
+        with self.in_use:
+            conn, is_idle = self._get_conn()
+            result = self._send(conn, method, path, body, headers, is_idle)
+
+            if not result:
+                conn = self._new_conn()
+                result = self._send(conn, method, path, body, headers, False)
+
+            response, data = result
+
+            if response.will_close:
+                conn.close()
+            else:
+                self.idle.put(conn)
+
+            return response.status, response.getheaders(), data
+
+# ################################################################################################################################
+
+class Proxy(object):
+    """ Forwards requests no mock matched to an upstream server and, if recording is enabled, turns each response
+    into a new mock - its response is stored under response/<ext>/, its section is added to the record file
+    and the mock is added to the running server too, so it's the mock that serves the same request next time.
+    Include the record file in config.ini to replay the recordings after a restart without proxying.
+    With dedupe, a request already in the record file is not recorded again, otherwise its newest response
+    replaces the one recorded before.
+    """
+    def __init__(self, server, upstream, content_types, pool_size=DEFAULT_POOL_SIZE, timeout=DEFAULT_TIMEOUT,
+            record=True, record_file=DEFAULT_RECORD_FILE, dedupe=True):
+        self.server = server
+        self.pool = ConnectionPool(upstream, pool_size, timeout)
+        self.content_types = content_types
+        self.record = record
+        self.record_path = os.path.join(server.config.dir, record_file)
+        self.dedupe = dedupe
+        self.recorded = set()
+
+    def __repr__(self):
+        return '<{} at {} upstream:{}>'.format(self.__class__.__name__, hex(id(self)), self.pool.address)
+
+    def get_ext(self, content_type):
+        content_type = (content_type or '').split(';')[0].strip()
+        for ext, value in self.content_types.items():
+            if value == content_type:
+                return ext
+
+        return 'txt'
+
+    def forward(self, environ, body, namespace=DEFAULT_NAMESPACE):
+        """ Returns status line, headers and body of the upstream response to a request, or a 502 Bad Gateway one
+        if the upstream server cannot be reached. Recordings become mocks of the namespace the request was in.
+        """
+        headers = dict((key, value) for key, value in get_headers(environ).items() if key.lower() not in HOP_BY_HOP)
+        path = environ['PATH_INFO'] + ('?' + environ['QUERY_STRING'] if environ['QUERY_STRING'] else '')
+
+        try:
+            status, resp_headers, data = self.pool.request(environ['REQUEST_METHOD'], path, body, headers)
+        except (gsocket.error, HTTPException) as e:
+            logger.warn('Could not forward `%s %s` to `%s`, e:`%s`', environ['REQUEST_METHOD'], path, self.pool.address, e)
+            return BAD_GATEWAY, [('Content-Type', 'text/plain')], BAD_GATEWAY_RESPONSE
+
+        resp_headers = [(key.title(), value) for key, value in resp_headers if key.lower() not in HOP_BY_HOP]
+
+        if self.record:
+            self.save(environ, status, resp_headers, data, namespace)
+
+        return '{} {}'.format(status, responses.get(status, '')), resp_headers, data
+
+# ################################################################################################################################
+
+    def save(self, environ, status, resp_headers, data, namespace=DEFAULT_NAMESPACE):
+        content_type = dict(resp_headers).get('Content-Type')
+        method = environ['REQUEST_METHOD']
+        path = environ['PATH_INFO']
+        qs = sorted((key, value[0]) for key, value in parse_qs(environ['QUERY_STRING']).items())
+
+        request_key = sha1(repr((namespace, method, path, qs))).hexdigest()
+        if self.dedupe and request_key in self.recorded:
+            return
+
+        self.recorded.add(request_key)
+
+        # Same bodies always end up in the same file
+        ext = self.get_ext(content_type)
+        file_name = 'recorded-{}.{}'.format(sha1(data).hexdigest(), ext)
+        resp_dir = os.path.join(self.server.config.dir, 'response', ext)
+
+        if not os.path.exists(resp_dir):
+            os.makedirs(resp_dir)
+
+        full_path = os.path.join(resp_dir, file_name)
+        if not os.path.exists(full_path):
+            with open(full_path, 'wb') as f:
+                f.write(data)
+
+        name = 'Recorded {} {} {}'.format(method, path, request_key[:8])
+        section = {
+            'url_path': path.replace('{', '{{').replace('}', '}}'),
+            'method': method,
+            'status': str(status),
+            'response': file_name,
+        }
+
+        if content_type:
+            section['content_type'] = content_type
+
+        if namespace != DEFAULT_NAMESPACE:
+            section['namespace'] = namespace
+
+        for key, value in qs:
+            section['qs_{}'.format(key)] = value
+
+        for key, value in resp_headers:
+            if key.lower() not in NOT_RECORDED:
+                section['resp_header_{}'.format(key)] = value
+
+        if not self.write_section(name, section):
+            return
+
+        # With several workers, each of them gets the new mock, not only the one that recorded it
+        if self.server.cluster:
+            self.server.cluster.update_mocks({name: section})
+        else:
+            self.server.update_mocks({name: section})
+
+        logger.info('Recorded `%s` to `%s`', name, full_path)
+
+    def write_section(self, name, section):
+        """ Adds a section to the record file, or replaces the one of the same name unless dedupe is on, and returns
+        True if it did. The file stays locked while it's read and written so that workers recording at the same time
+        neither overwrite each other's sections nor add the same one twice.
+        """
+        with open(self.record_path, 'a') as lock:
+            flock(lock, LOCK_EX)
+
+            config = ConfigObj(self.record_path, interpolation=False)
+            if self.dedupe and name in config:
+                return False
+
+            config[name] = section
+            config.write()
+
+            return True
+
+# ################################################################################################################################
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2014 Dariusz Suchojad <dsuch at zato.io>
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# Originally part of Zato - open-source ESB, SOA, REST, APIs and cloud integrations in Python
+# https://zato.io
+
+from __future__ import absolute_import, division, print_function
+
+# Zato
+from zato.apimox.zmq_ import ZMQServer
+
+def handle(path, capture_path, server_type='zmq-push', speed=1.0):
+    socket_type = server_type.replace('zmq-', '')
+    ZMQServer(socket_type, path, socket_type).replay(capture_path, speed)
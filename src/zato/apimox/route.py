@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2014 Dariusz Suchojad <dsuch at zato.io>
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+# ################################################################################################################################
+
+# Key of mocks whose url_path has a {field} in its first segment, i.e. they need to be checked for any path
+_ANY = object()
+
+# ################################################################################################################################
+
+def get_path_key(path):
+    """ Returns first segment of a path, lower-cased because parse matches paths case-insensitively.
+    """
+    return path.lstrip('/').split('/', 1)[0].lower()
+
+def get_url_path_key(url_path):
+    key = get_path_key(url_path)
+    return _ANY if '{' in key else key
+
+# ################################################################################################################################
+
+class RouteIndex(object):
+    """ Mocks indexed by method and first segment of their url_path, so that only the ones that can possibly match
+    a request's path are checked in runtime. Mocks can be added and removed one by one without rebuilding the index.
+    """
+    def __init__(self):
+        self.methods = {}
+
+    def __repr__(self):
+        return '<{} at {} methods:{}>'.format(self.__class__.__name__, hex(id(self)), sorted(self.methods))
+
+    def add(self, config):
+        keys = self.methods.setdefault(config.method, {})
+        keys.setdefault(get_url_path_key(config.url_path), []).append(config)
+
+    def remove(self, config):
+        keys = self.methods.get(config.method, {})
+        key = get_url_path_key(config.url_path)
+        configs = keys.get(key, [])
+
+        for idx, item in enumerate(configs):
+            if item is config:
+                del configs[idx]
+                break
+
+        if not configs:
+            keys.pop(key, None)
+
+    def get_candidates(self, method, path):
+        """ Returns all mocks for a method which a path may match.
+        """
+        keys = self.methods.get(method)
+        if not keys:
+            return []
+
+        return keys.get(get_path_key(path), []) + keys.get(_ANY, [])
+
+    def get_neighbours(self, config):
+        """ Returns all mocks which may match the same requests as the given one, itself included.
+        """
+        keys = self.methods.get(config.method, {})
+        key = get_url_path_key(config.url_path)
+
+        if key is _ANY:
+            return [item for configs in keys.values() for item in configs]
+
+        return keys.get(key, []) + keys.get(_ANY, [])
+
+# ################################################################################################################################
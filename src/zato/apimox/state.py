@@ -0,0 +1,312 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2014 Dariusz Suchojad <dsuch at zato.io>
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+# stdlib
+from bisect import bisect_right
+from ctypes import c_long, c_longlong, memset, sizeof
+from hashlib import sha1
+from json import dumps
+from multiprocessing import Lock
+from multiprocessing.sharedctypes import RawArray
+from random import random
+
+# Zato
+from zato.apimox.timing import monotonic
+
+# ################################################################################################################################
+
+# How many state slots, i.e. sequence positions and scenario states, can be kept, unless configured otherwise
+DEFAULT_STATE_SIZE = 65536
+
+SCENARIO_START = 'start'
+
+SEQUENCE_ONCE = 'once'
+SEQUENCE_RANDOM = 'random'
+SEQUENCE_ROUND_ROBIN = 'round-robin'
+
+SEQUENCE_MODES = SEQUENCE_ONCE, SEQUENCE_RANDOM, SEQUENCE_ROUND_ROBIN
+
+# Token buckets keep their tokens in millionths so that they fit in integer slots and refill every microsecond
+TOKEN_SCALE = 1000000
+
+# ################################################################################################################################
+
+def get_key_digest(key):
+    """ Returns a non-zero 63-bit digest of a slot's key, the same in each process and whether names in it are str or unicode.
+    """
+    return int(sha1(dumps(key)).hexdigest()[:16], 16) >> 1 or 1
+
+# ################################################################################################################################
+
+class SharedState(object):
+    """ An array of integers in anonymous shared memory, so that processes forked after it's been created
+    all see the same values. Each sequence position or scenario state is one slot in the array.
+    Updates are done under a lock - greenlets never switch while holding it because nothing in between blocks,
+    while processes are kept away from each other by the lock itself.
+
+    Slots are assigned through a hash table in shared memory too, holding digests of keys, so a key gets the same slot
+    in each process, including when workers add mocks at runtime, each on its own.
+    """
+    def __init__(self, size=DEFAULT_STATE_SIZE):
+        self.size = size
+        self.values = RawArray(c_long, size)
+        self.keys = RawArray(c_longlong, size)
+        self.lock = Lock()
+
+        # Slots this process has looked up already
+        self.slots = {}
+
+    def get_slot(self, key):
+        """ Returns a slot assigned to key, assigning a free one if there isn't any yet.
+        """
+        slot = self.slots.get(key)
+        if slot is not None:
+            return slot
+
+        digest = get_key_digest(key)
+        slot = digest % self.size
+
+        with self.lock:
+            for _ in xrange(self.size):
+                current = self.keys[slot]
+
+                if not current:
+                    self.keys[slot] = digest
+                    break
+
+                if current == digest:
+                    break
+
+                slot = (slot + 1) % self.size
+
+            else:
+                raise ValueError('No free state slots left (size:{}), consider increasing `state_size`'.format(self.size))
+
+        self.slots[key] = slot
+        return slot
+
+    def get(self, slot):
+        return self.values[slot]
+
+    def set(self, slot, value):
+        with self.lock:
+            self.values[slot] = value
+
+    def compare_and_set(self, slot, expected, value):
+        with self.lock:
+            if self.values[slot] != expected:
+                return False
+            self.values[slot] = value
+            return True
+
+    def incr(self, slot, modulo=None, limit=None):
+        """ Increments a slot's value and returns the value from before the increment. With modulo,
+        the value wraps around to 0, with limit, it stops growing once it reaches it.
+        """
+        with self.lock:
+            value = self.values[slot]
+            if limit is None or value < limit:
+                self.values[slot] = (value + 1) % modulo if modulo else value + 1
+            return value
+
+    def decr(self, slot):
+        with self.lock:
+            if self.values[slot] > 0:
+                self.values[slot] -= 1
+
+    def reset(self, slots=None):
+        """ Resets given slots or all of them, including ones assigned by other processes, to 0.
+        """
+        with self.lock:
+            if slots is None:
+                memset(self.values, 0, sizeof(self.values))
+            else:
+                for slot in slots:
+                    self.values[slot] = 0
+
+# ################################################################################################################################
+
+class Sequence(object):
+    """ Picks one of many responses of a mock, either in order (round-robin), in order but only once,
+    with the last response served ever after (once), or randomly (random) according to weights.
+    In the first two modes weights are the number of times each response is repeated before moving on.
+    """
+    def __init__(self, state, name, mode, responses, weights):
+        if mode not in SEQUENCE_MODES:
+            raise ValueError('Unrecognized sequence `{}`, expected one of {}'.format(mode, SEQUENCE_MODES))
+
+        self.state = state
+        self.mode = mode
+        self.responses = responses
+        self.slot = state.get_slot(('sequence', name))
+
+        # Cumulative weights to bisect positions or random numbers with
+        self.bounds = []
+        total = 0
+        for weight in weights:
+            total += weight
+            self.bounds.append(total)
+        self.total = total
+
+    def __repr__(self):
+        return '<{} at {} mode:{} responses:{}>'.format(self.__class__.__name__, hex(id(self)), self.mode, len(self.responses))
+
+    def get_next(self):
+        if self.mode == SEQUENCE_RANDOM:
+            position = random() * self.total
+        elif self.mode == SEQUENCE_ROUND_ROBIN:
+            position = self.state.incr(self.slot, modulo=self.total)
+        else:
+            position = self.state.incr(self.slot, limit=self.total-1)
+
+        return self.responses[bisect_right(self.bounds, position)]
+
+    def reset(self):
+        self.state.reset([self.slot])
+
+# ################################################################################################################################
+
+class Scenario(object):
+    """ A named state machine - mocks can require it to be in a given state to match requests
+    and can move it to another state once they do. Each scenario starts off in the 'start' state.
+    """
+    def __init__(self, state, name):
+        self.state = state
+        self.name = name
+        self.slot = state.get_slot(('scenario', name))
+        self.state_names = [SCENARIO_START]
+        self.state_ids = {SCENARIO_START: 0}
+
+    def __repr__(self):
+        return '<{} at {} name:{} current:{}>'.format(self.__class__.__name__, hex(id(self)), self.name, self.get_current())
+
+    def get_state_id(self, state_name):
+        state_id = self.state_ids.get(state_name)
+        if state_id is None:
+            state_id = self.state_ids[state_name] = len(self.state_names)
+            self.state_names.append(state_name)
+
+        return state_id
+
+    def get_current(self):
+        return self.state_names[self.state.get(self.slot)]
+
+    def is_in(self, state_id):
+        return self.state.get(self.slot) == state_id
+
+    def move(self, from_id, to_id):
+        """ Moves the scenario to another state, but only if it's still in from_id, unless that is None.
+        """
+        if from_id is None:
+            self.state.set(self.slot, to_id)
+            return True
+
+        return self.state.compare_and_set(self.slot, from_id, to_id)
+
+    def reset(self):
+        self.state.reset([self.slot])
+
+# ################################################################################################################################
+
+class TokenBucket(object):
+    """ Lets through up to rate requests a second on average and up to burst of them at once. It takes two slots,
+    the number of tokens and when they were last refilled, and tokens are refilled on each request rather than
+    by a timer, so taking one is O(1) whatever the rate. A bucket whose slots are reset starts off full again.
+    """
+    def __init__(self, state, name, rate, burst=None):
+        self.state = state
+        self.rate = rate
+        self.burst = burst or max(1, int(rate))
+        self.tokens_slot = state.get_slot(('bucket-tokens', name))
+        self.time_slot = state.get_slot(('bucket-time', name))
+
+    def __repr__(self):
+        return '<{} at {} rate:{} burst:{}>'.format(self.__class__.__name__, hex(id(self)), self.rate, self.burst)
+
+    def take(self):
+        """ Takes a token and returns 0 or, if there are none left, returns in how many seconds there will be one.
+        """
+        now = int(monotonic() * 1e6)
+        capacity = self.burst * TOKEN_SCALE
+        values = self.state.values
+
+        with self.state.lock:
+            last = values[self.time_slot]
+            tokens = capacity if not last else min(capacity, values[self.tokens_slot] + int((now - last) * self.rate))
+            values[self.time_slot] = now
+
+            if tokens >= TOKEN_SCALE:
+                values[self.tokens_slot] = tokens - TOKEN_SCALE
+                return 0
+
+            values[self.tokens_slot] = tokens
+            return (TOKEN_SCALE - tokens) / self.rate / 1e6
+
+    def reset(self):
+        self.state.reset([self.tokens_slot, self.time_slot])
+
+# ################################################################################################################################
+
+class ConcurrencyLimit(object):
+    """ Lets through up to max_in_flight requests at a time, counted in a single slot. Each request let through
+    must be released once it's been responded to.
+    """
+    def __init__(self, state, name, max_in_flight):
+        self.state = state
+        self.max_in_flight = max_in_flight
+        self.slot = state.get_slot(('in-flight', name))
+
+    def __repr__(self):
+        return '<{} at {} max:{} current:{}>'.format(
+            self.__class__.__name__, hex(id(self)), self.max_in_flight, self.state.get(self.slot))
+
+    def acquire(self):
+        return self.state.incr(self.slot, limit=self.max_in_flight) < self.max_in_flight
+
+    def release(self):
+        self.state.decr(self.slot)
+
+    def reset(self):
+        self.state.reset([self.slot])
+
+# ################################################################################################################################
+
+class Limits(object):
+    """ A rate limit and a concurrency cap, either of which is optional, of a single mock or of all of them.
+    """
+    def __init__(self, bucket=None, in_flight=None, status=None, retry_after=None):
+        self.bucket = bucket
+        self.in_flight = in_flight
+        self.status = status
+        self.retry_after = retry_after
+
+    def __repr__(self):
+        return '<{} at {} bucket:{} in_flight:{}>'.format(self.__class__.__name__, hex(id(self)), self.bucket, self.in_flight)
+
+    def acquire(self):
+        """ Returns None if a request is let through or in how many seconds to retry it otherwise.
+        Unless configured explicitly, that's when the next token will be available or 1 second if it's
+        the concurrency cap that was reached. A request let through must be released afterwards.
+        """
+        if self.bucket:
+            wait = self.bucket.take()
+            if wait:
+                return self.retry_after or wait
+
+        if self.in_flight and not self.in_flight.acquire():
+            return self.retry_after or 1
+
+        return None
+
+    def release(self):
+        if self.in_flight:
+            self.in_flight.release()
+
+# ################################################################################################################################
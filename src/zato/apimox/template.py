@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2014 Dariusz Suchojad <dsuch at zato.io>
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+# stdlib
+import re
+from datetime import datetime
+from itertools import count
+from time import time
+from uuid import uuid4
+
+# ################################################################################################################################
+
+_slot_re = re.compile(r'\{\{\s*([a-zA-Z_][a-zA-Z0-9_\-]*)(?:\.([^}\s]+))?\s*\}\}')
+
+# ################################################################################################################################
+
+def _get_path(name):
+    def _slot(match):
+        return match.path_params.get(name, '')
+    return _slot
+
+def _get_qs(name):
+    def _slot(match):
+        return match.wsgi_environ_qs.get(name, '')
+    return _slot
+
+def _get_header(name):
+    key = 'HTTP_{}'.format(name.upper().replace('-', '_'))
+    if key in ('HTTP_CONTENT_TYPE', 'HTTP_CONTENT_LENGTH'):
+        key = key.replace('HTTP_', '', 1)
+
+    def _slot(match):
+        return match.wsgi_environ.get(key, '')
+    return _slot
+
+def _get_uuid(match):
+    return uuid4().hex
+
+def _get_now(match):
+    return datetime.utcnow().isoformat()
+
+def _get_timestamp(match):
+    return int(time())
+
+# Slots that need a name, e.g. {{path.user_id}}
+_named_slots = {
+    'path': _get_path,
+    'qs': _get_qs,
+    'header': _get_header,
+}
+
+# Slots that don't, e.g. {{uuid}}
+_plain_slots = {
+    'uuid': _get_uuid,
+    'now': _get_now,
+    'timestamp': _get_timestamp,
+}
+
+# ################################################################################################################################
+
+class Template(object):
+    """ A response with {{slots}} compiled once into a list of literal chunks and slot callables,
+    so that rendering it is only a matter of calling the latter and joining the results.
+
+    Supported slots are:
+
+    {{path.name}}      - a {name} captured from url_path
+    {{qs.name}}        - a query string parameter
+    {{header.name}}    - a request header, e.g. {{header.X-Request-ID}}
+    {{counter}}        - how many times this template has been rendered so far, starting from 1
+    {{uuid}}           - a random UUID4 in hex
+    {{now}}            - current UTC time in ISO 8601
+    {{timestamp}}      - current UNIX time in seconds
+
+    The counter is this process's own unless the template is bound to a slot in SharedState,
+    in which case renders by all workers are counted together.
+    """
+    def __init__(self, source):
+        self.source = source
+        self.counter = count(1)
+        self.state = None
+        self.slot = None
+        self.chunks = []
+        self.compile()
+
+    def __repr__(self):
+        return '<{} at {} chunks:{}>'.format(self.__class__.__name__, hex(id(self)), len(self.chunks))
+
+    def bind(self, state, key):
+        """ Has the counter kept in a SharedState slot assigned to key.
+        """
+        self.state = state
+        self.slot = state.get_slot(key)
+
+    def reset(self):
+        if self.state:
+            self.state.reset([self.slot])
+        else:
+            self.counter = count(1)
+
+    def _get_counter(self, match):
+        if self.state:
+            return self.state.incr(self.slot) + 1
+        return next(self.counter)
+
+    def get_slot(self, slot, name):
+        if slot in _named_slots:
+            if not name:
+                raise ValueError('Slot `{}` requires a name, e.g. `{{{{{}.my_name}}}}`'.format(slot, slot))
+            return _named_slots[slot](name)
+
+        if name:
+            raise ValueError('Slot `{}` does not take a name, found `{}`'.format(slot, name))
+
+        if slot == 'counter':
+            return self._get_counter
+
+        if slot in _plain_slots:
+            return _plain_slots[slot]
+
+        raise ValueError('Unrecognized slot `{}`'.format(slot))
+
+    def compile(self):
+        """ Turns the source into a list of literal strings and callables - text between two slots
+        is a single literal and empty ones are skipped, so no two literals are ever adjacent.
+        """
+        pos = 0
+
+        for match in _slot_re.finditer(self.source):
+            literal = self.source[pos:match.start()]
+            if literal:
+                self.chunks.append(literal)
+
+            self.chunks.append(self.get_slot(*match.groups()))
+            pos = match.end()
+
+        literal = self.source[pos:]
+        if literal:
+            self.chunks.append(literal)
+
+    def render(self, match):
+        """ Returns the template rendered for a RequestMatch.
+        """
+        out = []
+        append = out.append
+
+        for chunk in self.chunks:
+            if callable(chunk):
+                append('{}'.format(chunk(match)))
+            else:
+                append(chunk)
+
+        return ''.join(out)
+
+# ################################################################################################################################
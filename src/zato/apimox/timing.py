@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2014 Dariusz Suchojad <dsuch at zato.io>
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+# stdlib
+import ctypes, ctypes.util, os
+from bisect import bisect_left
+from cProfile import Profile
+from cStringIO import StringIO
+from datetime import datetime
+from logging import getLogger
+from pstats import Stats
+from time import time
+
+# gevent
+from gevent import spawn_later
+
+# ################################################################################################################################
+
+logger = getLogger(__name__)
+
+# ################################################################################################################################
+
+# Upper bounds of histogram buckets, in microseconds, anything slower ends up in the last, unbounded, one
+BUCKETS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 25000, 50000, 100000, 250000, 500000, 1000000)
+
+# Percentiles reported for each phase
+PERCENTILES = (50, 90, 99)
+
+# How long a profiling session lasts, unless requested otherwise, and the most it can last, in seconds
+DEFAULT_PROFILE_SECONDS = 10
+MAX_PROFILE_SECONDS = 600
+
+# How many of the most expensive functions are logged once a profiling session ends
+PROFILE_LOG_TOP = 30
+
+# ################################################################################################################################
+
+class _timespec(ctypes.Structure):
+    _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+_CLOCK_MONOTONIC = 1
+
+def _get_monotonic():
+    """ Returns a function reading the monotonic clock through clock_gettime or, if there is no such function
+    in the C library, time.time which is not monotonic but is all there is.
+    """
+    try:
+        clock_gettime = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True).clock_gettime
+    except (OSError, AttributeError):
+        return time
+
+    clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(_timespec)]
+
+    def monotonic():
+        t = _timespec()
+        if clock_gettime(_CLOCK_MONOTONIC, ctypes.byref(t)):
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        return t.tv_sec + t.tv_nsec * 1e-9
+
+    return monotonic
+
+monotonic = _get_monotonic()
+
+# ################################################################################################################################
+
+class Histogram(object):
+    """ Durations of a phase, counted in fixed buckets so that recording one takes the same time and memory
+    however many there were. Percentiles are therefore upper bounds of buckets they fall into.
+    """
+    def __init__(self):
+        self.reset()
+
+    def __repr__(self):
+        return '<{} at {} count:{}>'.format(self.__class__.__name__, hex(id(self)), self.count)
+
+    def reset(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def add(self, usec):
+        self.counts[bisect_left(BUCKETS, usec)] += 1
+        self.count += 1
+        self.total += usec
+        if usec > self.max:
+            self.max = usec
+
+    def update(self, data):
+        """ Adds durations from what to_dict of another histogram returned, e.g. one of another worker.
+        """
+        for key, count in data['buckets'].items():
+            self.counts[BUCKETS.index(int(key[3:])) if key != 'inf' else -1] += count
+
+        self.count += data['count']
+        self.total += data['mean_usec'] * data['count']
+        self.max = max(self.max, data['max_usec'])
+
+    def get_percentile(self, percentile):
+        needed = self.count * percentile / 100
+        seen = 0
+
+        for idx, count in enumerate(self.counts):
+            seen += count
+            if seen >= needed:
+                return BUCKETS[idx] if idx < len(BUCKETS) else self.max
+
+    def to_dict(self):
+        out = {
+            'count': self.count,
+            'mean_usec': round(self.total / self.count, 1) if self.count else 0,
+            'max_usec': round(self.max, 1),
+            'buckets': dict(('le_{}'.format(bound), count) for bound, count in zip(BUCKETS, self.counts) if count),
+        }
+
+        if self.counts[-1]:
+            out['buckets']['inf'] = self.counts[-1]
+
+        for percentile in PERCENTILES:
+            out['p{}_usec'.format(percentile)] = self.get_percentile(percentile) if self.count else 0
+
+        return out
+
+# ################################################################################################################################
+
+class Timer(object):
+    """ Times consecutive phases of a single request - each mark records time elapsed since the previous one.
+    Time spent in a phase nested in another, e.g. scoring each candidate during matching, is summed up separately.
+    """
+    __slots__ = ('timings', 'phases', 'nested', 'start', 'last')
+
+    def __init__(self, timings):
+        self.timings = timings
+        self.phases = []
+        self.nested = {}
+        self.start = self.last = monotonic()
+
+    def mark(self, phase):
+        now = monotonic()
+        self.phases.append((phase, (now - self.last) * 1e6))
+        self.last = now
+
+    def add(self, phase, start):
+        self.nested[phase] = self.nested.get(phase, 0) + (monotonic() - start) * 1e6
+
+    def finish(self):
+        self.phases.extend(self.nested.items())
+        self.phases.append(('total', (monotonic() - self.start) * 1e6))
+        self.timings.add(self.phases)
+
+    def close(self):
+        """ Called once a response has been written out.
+        """
+        self.mark('write')
+        self.finish()
+
+# ################################################################################################################################
+
+class Timings(object):
+    """ Histograms of how long each phase of handling requests takes, optionally also logging each request's phases.
+    """
+    def __init__(self, trace=False):
+        self.trace = trace
+        self.phases = {}
+
+    def __repr__(self):
+        return '<{} at {} phases:{}>'.format(self.__class__.__name__, hex(id(self)), sorted(self.phases))
+
+    def get_timer(self):
+        return Timer(self)
+
+    def add(self, phases):
+        for phase, usec in phases:
+            histogram = self.phases.get(phase)
+            if not histogram:
+                histogram = self.phases[phase] = Histogram()
+            histogram.add(usec)
+
+        if self.trace:
+            logger.info('Timings %s', ' '.join('{}={:.1f}'.format(phase, usec) for phase, usec in phases),
+                extra={'data': dict(phases)})
+
+    def reset(self):
+        self.phases.clear()
+
+    def update(self, phases):
+        """ Adds durations from what to_dict of other timings returned, e.g. ones of another worker.
+        """
+        for phase, data in phases.items():
+            histogram = self.phases.get(phase)
+            if not histogram:
+                histogram = self.phases[phase] = Histogram()
+            histogram.update(data)
+
+    def to_dict(self):
+        return dict((phase, histogram.to_dict()) for phase, histogram in self.phases.items())
+
+# ################################################################################################################################
+
+class ProfileSession(object):
+    """ Profiles everything the process does, all greenlets included, for a number of seconds and then saves
+    the stats as a pstats file in a given directory as well as logs the most expensive functions.
+    Names of the files include PIDs so that workers profiled at the same time never overwrite each other's stats.
+    """
+    def __init__(self, dir):
+        self.dir = dir
+        self.profile = None
+        self.path = None
+
+    def __repr__(self):
+        return '<{} at {} running:{}>'.format(self.__class__.__name__, hex(id(self)), self.is_running())
+
+    def is_running(self):
+        return self.profile is not None
+
+    def start(self, seconds=DEFAULT_PROFILE_SECONDS):
+        """ Starts a session, unless one is already running, and returns the path its stats will be saved to.
+        """
+        if self.is_running():
+            raise ValueError('A profiling session is already running, stats will be saved to `{}`'.format(self.path))
+
+        if not 0 < seconds <= MAX_PROFILE_SECONDS:
+            raise ValueError('Seconds must be greater than 0 and at most {}'.format(MAX_PROFILE_SECONDS))
+
+        self.path = os.path.join(self.dir, 'profile-{}-{}.pstats'.format(datetime.now().strftime('%Y%m%d-%H%M%S'), os.getpid()))
+        self.profile = Profile()
+        self.profile.enable()
+
+        spawn_later(seconds, self.stop)
+
+        logger.info('Profiling for %ss, stats will be saved to `%s`', seconds, self.path)
+
+        return self.path
+
+    def stop(self):
+        self.profile.disable()
+
+        try:
+            self.profile.dump_stats(self.path)
+
+            out = StringIO()
+            Stats(self.profile, stream=out).sort_stats('cumulative').print_stats(PROFILE_LOG_TOP)
+            logger.info('Profiling stats saved to `%s`\n%s', self.path, out.getvalue())
+
+        finally:
+            self.profile = None
+
+# ################################################################################################################################
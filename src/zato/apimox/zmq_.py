@@ -9,13 +9,24 @@ Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
 from __future__ import absolute_import, division, print_function
 
 # stdlib
+import os, re
+from itertools import cycle
 from logging import getLogger
+from Queue import Queue
+from signal import SIGTERM, signal
+from threading import Thread
+from time import sleep, time
 
 # ZeroMQ
 import zmq
 
+# Validate
+from validate import is_boolean
+
 # Zato
-from zato.apimox.common import BaseServer
+from zato.apimox.capture import CaptureWriter, DEFAULT_FSYNC_INTERVAL, read_capture
+from zato.apimox.common import BaseServer, JSON_XML
+from zato.apimox.template import Template
 
 # ################################################################################################################################
 
@@ -23,6 +34,158 @@ logger = getLogger(__name__)
 
 # ################################################################################################################################
 
+# How many batches can wait for the writer before the receiving loop blocks
+WRITER_QUEUE_SIZE = 1000
+
+# How long to wait for messages before checking if statistics are due, in milliseconds
+POLL_TIMEOUT = 1000
+
+# How often to log receive statistics, in seconds, unless configured otherwise
+DEFAULT_STATS_INTERVAL = 10
+
+DEFAULT_NO_MATCH_RESPONSE = 'No matching mock found'
+
+MATCH_EXACT = 'exact'
+MATCH_PREFIX = 'prefix'
+MATCH_REGEX = 'regex'
+
+MATCH_TYPES = MATCH_EXACT, MATCH_PREFIX, MATCH_REGEX
+
+# Socket types that reply to each message received
+REPLY_SOCKET_TYPES = 'rep', 'router'
+
+# Socket types that send messages on their own
+SEND_SOCKET_TYPES = 'pub', 'push'
+
+# ################################################################################################################################
+
+class AsyncWriter(Thread):
+    """ Logs batches of messages in a background thread so that receiving them never waits for I/O.
+    A batch is a list of (message, timestamp) pairs, each message being a list of frames, either bytes or zmq.Frame objects,
+    and each timestamp being when the message was received. Messages are also written to a capture file if there is one.
+    """
+    def __init__(self, queue_size=WRITER_QUEUE_SIZE, capture=None):
+        super(AsyncWriter, self).__init__(name='apimox-zmq-writer')
+        self.daemon = True
+        self.queue = Queue(queue_size)
+        self.capture = capture
+
+    def put(self, batch):
+        self.queue.put(batch)
+
+    def write(self, batch):
+        lines = []
+        for msg, timestamp in batch:
+            msg = [frame if isinstance(frame, bytes) else frame.bytes for frame in msg]
+            lines.extend(msg)
+
+            if self.capture:
+                self.capture.write(msg, timestamp)
+
+        logger.info('\n'.join(lines))
+
+    def run(self):
+        while True:
+            batch = self.queue.get()
+            if batch is None:
+                return
+            self.write(batch)
+
+    def close(self):
+        """ Writes out all batches queued so far and closes the capture file, if there is one.
+        """
+        self.queue.put(None)
+        self.join()
+
+        if self.capture:
+            self.capture.close()
+
+# ################################################################################################################################
+
+class Stats(object):
+    """ Counts messages and batches received or sent and logs a summary every interval seconds.
+    """
+    def __init__(self, interval=DEFAULT_STATS_INTERVAL, action='Received'):
+        self.interval = interval
+        self.action = action
+        self.reset(time())
+
+    def reset(self, now):
+        self.start = now
+        self.msgs = 0
+        self.batches = 0
+        self.max_batch = 0
+
+    def add(self, batch_size):
+        self.msgs += batch_size
+        self.batches += 1
+        if batch_size > self.max_batch:
+            self.max_batch = batch_size
+
+    def log_if_due(self):
+        now = time()
+        elapsed = now - self.start
+
+        if elapsed < self.interval:
+            return
+
+        if self.batches:
+            logger.info('%s %d msgs in %.1fs (%.1f msgs/s), batches: %d, avg batch: %.1f, max batch: %d',
+                self.action, self.msgs, elapsed, self.msgs / elapsed, self.batches, self.msgs / self.batches, self.max_batch)
+
+        self.reset(now)
+
+# ################################################################################################################################
+
+class RuleMatch(object):
+    """ A message that matched a rule - it has the same attributes templates use for HTTP requests,
+    with path_params being named groups of a regex rule.
+    """
+    def __init__(self, rule, msg, path_params=None):
+        self.rule = rule
+        self.msg = msg
+        self.path_params = path_params or {}
+        self.wsgi_environ = {}
+        self.wsgi_environ_qs = {}
+
+    def get_response(self):
+        return self.rule.template.render(self) if self.rule.template else self.rule.response
+
+class Rules(object):
+    """ Finds a reply to a message by its first frame - exact matches are checked first, then prefixes,
+    longest first, and then regular expressions in the order of their sections' names.
+    """
+    def __init__(self):
+        self.exact = {}
+        self.prefix = []
+        self.regex = []
+
+    def add(self, config):
+        if config.match_type == MATCH_EXACT:
+            self.exact[config.match] = config
+        elif config.match_type == MATCH_PREFIX:
+            self.prefix.append(config)
+            self.prefix.sort(key=lambda config: len(config.match), reverse=True)
+        else:
+            config.match_compiled = re.compile(config.match)
+            self.regex.append(config)
+
+    def get_match(self, msg):
+        config = self.exact.get(msg)
+        if config:
+            return RuleMatch(config, msg)
+
+        for config in self.prefix:
+            if msg.startswith(config.match):
+                return RuleMatch(config, msg)
+
+        for config in self.regex:
+            match = config.match_compiled.match(msg)
+            if match:
+                return RuleMatch(config, msg, match.groupdict())
+
+# ################################################################################################################################
+
 class ZMQServer(BaseServer):
 
     SERVER_TYPE = 'zmq'
@@ -30,10 +193,84 @@ class ZMQServer(BaseServer):
     def __init__(self, log_type, config_dir, socket_type):
         super(ZMQServer, self).__init__(log_type, config_dir)
         self.socket_type = socket_type
+        self.rules = Rules()
+        self.set_up()
 
-    def run(self):
-        config = self.config.mocks_config.apimox
+    def set_up(self):
+        """ Compiles all mocks. Sections with a match are rules to compare first frame of messages against,
+        with the response to send in reply, optionally a template. Same as in HTTP mocks, a response is given inline
+        if it's JSON or XML, otherwise it's the name of a file under response/<ext>/ it's read from.
+        Sections with a message, given in the same way as responses, are what PUB and PUSH sockets send.
+        """
+        self.messages = []
+
+        for name, config in sorted(self.config.mocks_config.items()):
+
+            # Ignore our own config
+            if name == 'apimox':
+                continue
+
+            config.name = name
+
+            if config.get('message'):
+                self.set_up_message(config)
+
+            if not config.get('match'):
+                continue
+
+            config.match_type = config.get('match_type', MATCH_EXACT)
+
+            if config.match_type not in MATCH_TYPES:
+                raise ValueError('Unrecognized match_type `{}` in `{}`, expected one of {}'.format(
+                    config.match_type, name, MATCH_TYPES))
+
+            config.response = config.get('response', '')
+            if config.response and config.response[0] not in JSON_XML:
+                _, _, config.response = self.get_file(config, config.response, '(Response not found)')
+
+            config.template = Template(config.response) if is_boolean(config.get('template', False)) else None
+            self.rules.add(config)
+
+            logger.info('`{}`: {} `{}`'.format(name, config.match_type, config.match))
+
+    def set_up_message(self, config):
+        """ Precomputes frames of a message to send, its optional topic (or the default one from [apimox]) included,
+        unless the message is a template - in which case it's a callable rendering the template into frames.
+        """
+        message = config.message
+        if message[0] not in JSON_XML:
+            _, _, message = self.get_file(config, message, '(Message not found)')
+
+        topic = config.get('topic', self.config.mocks_config.apimox.get('topic'))
+        prefix = [topic] if topic else []
+
+        if is_boolean(config.get('template', False)):
+            match = RuleMatch(config, None)
+            render = Template(message).render
+            self.messages.append(lambda: prefix + [render(match)])
+        else:
+            self.messages.append(prefix + [message])
+
+    def set_socket_options(self, socket, config):
+        """ Sets high-water marks and kernel buffer sizes, if any is configured.
+        """
+        for name in ('rcvhwm', 'rcvbuf', 'sndhwm', 'sndbuf'):
+            value = config.get(name)
+            if value:
+                socket.setsockopt(getattr(zmq, name.upper()), int(value))
+
+    def get_capture(self, config):
+        """ Returns a writer of the capture file messages received are to be written to, if capture is enabled.
+        """
+        if not is_boolean(config.get('capture', False)):
+            return None
+
+        path = os.path.join(self.config.dir, config.get('capture_file', os.path.join('logs', '{}.capture'.format(self.log_type))))
+        logger.info('Capturing messages to `%s`', path)
 
+        return CaptureWriter(path, float(config.get('capture_fsync_interval', DEFAULT_FSYNC_INTERVAL)))
+
+    def get_socket(self, config):
         address = 'tcp://{}:{}'.format(config.host, getattr(config, '{}_port'.format(self.socket_type)))
         context = zmq.Context()
         socket = context.socket(getattr(zmq, self.socket_type.upper()))
@@ -44,10 +281,214 @@ class ZMQServer(BaseServer):
         else:
             prefix_msg = ''
 
+        self.set_socket_options(socket, config)
         socket.bind(address)
 
         logger.info('ZMQ %s %slistening on %s', self.socket_type.upper(), prefix_msg, address)
 
+        return socket
+
+    def on_sigterm(self, signum, frame):
+        # Exiting through an exception lets capture files be closed, with all messages received written out
+        raise SystemExit('Received SIGTERM')
+
+    def run(self):
+        config = self.config.mocks_config.apimox
+        socket = self.get_socket(config)
+
+        batch_size = int(config.get('batch_size', 0))
+
+        signal(SIGTERM, self.on_sigterm)
+
+        if self.socket_type in REPLY_SOCKET_TYPES:
+            self.serve_replies(socket, config)
+        elif self.socket_type in SEND_SOCKET_TYPES:
+            self.send_messages(socket, config)
+        elif batch_size > 1:
+            self.recv_batches(socket, config, batch_size)
+        else:
+            self.recv_messages(socket, config)
+
+    def recv_messages(self, socket, config):
+        """ Logs each message as soon as it's received.
+        """
+        capture = self.get_capture(config)
+
+        try:
+            while True:
+                msg = socket.recv_multipart()
+
+                for frame in msg:
+                    logger.info(frame)
+
+                if capture:
+                    capture.write(msg)
+        finally:
+            if capture:
+                capture.close()
+
+    def recv_batches(self, socket, config, batch_size):
+        """ Waits for messages to arrive and then drains the socket without blocking, up to batch_size messages,
+        handing each batch over to a background writer.
+        """
+        copy = not is_boolean(config.get('zero_copy', False))
+        stats = Stats(int(config.get('stats_interval', DEFAULT_STATS_INTERVAL)))
+
+        writer = AsyncWriter(capture=self.get_capture(config))
+        writer.start()
+
+        poller = zmq.Poller()
+        poller.register(socket, zmq.POLLIN)
+
+        recv_multipart = socket.recv_multipart
+        noblock = zmq.NOBLOCK
+
+        try:
+            while True:
+                if poller.poll(POLL_TIMEOUT):
+                    batch = []
+                    append = batch.append
+
+                    while len(batch) < batch_size:
+                        try:
+                            append((recv_multipart(noblock, copy=copy), time()))
+                        except zmq.Again:
+                            break
+
+                    if batch:
+                        stats.add(len(batch))
+                        writer.put(batch)
+
+                stats.log_if_due()
+        finally:
+            writer.close()
+
+# ################################################################################################################################
+
+    def get_reply(self, msg, no_match_response):
+        match = self.rules.get_match(msg)
+
+        if match:
+            name = match.rule.name
+            response = match.get_response()
+        else:
+            name = None
+            response = no_match_response
+
+        logger.info('Mock `{}`, request `{}`, response `{}`'.format(name, msg, response))
+
+        return response
+
+    def serve_replies(self, socket, config):
+        """ Replies to each message received. A ROUTER socket gets messages from any number of clients, each prefixed
+        with its envelope, i.e. the client's identity and, for REQ clients, an empty delimiter frame. The same
+        envelope is sent back in front of the reply which is all that's needed to reply to many clients
+        concurrently in this one loop. The delimiter is part of the envelope only if it's the frame right after
+        the identity - empty frames further on, e.g. in what DEALER clients send, belong to the message.
+        """
+        no_match_response = config.get('no_match_response', DEFAULT_NO_MATCH_RESPONSE)
+        is_router = self.socket_type == 'router'
+
         while True:
-            msg = socket.recv()
-            logger.info(msg)
+            frames = socket.recv_multipart()
+
+            if is_router:
+                idx = 2 if len(frames) > 1 and frames[1] == b'' else 1
+                envelope, frames = frames[:idx], frames[idx:]
+            else:
+                envelope = []
+
+            socket.send_multipart(envelope + [self.get_reply(frames[0] if frames else b'', no_match_response)])
+
+# ################################################################################################################################
+
+    def send_messages(self, socket, config):
+        """ Sends messages, cycling through all of them, in bursts of burst messages at a given rate of messages
+        per second (or as fast as possible if rate is 0) until count messages are sent or duration seconds elapse,
+        whichever comes first, or forever if neither is set.
+        """
+        if not self.messages:
+            raise ValueError('No messages to send, add a section with `message` to config.ini')
+
+        rate = float(config.get('rate', 0))
+        burst = int(config.get('burst', 1))
+        total = int(config.get('count', 0))
+        duration = float(config.get('duration', 0))
+        copy = not is_boolean(config.get('zero_copy', False))
+
+        stats = Stats(int(config.get('stats_interval', DEFAULT_STATS_INTERVAL)), 'Sent')
+        messages = cycle(self.messages)
+        send_multipart = socket.send_multipart
+
+        # Time between bursts - each one is scheduled relative to the start so that delays don't accumulate
+        interval = burst / rate if rate else 0
+
+        # Give subscribers a chance to connect, otherwise PUB would drop the first messages
+        if self.socket_type == 'pub':
+            sleep(float(config.get('pub_delay', 1)))
+
+        # Duration is counted from when sending starts, i.e. without the delay above
+        start = next_burst = time()
+        end = start + duration if duration else None
+        sent = 0
+
+        while not total or sent < total:
+
+            if end and time() >= end:
+                break
+
+            size = min(burst, total - sent) if total else burst
+
+            for _ in xrange(size):
+                frames = next(messages)
+                send_multipart(frames if isinstance(frames, list) else frames(), copy=copy)
+
+            sent += size
+            stats.add(size)
+            stats.log_if_due()
+
+            if interval:
+                next_burst += interval
+                delay = next_burst - time()
+                if delay > 0:
+                    sleep(delay)
+
+        elapsed = time() - start
+        logger.info('Sent %d msgs in %.2fs, achieved rate: %.1f msgs/s, target rate: %s', sent, elapsed,
+            sent / elapsed if elapsed else 0, '{} msgs/s'.format(rate) if rate else 'unlimited')
+
+# ################################################################################################################################
+
+    def replay(self, capture_path, speed=1.0):
+        """ Sends all messages from a capture file, keeping the original intervals between them divided by speed,
+        or as fast as possible if speed is 0.
+        """
+        config = self.config.mocks_config.apimox
+        socket = self.get_socket(config)
+
+        if self.socket_type == 'pub':
+            sleep(float(config.get('pub_delay', 1)))
+
+        send_multipart = socket.send_multipart
+        start = time()
+        first_timestamp = None
+        sent = 0
+
+        for timestamp, frames in read_capture(capture_path):
+
+            if speed:
+                if first_timestamp is None:
+                    first_timestamp = timestamp
+
+                delay = (timestamp - first_timestamp) / speed - (time() - start)
+                if delay > 0:
+                    sleep(delay)
+
+            send_multipart(frames)
+            sent += 1
+
+        elapsed = time() - start
+        logger.info('Replayed %d msgs from `%s` in %.2fs (%.1f msgs/s)', sent, capture_path, elapsed,
+            sent / elapsed if elapsed else 0)
+
+# ################################################################################################################################
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2014 Dariusz Suchojad <dsuch at zato.io>
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+# stdlib
+import logging, os
+from cStringIO import StringIO
+from shutil import rmtree
+from tempfile import mkdtemp
+from unittest import TestCase
+
+# ConfigObj
+from configobj import ConfigObj
+
+# ################################################################################################################################
+
+class ServerTestCase(TestCase):
+    """ Creates servers out of mocks given in tests, each in a config directory of its own which is removed afterwards.
+    """
+    def setUp(self):
+        self.dir = mkdtemp(prefix='apimox-test-')
+        self.logger = logging.getLogger('zato')
+        self.handlers = self.logger.handlers[:]
+
+    def tearDown(self):
+        for handler in self.logger.handlers[:]:
+            if handler not in self.handlers:
+                self.logger.removeHandler(handler)
+                handler.close()
+
+        rmtree(self.dir)
+
+    def write_config(self, server_type, mocks, **apimox):
+        """ Writes config.ini with mocks, given as (name, section) pairs, and [apimox] with any keys given on input.
+        """
+        server_dir = os.path.join(self.dir, server_type)
+        logs_dir = os.path.join(server_dir, 'logs')
+
+        if not os.path.exists(logs_dir):
+            os.makedirs(logs_dir)
+
+        config = ConfigObj()
+        config['apimox'] = dict({
+            'host': '127.0.0.1',
+            'http_plain_port': '0',
+            'log_level': 'ERROR',
+            'log_file_plain': 'plain_http.log',
+            'log_file_pull': 'pull_zmq.log',
+        }, **apimox)
+
+        for name, section in mocks:
+            config[name] = section
+
+        with open(os.path.join(server_dir, 'config.ini'), 'w') as f:
+            f.write('\n'.join(config.write()))
+
+    def write_response(self, server_type, name, data):
+        resp_dir = os.path.join(self.dir, server_type, 'response', name.split('.')[-1])
+
+        if not os.path.exists(resp_dir):
+            os.makedirs(resp_dir)
+
+        with open(os.path.join(resp_dir, name), 'w') as f:
+            f.write(data)
+
+    def get_http_server(self, mocks, **apimox):
+        # Imported here so that tests of modules that don't need gevent don't import it
+        from zato.apimox.http import HTTPServer
+
+        self.write_config('http', mocks, **apimox)
+        return HTTPServer(log_type='plain', config_dir=self.dir)
+
+    def call(self, server, path, qs='', method='GET', body='', headers=None):
+        """ Sends a request to a server's WSGI app and returns status, headers and body of the response.
+        """
+        environ = {
+            'REQUEST_METHOD': method,
+            'PATH_INFO': path,
+            'QUERY_STRING': qs,
+            'SERVER_PROTOCOL': 'HTTP/1.1',
+            'wsgi.input': StringIO(body),
+        }
+
+        for key, value in (headers or {}).items():
+            environ['HTTP_{}'.format(key.upper().replace('-', '_'))] = value
+
+        response = {}
+
+        def start_response(status, headers):
+            response['status'] = status
+            response['headers'] = headers
+
+        result = server.on_request(environ, start_response)
+        data = b''.join(str(chunk) for chunk in result)
+
+        if hasattr(result, 'close'):
+            result.close()
+
+        return response['status'], dict(response['headers']), data
+
+# ################################################################################################################################
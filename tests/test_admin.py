@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2014 Dariusz Suchojad <dsuch at zato.io>
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+# stdlib
+from json import dumps, loads
+
+# Tests
+from tests.base import ServerTestCase
+
+# ################################################################################################################################
+
+class UpdateMocksTestCase(ServerTestCase):
+
+    def setUp(self):
+        super(UpdateMocksTestCase, self).setUp()
+        self.server = self.get_http_server([('A', {'url_path': '/a', 'response': '{"a": 1}'})])
+
+    def admin(self, method, path, data=None, qs=''):
+        status, _, body = self.call(self.server, '/__apimox' + path, qs, method, dumps(data) if data is not None else '')
+        return int(status.split()[0]), loads(body)
+
+    def test_upsert_and_delete(self):
+        status, data = self.admin('POST', '/mocks', {'upsert': {'B': {'url_path': '/b', 'response': {'b': 1}}}})
+
+        self.assertEqual(status, 200)
+        self.assertEqual(data, {'upserted': 1, 'deleted': 0})
+        self.assertEqual(self.call(self.server, '/b')[2], '{"b": 1}')
+
+        # Replacing a mock serves the new response straightaway
+        self.admin('POST', '/mocks', {'upsert': {'B': {'url_path': '/b', 'response': {'b': 2}}}})
+        self.assertEqual(self.call(self.server, '/b')[2], '{"b": 2}')
+
+        status, data = self.admin('DELETE', '/mocks', qs='name=B')
+        self.assertEqual(data, {'deleted': 1})
+        self.assertTrue(self.call(self.server, '/b')[0].startswith('412'))
+
+        self.assertEqual(self.admin('GET', '/mocks')[1], {'mocks': ['A']})
+
+    def test_upsert_ini(self):
+        status, _, body = self.call(self.server, '/__apimox/mocks', method='POST', body='[C]\nurl_path=/c\nresponse=\'{"c": 1}\'\n')
+
+        self.assertTrue(status.startswith('200'))
+        self.assertEqual(self.call(self.server, '/c')[2], '{"c": 1}')
+
+    def test_upsert_non_ascii(self):
+        response = u'{"name": "Zażółć"}'
+        status, _ = self.admin('POST', '/mocks', {'upsert': {u'Gęś': {'url_path': '/d', 'response': response}}})
+        self.assertEqual(status, 200)
+
+        status, _, data = self.call(self.server, '/d')
+        self.assertEqual(status, '200 OK')
+        self.assertEqual(data, response.encode('utf-8'))
+
+        self.assertEqual(self.admin('GET', '/mocks')[1], {'mocks': ['A', u'Gęś']})
+        self.assertEqual(self.admin('DELETE', '/mocks', qs='name=G%C4%99%C5%9B')[1], {'deleted': 1})
+
+    def test_rejected_batch_has_no_side_effects(self):
+        slots = dict(self.server.state.slots)
+        keys = list(self.server.state.keys)
+
+        status, data = self.admin('POST', '/mocks', {'upsert': {
+            'B': {'url_path': '/b', 'response_1': '{"n": 1}', 'response_2': '{"n": 2}', 'rate_limit': '10',
+                'scenario': 'order', 'scenario_state': 'paid'},
+            'C': {'url_path': '/c', 'limit_status': '500', 'max_in_flight': '1'},
+        }})
+
+        self.assertEqual(status, 400)
+        self.assertIn('limit_status', data['error'])
+
+        self.assertEqual(self.server.state.slots, slots)
+        self.assertEqual(list(self.server.state.keys), keys)
+        self.assertEqual(self.server.scenarios, {})
+        self.assertEqual(sorted(config.name for config in self.server.get_mocks()), ['A'])
+
+    def test_reserved_name(self):
+        status, data = self.admin('POST', '/mocks', {'upsert': {'apimox': {'url_path': '/x'}}})
+        self.assertEqual(status, 400)
+
+    def test_unknown_endpoint(self):
+        self.assertEqual(self.admin('GET', '/no-such-endpoint')[0], 404)
+
+# ################################################################################################################################
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2014 Dariusz Suchojad <dsuch at zato.io>
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+# stdlib
+from unittest import TestCase
+
+# Zato
+from zato.apimox.ambiguity import get_buckets, paths_disjoint
+
+# Tests
+from tests.base import ServerTestCase
+
+# ################################################################################################################################
+
+class PathsDisjointTestCase(TestCase):
+
+    def test_literal_paths(self):
+        self.assertTrue(paths_disjoint('/a', '/b'))
+        self.assertFalse(paths_disjoint('/a', '/a'))
+        self.assertFalse(paths_disjoint('/a', '/A'))
+
+    def test_paths_with_fields(self):
+        self.assertTrue(paths_disjoint('/a/{x}', '/b/{y}'))
+        self.assertTrue(paths_disjoint('/a/{x}/c', '/a/{y}/d'))
+        self.assertFalse(paths_disjoint('/a/{x}', '/a/b'))
+        self.assertFalse(paths_disjoint('/{x}/c', '/a/{y}'))
+
+# ################################################################################################################################
+
+class AnalyzeTestCase(ServerTestCase):
+
+    def test_same_path_and_qs_conflict(self):
+        server = self.get_http_server([
+            ('A', {'url_path': '/a', 'qs_x': '1'}),
+            ('B', {'url_path': '/a', 'qs_x': '1'}),
+        ])
+
+        self.assertEqual(len(server.conflicts), 1)
+
+        conflict = server.conflicts[0]
+        self.assertEqual((conflict.name1, conflict.name2), ('A', 'B'))
+        self.assertTrue(conflict.get_example().startswith('GET /a'))
+
+    def test_different_qs_values_conflict_without_qs(self):
+        server = self.get_http_server([
+            ('A', {'url_path': '/a', 'qs_x': '1'}),
+            ('B', {'url_path': '/a', 'qs_x': '2'}),
+        ])
+
+        # A request without x is equally far from both
+        self.assertEqual(len(server.conflicts), 1)
+        self.assertEqual(server.conflicts[0].get_example(), 'GET /a')
+
+    def test_disjoint_paths_are_unambiguous(self):
+        server = self.get_http_server([
+            ('A', {'url_path': '/a/{id}'}),
+            ('B', {'url_path': '/b', 'qs_x': '1'}),
+        ])
+
+        self.assertEqual(server.conflicts, [])
+
+        for config in server.get_mocks():
+            self.assertTrue(config.is_unambiguous)
+
+    def test_field_overlapping_literal_conflicts(self):
+        server = self.get_http_server([
+            ('A', {'url_path': '/a/{id}'}),
+            ('B', {'url_path': '/a/b'}),
+        ])
+
+        self.assertEqual(len(server.conflicts), 1)
+        self.assertEqual(server.conflicts[0].get_example(), 'GET /a/b')
+
+    def test_tie_won_by_another_mock_is_not_a_conflict(self):
+        server = self.get_http_server([
+            ('A', {'url_path': '/a', 'qs_x': ''}),
+            ('B', {'url_path': '/a', 'qs_y': ''}),
+            ('C', {'url_path': '/a'}),
+        ])
+
+        # A and B tie only if both x and y are sent or neither is - C wins when neither is,
+        # but when both are, A and B score the same and nothing beats them.
+        self.assertEqual([(conflict.name1, conflict.name2) for conflict in server.conflicts], [('A', 'B')])
+
+    def test_different_methods_no_conflict(self):
+        server = self.get_http_server([
+            ('A', {'url_path': '/a'}),
+            ('B', {'url_path': '/a', 'method': 'POST'}),
+        ])
+
+        self.assertEqual(server.conflicts, [])
+
+    def test_different_namespaces_no_conflict(self):
+        server = self.get_http_server([
+            ('A', {'url_path': '/a'}),
+            ('B', {'url_path': '/a', 'namespace': 'billing'}),
+        ])
+
+        self.assertEqual(server.conflicts, [])
+
+    def test_exclusive_scenario_states_no_conflict(self):
+        server = self.get_http_server([
+            ('A', {'url_path': '/a', 'scenario': 'order', 'scenario_state': 'start'}),
+            ('B', {'url_path': '/a', 'scenario': 'order', 'scenario_state': 'paid'}),
+        ])
+
+        self.assertEqual(server.conflicts, [])
+
+# ################################################################################################################################
+
+class GetBucketsTestCase(ServerTestCase):
+
+    def test_mocks_that_may_match_the_same_path_share_a_bucket(self):
+        server = self.get_http_server([
+            ('A', {'url_path': '/a/{id}'}),
+            ('B', {'url_path': '/a/b/c'}),
+            ('C', {'url_path': '/c'}),
+            ('D', {'url_path': '/{anything}'}),
+            ('E', {'url_path': '/a', 'method': 'POST'}),
+        ])
+
+        buckets = [sorted(config.name for config in bucket) for bucket in get_buckets(server.get_mocks())]
+
+        # Everything starting with / may match what /{anything} does, apart from the POST one
+        self.assertEqual(sorted(buckets), [['A', 'B', 'C', 'D'], ['E']])
+
+# ################################################################################################################################
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2014 Dariusz Suchojad <dsuch at zato.io>
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+# stdlib
+from unittest import TestCase
+
+# Zato
+from zato.apimox.arena import Arena
+
+# Tests
+from tests.base import ServerTestCase
+
+# ################################################################################################################################
+
+class ArenaTestCase(TestCase):
+
+    def test_add_get(self):
+        arena = Arena()
+
+        first = arena.add(b'abc')
+        second = arena.add(b'de')
+
+        # Identical bodies are stored once
+        self.assertEqual(arena.add(b'abc'), first)
+        self.assertEqual((first, second), ((0, 3), (3, 2)))
+
+        arena.seal()
+
+        self.assertIsInstance(arena.get(*first), buffer)
+        self.assertEqual(str(arena.get(*first)), b'abc')
+        self.assertEqual(str(arena.get(*second)), b'de')
+
+    def test_sealed(self):
+        arena = Arena()
+        arena.seal()
+
+        self.assertRaises(ValueError, arena.add, b'abc')
+
+# ################################################################################################################################
+
+class ServerArenaTestCase(ServerTestCase):
+
+    def test_responses_shared(self):
+        server = self.get_http_server([
+            ('A', {'url_path': '/a', 'response': '{"a": 1}'}),
+            ('B', {'url_path': '/b', 'response': '{"a": 1}'}),
+            ('Template', {'url_path': '/t/{name}', 'response': '{"name": "{{path.name}}"}', 'template': 'True'}),
+        ], response_arena='True')
+
+        self.assertEqual(server.arena.size, len('{"a": 1}'))
+        self.assertEqual(self.call(server, '/a')[2], '{"a": 1}')
+        self.assertEqual(self.call(server, '/b')[2], '{"a": 1}')
+        self.assertEqual(self.call(server, '/t/x')[2], '{"name": "x"}')
+
+        # Mocks added later keep their responses as they are
+        server.update_mocks({'C': {'url_path': '/c', 'response': '{"c": 1}'}})
+        self.assertEqual(self.call(server, '/c')[2], '{"c": 1}')
+
+# ################################################################################################################################
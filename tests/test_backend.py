@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2014 Dariusz Suchojad <dsuch at zato.io>
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+# stdlib
+import logging, sys
+from unittest import TestCase
+
+# gevent
+from gevent import socket
+
+# Zato
+from zato.apimox.backend import PyWSGIBackend, StreamBackend
+
+# ################################################################################################################################
+
+def app(environ, start_response):
+    if environ['PATH_INFO'] == '/error':
+        raise Exception('Test error')
+
+    body = environ['wsgi.input'].read()
+    start_response('200 OK', [('Content-Type', 'text/plain')])
+
+    qs = environ['QUERY_STRING']
+    return ['{} {}{} {}'.format(environ['REQUEST_METHOD'], environ['PATH_INFO'], '?' + qs if qs else '', body)]
+
+# ################################################################################################################################
+
+class BackendTestCase(TestCase):
+    """ Sends requests to the app as served by a backend, over a connection of their own.
+    """
+    backend_class = StreamBackend
+
+    def setUp(self):
+        self.backend = self.backend_class(app, ('127.0.0.1', 0), {}, False)
+        self.backend.start()
+        self.sock = socket.create_connection(('127.0.0.1', self.backend.server.server_port))
+        self.rfile = self.sock.makefile('rb', -1)
+
+        # Errors of the app are logged but there's no need to see them
+        self.logger = logging.getLogger('zato.apimox.backend')
+        self.disabled = self.logger.disabled
+        self.logger.disabled = True
+
+    def tearDown(self):
+        self.logger.disabled = self.disabled
+        self.rfile.close()
+        self.sock.close()
+        self.backend.server.stop()
+
+    def get_response(self):
+        """ Returns status line, headers and body of the next response on the connection.
+        """
+        status = self.rfile.readline().strip()
+        headers = {}
+
+        while True:
+            line = self.rfile.readline()
+            if not line.strip():
+                break
+
+            name, _, value = line.partition(':')
+            headers[name.lower()] = value.strip()
+
+        return status, headers, self.rfile.read(int(headers['content-length']))
+
+    def test_path_decoded(self):
+        self.sock.sendall('GET /users/John%20Doe?name=John%20Doe HTTP/1.1\r\nHost: x\r\n\r\n')
+        self.assertEqual(self.get_response()[::2], ('HTTP/1.1 200 OK', 'GET /users/John Doe?name=John%20Doe '))
+
+# ################################################################################################################################
+
+class PyWSGIBackendTestCase(BackendTestCase):
+    """ Same requests as under the stream backend, all of which must be handled the same way.
+    """
+    backend_class = PyWSGIBackend
+
+    def test_access_log(self):
+        self.assertIs(PyWSGIBackend(app, ('127.0.0.1', 0), {}).server.log, sys.stderr)
+        self.assertIsNot(self.backend.server.log, sys.stderr)
+
+# ################################################################################################################################
+
+class StreamBackendTestCase(BackendTestCase):
+
+    def test_keep_alive(self):
+        self.sock.sendall('GET /a HTTP/1.1\r\nHost: x\r\n\r\nPOST /b HTTP/1.1\r\nContent-Length: 3\r\n\r\nabc')
+
+        self.assertEqual(self.get_response()[::2], ('HTTP/1.1 200 OK', 'GET /a '))
+        self.assertEqual(self.get_response()[::2], ('HTTP/1.1 200 OK', 'POST /b abc'))
+
+    def test_chunked(self):
+        self.sock.sendall('POST /a HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n2\r\nab\r\n1;x=y\r\nc\r\n0\r\n\r\n')
+        self.assertEqual(self.get_response()[2], 'POST /a abc')
+
+    def test_connection_close(self):
+        self.sock.sendall('GET /a HTTP/1.1\r\nConnection: close\r\n\r\n')
+
+        status, headers, _ = self.get_response()
+        self.assertEqual(headers['connection'], 'close')
+        self.assertEqual(self.rfile.read(), '')
+
+    def test_bad_request(self):
+        self.sock.sendall('GET\r\n\r\n')
+
+        status, headers, _ = self.get_response()
+        self.assertEqual(status, 'HTTP/1.1 400 Bad Request')
+        self.assertEqual(headers['connection'], 'close')
+
+    def test_negative_content_length(self):
+        self.sock.sendall('POST /a HTTP/1.1\r\nContent-Length: -1\r\n\r\nabc')
+        self.assertEqual(self.get_response()[0], 'HTTP/1.1 400 Bad Request')
+
+    def test_app_error(self):
+        self.sock.sendall('GET /error HTTP/1.1\r\n\r\n')
+
+        status, headers, data = self.get_response()
+        self.assertEqual(status, 'HTTP/1.1 500 Internal Server Error')
+        self.assertEqual(headers['connection'], 'close')
+        self.assertEqual(data, 'Internal Server Error\n')
+        self.assertEqual(self.rfile.read(), '')
+
+# ################################################################################################################################
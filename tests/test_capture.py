@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2014 Dariusz Suchojad <dsuch at zato.io>
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+# stdlib
+import os
+from shutil import rmtree
+from tempfile import mkdtemp
+from unittest import TestCase
+
+# Zato
+from zato.apimox.capture import CaptureError, CaptureWriter, read_capture
+from zato.apimox.zmq_ import AsyncWriter
+
+# ################################################################################################################################
+
+class CaptureTestCase(TestCase):
+
+    def setUp(self):
+        self.dir = mkdtemp()
+        self.path = os.path.join(self.dir, 'test.capture')
+
+    def tearDown(self):
+        rmtree(self.dir)
+
+    def test_round_trip(self):
+        writer = CaptureWriter(self.path, 60)
+        writer.write([b'a', b'bc'], 1.5)
+        writer.write([b''], 2.5)
+        writer.close()
+
+        self.assertEqual(list(read_capture(self.path)), [(1.5, [b'a', b'bc']), (2.5, [b''])])
+
+    def test_append(self):
+        for timestamp in (1.0, 2.0):
+            writer = CaptureWriter(self.path, 60)
+            writer.write([b'a'], timestamp)
+            writer.close()
+
+        self.assertEqual(list(read_capture(self.path)), [(1.0, [b'a']), (2.0, [b'a'])])
+
+    def test_truncated_tail(self):
+        writer = CaptureWriter(self.path, 60)
+        writer.write([b'abc'], 1.0)
+        writer.write([b'def'], 2.0)
+        writer.close()
+
+        with open(self.path, 'r+b') as f:
+            f.truncate(os.path.getsize(self.path) - 1)
+
+        self.assertEqual(list(read_capture(self.path)), [(1.0, [b'abc'])])
+
+    def test_sync_after_close(self):
+        writer = CaptureWriter(self.path, 60)
+        writer.write([b'a'], 1.0)
+        writer.close()
+
+        # Same as what the syncer does if it was waiting for the lock while the file was being closed
+        writer.sync()
+        writer.close()
+
+        self.assertEqual(list(read_capture(self.path)), [(1.0, [b'a'])])
+
+    def test_not_a_capture(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'abc')
+
+        self.assertRaises(CaptureError, list, read_capture(self.path))
+
+    def test_async_writer_close(self):
+        writer = AsyncWriter(capture=CaptureWriter(self.path, 60))
+        writer.start()
+        writer.put([([b'a'], 1.0), ([b'b'], 2.0)])
+        writer.close()
+
+        self.assertTrue(writer.capture.file.closed)
+        self.assertEqual(list(read_capture(self.path)), [(1.0, [b'a']), (2.0, [b'b'])])
+
+# ################################################################################################################################
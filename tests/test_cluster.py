@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2014 Dariusz Suchojad <dsuch at zato.io>
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+# stdlib
+import os, socket, sys
+from json import dumps, loads
+from signal import SIGKILL, SIGTERM
+from subprocess import PIPE, Popen
+from time import sleep, time
+from unittest import TestCase
+from urllib2 import HTTPError, Request, urlopen
+
+# Zato
+from zato.apimox.cluster import merge_count, merge_journal, merge_profile, merge_timings
+from zato.apimox.timing import Histogram
+
+# Tests
+from tests.base import ServerTestCase
+
+# ################################################################################################################################
+
+# How long to wait for processes to start or stop, in seconds
+WAIT_TIMEOUT = 10
+
+RUN_SERVER = 'import sys; from zato.apimox.http import HTTPServer; HTTPServer(log_type="plain", config_dir=sys.argv[1]).run()'
+
+# ################################################################################################################################
+
+def wait_until(func):
+    until = time() + WAIT_TIMEOUT
+
+    while time() < until:
+        result = func()
+        if result:
+            return result
+        sleep(0.1)
+
+    raise Exception('Timed out waiting for {}'.format(func))
+
+def get_children(pid):
+    """ Returns PIDs of all running processes whose parent is pid.
+    """
+    out = []
+
+    for name in os.listdir('/proc'):
+        if name.isdigit():
+            try:
+                with open('/proc/{}/stat'.format(name)) as f:
+                    fields = f.read().rsplit(')', 1)[1].split()
+            except IOError:
+                continue
+
+            if int(fields[1]) == pid and fields[0] != 'Z':
+                out.append(int(name))
+
+    return sorted(out)
+
+# ################################################################################################################################
+
+class MergeTestCase(TestCase):
+
+    def test_journal(self):
+        results = [
+            (1, {'requests': [{'id': 0, 'timestamp': 1.0}, {'id': 1, 'timestamp': 3.0}]}),
+            (2, {'requests': [{'id': 0, 'timestamp': 2.0}]}),
+        ]
+
+        out = merge_journal(results, {'limit': '2'})
+        self.assertEqual(out['count'], 2)
+        self.assertEqual([(record['worker'], record['id']) for record in out['requests']], [(1, 0), (2, 0)])
+
+    def test_count(self):
+        self.assertEqual(merge_count([(1, {'count': 2}), (2, {'count': 3})], {}), {'count': 5})
+
+    def test_timings(self):
+        first, second = Histogram(), Histogram()
+
+        for usec in (5, 20):
+            first.add(usec)
+        second.add(3000000)
+
+        out = merge_timings([(1, {'phases': {'total': first.to_dict()}}), (2, {'phases': {'total': second.to_dict()}})], {})
+        total = out['phases']['total']
+
+        self.assertEqual(total['count'], 3)
+        self.assertEqual(total['max_usec'], 3000000)
+        self.assertEqual(total['buckets'], {'le_10': 1, 'le_25': 1, 'inf': 1})
+
+    def test_profile(self):
+        out = merge_profile([(1, {'seconds': 5, 'path': 'b'}), (2, {'seconds': 5, 'path': 'a'})], {})
+        self.assertEqual(out, {'seconds': 5, 'paths': ['a', 'b']})
+
+# ################################################################################################################################
+
+class ImportTestCase(TestCase):
+
+    def test_http_without_cluster(self):
+
+        # Servers with one worker don't import anything forking needs
+        code = 'import sys, zato.apimox.http; sys.exit("zato.apimox.cluster" in sys.modules)'
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+
+        self.assertEqual(Popen([sys.executable, '-c', code], env=env).wait(), 0)
+
+# ################################################################################################################################
+
+class ClusterTestCase(ServerTestCase):
+    """ Runs a server with two workers in a process of its own.
+    """
+    def setUp(self):
+        super(ClusterTestCase, self).setUp()
+
+        sock = socket.socket()
+        sock.bind(('127.0.0.1', 0))
+        self.port = sock.getsockname()[1]
+        sock.close()
+
+        self.write_config('http', [
+            ('Sequence', {'url_path': '/seq', 'response_1': '{"n": 1}', 'response_2': '{"n": 2}', 'response_3': '{"n": 3}'}),
+            ('Counter', {'url_path': '/counter', 'response': '{"n": {{counter}}}', 'template': 'True'}),
+        ], http_plain_port=str(self.port), workers='2', access_log='False')
+
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+        self.process = Popen([sys.executable, '-c', RUN_SERVER, self.dir], env=env, stdout=PIPE, stderr=PIPE)
+
+        self.workers = wait_until(lambda: len(get_children(self.process.pid)) == 2 and get_children(self.process.pid))
+        wait_until(self.is_listening)
+
+    def tearDown(self):
+        if self.process.poll() is None:
+            self.process.kill()
+            self.process.wait()
+
+        for pid in self.workers:
+            try:
+                os.kill(pid, SIGKILL)
+            except OSError:
+                pass
+
+        self.process.stdout.close()
+        self.process.stderr.close()
+
+        super(ClusterTestCase, self).tearDown()
+
+    def is_listening(self):
+        try:
+            socket.create_connection(('127.0.0.1', self.port)).close()
+        except socket.error:
+            return False
+        else:
+            return True
+
+    def request(self, path, data=None, method=None):
+        """ Returns status code and body of a response, each request being sent over a new connection,
+        so each of them may be handled by another worker.
+        """
+        request = Request('http://127.0.0.1:{}{}'.format(self.port, path), data)
+        if method:
+            request.get_method = lambda: method
+
+        try:
+            response = urlopen(request)
+        except HTTPError, e:
+            response = e
+
+        try:
+            return response.code, response.read()
+        finally:
+            response.close()
+
+    def test_cluster(self):
+
+        # Sequence positions and counters are shared by workers
+        self.assertEqual([loads(self.request('/seq')[1])['n'] for _ in xrange(6)], [1, 2, 3, 1, 2, 3])
+        self.assertEqual([loads(self.request('/counter')[1])['n'] for _ in xrange(6)], [1, 2, 3, 4, 5, 6])
+
+        # Changes get to all workers
+        upsert = {'upsert': {'New': {'url_path': '/new', 'response': '{"new": 1}', 'rate_limit': '0.001', 'rate_burst': '3'}}}
+        self.assertEqual(self.request('/__apimox/mocks', dumps(upsert))[0], 200)
+
+        # Limits are shared by workers too
+        self.assertEqual([self.request('/new')[0] for _ in xrange(5)], [200, 200, 200, 429, 429])
+
+        # Journals of all workers are queried
+        self.assertEqual(loads(self.request('/__apimox/journal/count')[1])['count'], 17)
+
+        # A worker that exits is restarted and has all the changes
+        os.kill(self.workers[0], SIGKILL)
+        self.workers = wait_until(lambda: self.workers[0] not in get_children(self.process.pid) and \
+            len(get_children(self.process.pid)) == 2 and get_children(self.process.pid))
+
+        self.request('/__apimox/state/reset', '')
+        self.assertEqual([self.request('/new')[0] for _ in xrange(5)], [200, 200, 200, 429, 429])
+
+        self.assertEqual(self.request('/__apimox/mocks?name=New', method='DELETE')[0], 200)
+        self.assertEqual([self.request('/new')[0] for _ in xrange(4)], [412] * 4)
+
+        # Stopping the parent stops all workers
+        self.process.send_signal(SIGTERM)
+        wait_until(lambda: self.process.poll() is not None)
+        self.assertEqual(self.process.returncode, 0)
+        self.assertFalse([pid for pid in self.workers if os.path.exists('/proc/{}'.format(pid))])
+
+# ################################################################################################################################
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2014 Dariusz Suchojad <dsuch at zato.io>
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+# stdlib
+from hashlib import sha1
+from unittest import TestCase
+
+# Zato
+from zato.apimox.journal import get_headers, Journal, normalize_header_name
+
+# ################################################################################################################################
+
+class JournalTestCase(TestCase):
+
+    def setUp(self):
+        self.journal = Journal(3)
+        self.journal.add('A', 'GET', '/a', {'x': '1'}, {'X-Id': '1'}, '')
+        self.journal.add('A', 'POST', '/a', {}, {}, 'body')
+        self.journal.add('B', 'GET', '/b', {'x': '2'}, {}, '')
+
+    def test_find(self):
+        self.assertEqual(len(self.journal.find()), 3)
+        self.assertEqual([record.id for record in self.journal.find(mock_name='A')], [0, 1])
+        self.assertEqual([record.id for record in self.journal.find(mock_name='A', method='POST')], [1])
+        self.assertEqual([record.id for record in self.journal.find(qs={'x': '2'})], [2])
+        self.assertEqual([record.id for record in self.journal.find(headers={'x_id': '1'})], [0])
+        self.assertEqual([record.id for record in self.journal.find(limit=2)], [0, 1])
+        self.assertEqual(self.journal.find(path='/no-such-path'), [])
+
+    def test_oldest_evicted(self):
+        self.journal.add('C', 'GET', '/c', {}, {}, '')
+
+        self.assertEqual([record.id for record in self.journal.find()], [1, 2, 3])
+        self.assertEqual(self.journal.count(mock_name='A'), 1)
+        self.assertEqual(self.journal.count(path='/c'), 1)
+
+    def test_count(self):
+        self.assertEqual(self.journal.count(mock_name='A'), 2)
+        self.assertEqual(self.journal.count(path='/b'), 1)
+        self.assertEqual(self.journal.count(mock_name='A', method='GET'), 1)
+        self.assertEqual(self.journal.count(), 3)
+
+    def test_count_with_empty_criteria_uses_index(self):
+        def find(*args, **kwargs):
+            raise AssertionError('Records should not have been looked through')
+
+        self.journal.find = find
+
+        # This is what the admin API passes on when query string has only mock or path in it
+        self.assertEqual(self.journal.count(mock_name='A', method=None, qs={}, headers={}), 2)
+        self.assertEqual(self.journal.count(path='/b', method=None, qs={}, headers={}), 1)
+
+    def test_clear(self):
+        self.journal.clear()
+        self.assertEqual(self.journal.find(), [])
+
+    def test_disabled(self):
+        journal = Journal(0)
+        journal.add('A', 'GET', '/a', {}, {}, '')
+        self.assertEqual(journal.find(), [])
+
+    def test_record(self):
+        data = self.journal.find(method='POST')[0].to_dict()
+
+        self.assertEqual(data['body_size'], 4)
+        self.assertEqual(data['body_digest'], sha1('body').hexdigest())
+
+# ################################################################################################################################
+
+class HeadersTestCase(TestCase):
+
+    def test_normalize_header_name(self):
+        self.assertEqual(normalize_header_name('x_request_id'), 'X-Request-Id')
+        self.assertEqual(normalize_header_name('X-REQUEST-ID'), 'X-Request-Id')
+
+    def test_get_headers(self):
+        environ = {'HTTP_X_ID': '1', 'CONTENT_TYPE': 'text/plain', 'PATH_INFO': '/a'}
+        self.assertEqual(get_headers(environ), {'X-Id': '1', 'Content-Type': 'text/plain'})
+
+# ################################################################################################################################
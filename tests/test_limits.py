@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2014 Dariusz Suchojad <dsuch at zato.io>
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+# stdlib
+from cStringIO import StringIO
+from unittest import TestCase
+
+# Zato
+from zato.apimox.state import ConcurrencyLimit, Limits, SharedState, TokenBucket
+
+# Tests
+from tests.base import ServerTestCase
+
+# ################################################################################################################################
+
+# Slow enough for no token to be refilled while a test runs
+RATE = 0.001
+
+# ################################################################################################################################
+
+class TokenBucketTestCase(TestCase):
+
+    def test_burst(self):
+        bucket = TokenBucket(SharedState(16), 'test', RATE, 2)
+
+        self.assertEqual(bucket.take(), 0)
+        self.assertEqual(bucket.take(), 0)
+
+        # The next token is in 1 / RATE seconds
+        self.assertAlmostEqual(bucket.take(), 1 / RATE, delta=1)
+
+    def test_default_burst(self):
+        self.assertEqual(TokenBucket(SharedState(16), 'test', 5.5).burst, 5)
+        self.assertEqual(TokenBucket(SharedState(16), 'test', RATE).burst, 1)
+
+    def test_refill(self):
+        bucket = TokenBucket(SharedState(16), 'test', 1000000, 1)
+
+        self.assertEqual(bucket.take(), 0)
+        while bucket.take():
+            pass
+
+    def test_reset(self):
+        bucket = TokenBucket(SharedState(16), 'test', RATE, 1)
+
+        bucket.take()
+        self.assertTrue(bucket.take())
+
+        bucket.reset()
+        self.assertEqual(bucket.take(), 0)
+
+    def test_shared_by_name(self):
+        state = SharedState(16)
+        TokenBucket(state, 'test', RATE, 1).take()
+
+        self.assertTrue(TokenBucket(state, 'test', RATE, 1).take())
+        self.assertEqual(TokenBucket(state, 'other', RATE, 1).take(), 0)
+
+# ################################################################################################################################
+
+class ConcurrencyLimitTestCase(TestCase):
+
+    def test_acquire_release(self):
+        limit = ConcurrencyLimit(SharedState(16), 'test', 2)
+
+        self.assertTrue(limit.acquire())
+        self.assertTrue(limit.acquire())
+        self.assertFalse(limit.acquire())
+
+        limit.release()
+        self.assertTrue(limit.acquire())
+
+    def test_reset(self):
+        limit = ConcurrencyLimit(SharedState(16), 'test', 1)
+        limit.acquire()
+        limit.reset()
+
+        self.assertTrue(limit.acquire())
+
+# ################################################################################################################################
+
+class LimitsTestCase(TestCase):
+
+    def test_retry_after(self):
+        state = SharedState(16)
+
+        limits = Limits(TokenBucket(state, 'bucket', RATE, 1))
+        self.assertIsNone(limits.acquire())
+        self.assertAlmostEqual(limits.acquire(), 1 / RATE, delta=1)
+
+        limits = Limits(in_flight=ConcurrencyLimit(state, 'in-flight', 1), retry_after=5)
+        self.assertIsNone(limits.acquire())
+        self.assertEqual(limits.acquire(), 5)
+
+        limits.release()
+        self.assertIsNone(limits.acquire())
+
+# ################################################################################################################################
+
+class ServerLimitsTestCase(ServerTestCase):
+
+    def start_request(self, server, path):
+        """ Returns status of a response and the response itself, not closed yet, so that the request is still in flight.
+        """
+        environ = {'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': '', 'wsgi.input': StringIO('')}
+        response = {}
+
+        def start_response(status, headers):
+            response['status'] = status
+
+        result = server.on_request(environ, start_response)
+        return response['status'], result
+
+    def test_mock_rate_limit(self):
+        server = self.get_http_server([
+            ('Limited', {'url_path': '/a', 'response': '{}', 'rate_limit': str(RATE), 'rate_burst': '2'}),
+            ('Other', {'url_path': '/b', 'response': '{}'}),
+        ])
+
+        self.assertEqual(self.call(server, '/a')[0], '200 OK')
+        self.assertEqual(self.call(server, '/a')[0], '200 OK')
+
+        status, headers, _ = self.call(server, '/a')
+        self.assertEqual(status, '429 Too Many Requests')
+        self.assertEqual(int(headers['Retry-After']), 1000)
+
+        # Other mocks are not limited
+        self.assertEqual(self.call(server, '/b')[0], '200 OK')
+
+    def test_global_limit(self):
+        server = self.get_http_server([('Test', {'url_path': '/a', 'response': '{}'})],
+            rate_limit=str(RATE), rate_burst='1', limit_status='503', retry_after='7')
+
+        self.assertEqual(self.call(server, '/a')[0], '200 OK')
+
+        status, headers, _ = self.call(server, '/b')
+        self.assertEqual(status, '503 Service Unavailable')
+        self.assertEqual(headers['Retry-After'], '7')
+
+    def test_max_in_flight(self):
+        server = self.get_http_server([('Test', {'url_path': '/a', 'response': '{}', 'max_in_flight': '1'})])
+
+        status, result = self.start_request(server, '/a')
+        self.assertEqual(status, '200 OK')
+        self.assertEqual(self.call(server, '/a')[0], '429 Too Many Requests')
+
+        # Closing the response is when the request stops being in flight
+        result.close()
+        self.assertEqual(self.call(server, '/a')[0], '200 OK')
+
+    def test_invalid_status(self):
+        self.assertRaises(ValueError, self.get_http_server, [], rate_limit='1', limit_status='404')
+
+# ################################################################################################################################
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2014 Dariusz Suchojad <dsuch at zato.io>
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+# stdlib
+import gzip, logging, os
+from glob import glob
+from json import loads
+from shutil import rmtree
+from tempfile import mkdtemp
+from time import sleep
+from unittest import TestCase
+
+# Zato
+from zato.apimox.log import CompressingRotatingFileHandler, get_compressor, get_worker_path
+
+# Tests
+from tests.base import ServerTestCase
+
+# ################################################################################################################################
+
+class CompressingRotatingFileHandlerTestCase(TestCase):
+
+    def setUp(self):
+        self.dir = mkdtemp()
+        self.path = os.path.join(self.dir, 'test.log')
+
+    def tearDown(self):
+        rmtree(self.dir)
+
+    def wait_compressed(self):
+        for _ in xrange(500):
+            if all(path.endswith('.gz') for path in glob(self.path + '.*')):
+                return
+            sleep(0.01)
+
+    def test_rotate(self):
+        handler = CompressingRotatingFileHandler(self.path, 100, 2)
+        handler.setFormatter(logging.Formatter('%(message)s'))
+
+        try:
+            for idx in xrange(10):
+                handler.emit(logging.makeLogRecord({'msg': str(idx) * 60}))
+                self.wait_compressed()
+        finally:
+            handler.close()
+
+        rotated = sorted(glob(self.path + '.*'))
+
+        # Only the newest backups are kept and all of them are compressed
+        self.assertEqual(len(rotated), 2)
+        self.assertTrue(all(path.endswith('.gz') for path in rotated))
+
+        f = gzip.open(rotated[-1])
+        try:
+            self.assertEqual(f.read(), '8' * 60 + '\n')
+        finally:
+            f.close()
+
+        with open(self.path) as f:
+            self.assertEqual(f.read(), '9' * 60 + '\n')
+
+# ################################################################################################################################
+
+class CompressorTestCase(TestCase):
+
+    def test_after_fork(self):
+        compressor = get_compressor()
+        self.assertIs(get_compressor(), compressor)
+
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+
+        if not pid:
+            try:
+                os.close(read_fd)
+                child = get_compressor()
+                os.write(write_fd, b'1' if child is not compressor and child.is_alive() else b'0')
+            finally:
+                os._exit(0)
+
+        os.close(write_fd)
+        os.waitpid(pid, 0)
+
+        self.assertEqual(os.read(read_fd, 1), b'1')
+        os.close(read_fd)
+
+# ################################################################################################################################
+
+class WorkerLoggingTestCase(ServerTestCase):
+
+    def test_worker_path(self):
+        self.assertEqual(get_worker_path('/logs/plain_http.log', 2), '/logs/plain_http.worker-2.log')
+
+    def test_setup_logging(self):
+        server = self.get_http_server([], log_level='INFO')
+        main_handlers = server.log_handlers[:]
+        server.setup_logging(1)
+
+        # Only the file is of interest, not stderr
+        server.log_handlers[1].setLevel(logging.ERROR)
+        logging.getLogger('zato.test').info('abc')
+
+        files = sorted(os.listdir(os.path.join(self.dir, 'http', 'logs')))
+        self.assertEqual(files, ['plain_http.log', 'plain_http.worker-1.log'])
+
+        with open(os.path.join(self.dir, 'http', 'logs', 'plain_http.worker-1.log')) as f:
+            self.assertIn('abc', f.read())
+
+        # Handlers of the main file are no longer in use
+        handlers = logging.getLogger('zato').handlers
+        self.assertFalse([handler for handler in main_handlers if handler in handlers])
+        self.assertTrue(all(handler in handlers for handler in server.log_handlers))
+
+    def test_json_not_utf8(self):
+        server = self.get_http_server([('A', {'url_path': '/a', 'response': '{}'})], log_format='json')
+
+        # Requests are logged to the file only, not stderr
+        logging.getLogger('zato').setLevel(logging.INFO)
+        server.log_handlers[0].setLevel(logging.INFO)
+
+        self.call(server, '/a', qs='b=\xff', headers={'X-Test': '\xfe'})
+
+        with open(os.path.join(self.dir, 'http', 'logs', 'plain_http.log')) as f:
+            records = [loads(line) for line in f]
+
+        data = [record['data'] for record in records if record['msg'] == 'Request'][0]
+        self.assertEqual(data['qs'], u'b=\ufffd')
+        self.assertEqual(data['req_headers']['X-Test'], u'\ufffd')
+
+# ################################################################################################################################
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2014 Dariusz Suchojad <dsuch at zato.io>
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+# stdlib
+from cStringIO import StringIO
+
+# Tests
+from tests.base import ServerTestCase
+
+# ################################################################################################################################
+
+MOCKS = [
+    ('Default', {'url_path': '/a', 'response': '{"ns":"default"}'}),
+    ('Billing', {'url_path': '/a', 'response': '{"ns":"billing"}', 'namespace': 'billing'}),
+    ('Billing only', {'url_path': '/b', 'response': '{"ns":"billing"}', 'namespace': 'billing'}),
+]
+
+# ################################################################################################################################
+
+class NamespaceTestCase(ServerTestCase):
+
+    def setUp(self):
+        super(NamespaceTestCase, self).setUp()
+        self.server = self.get_http_server(MOCKS, **{'vhost_Billing.example.com': 'billing', 'listen_billing': '0'})
+
+    def call_app(self, app, path, host=''):
+        environ = {'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': '', 'HTTP_HOST': host,
+            'wsgi.input': StringIO('')}
+        response = {}
+
+        def start_response(status, headers):
+            response['status'] = status
+
+        return response, ''.join(str(chunk) for chunk in app(environ, start_response))
+
+    def test_same_path_no_conflict(self):
+        self.assertEqual(self.server.conflicts, [])
+
+    def test_default(self):
+        self.assertEqual(self.call(self.server, '/a')[2], '{"ns":"default"}')
+        self.assertNotEqual(self.call(self.server, '/b')[0], '200 OK')
+
+    def test_vhost(self):
+        # Host is matched case-insensitively and without its port
+        status, _, data = self.call(self.server, '/a', headers={'Host': 'billing.EXAMPLE.com:8080'})
+        self.assertEqual((status, data), ('200 OK', '{"ns":"billing"}'))
+
+        self.assertEqual(self.call(self.server, '/b', headers={'Host': 'billing.example.com'})[0], '200 OK')
+
+    def test_unknown_vhost(self):
+        self.assertEqual(self.call(self.server, '/a', headers={'Host': 'other.example.com'})[2], '{"ns":"default"}')
+
+    def test_listener(self):
+        self.assertEqual(self.server.listeners, [('billing', '0')])
+
+        response, data = self.call_app(self.server.get_app('billing'), '/a')
+        self.assertEqual((response['status'], data), ('200 OK', '{"ns":"billing"}'))
+
+    def test_listener_ignores_vhosts(self):
+
+        # Only listeners of the default namespace map Host headers to namespaces
+        response, data = self.call_app(self.server.get_app('billing'), '/a', 'other.example.com')
+        self.assertEqual(data, '{"ns":"billing"}')
+
+# ################################################################################################################################
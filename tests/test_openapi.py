@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2014 Dariusz Suchojad <dsuch at zato.io>
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+# stdlib
+import os
+from cStringIO import StringIO
+from json import dumps, loads
+from shutil import rmtree
+from tempfile import mkdtemp
+from unittest import TestCase
+
+# ConfigObj
+from configobj import ConfigObj
+
+# Zato
+from zato.apimox.openapi import get_status, Importer, JSONReader, SpecError
+
+# ################################################################################################################################
+
+# Numbers of all kinds, so that there is a chunk size to cut each of them short at any character
+SPEC = dumps({
+    'openapi': '3.0.0',
+    'servers': [{'url': 'http://example.com/v1/'}],
+    'paths': {
+        '/users/{user-id}': {
+            'get': {
+                'operationId': 'getUser',
+                'responses': {
+                    '200': {'content': {'application/json': {'example': {'id': 12345, 'ratio': -1.25e-3, 'big': 6.02E+23}}}},
+                    '404': {'description': 'Not found'},
+                },
+            },
+        },
+        '/numbers': {
+            'post': {
+                'responses': {'default': {'content': {'application/json': {'schema': {'$ref': '#/components/schemas/N'}}}}},
+            },
+        },
+    },
+    'components': {'schemas': {'N': {'type': 'object', 'properties': {'n': {'type': 'number', 'example': 10.5}}}}},
+    'x-numbers': [0, -0.5, 1e10, 123456789012345678901234567890],
+}, sort_keys=True)
+
+# ################################################################################################################################
+
+def read_all(reader):
+    """ Reads a whole document through iter_object, recursing into objects, and returns what was read.
+    """
+    out = {}
+
+    for key in reader.iter_object():
+        out[key] = read_all(reader) if reader.peek() == '{' else reader.read_value()
+
+    return out
+
+# ################################################################################################################################
+
+class JSONReaderTestCase(TestCase):
+
+    def test_every_chunk_size(self):
+        expected = loads(SPEC)
+
+        for chunk_size in xrange(1, len(SPEC) + 1):
+            self.assertEqual(read_all(JSONReader(StringIO(SPEC), chunk_size)), expected, 'Chunk size {}'.format(chunk_size))
+
+    def test_number_at_end(self):
+        reader = JSONReader(StringIO('12.5e3'), 2)
+        self.assertEqual(reader.read_value(), 12.5e3)
+
+    def test_truncated(self):
+        reader = JSONReader(StringIO('{"a": [1, 2'), 3)
+        self.assertRaises((SpecError, ValueError), read_all, reader)
+
+# ################################################################################################################################
+
+class GetStatusTestCase(TestCase):
+
+    def test_explicit_first(self):
+        self.assertEqual(get_status({'default': {}, '2XX': {}, '201': {}, '200': {}}), ('200', '200'))
+
+    def test_range(self):
+        self.assertEqual(get_status({'default': {}, '2XX': {}, '404': {}}), ('2XX', '200'))
+        self.assertEqual(get_status({'2xx': {}}), ('2xx', '200'))
+
+    def test_default(self):
+        self.assertEqual(get_status({'default': {}, '404': {}}), ('default', '200'))
+
+    def test_other(self):
+        self.assertEqual(get_status({'404': {}, '500': {}}), ('404', '404'))
+        self.assertEqual(get_status({'5XX': {}, 'x-extension': {}}), ('5XX', '500'))
+
+    def test_none(self):
+        self.assertEqual(get_status({}), (None, None))
+        self.assertEqual(get_status({'x-extension': {}}), (None, None))
+
+# ################################################################################################################################
+
+class ImporterTestCase(TestCase):
+
+    def setUp(self):
+        self.dir = mkdtemp()
+        self.spec_path = os.path.join(self.dir, 'spec.json')
+
+        with open(self.spec_path, 'w') as f:
+            f.write(SPEC)
+
+    def tearDown(self):
+        rmtree(self.dir)
+
+    def test_run(self):
+        importer = Importer(self.dir, self.spec_path, 'openapi.ini', namespace='users')
+        config = ConfigObj(importer.run())
+
+        self.assertEqual(sorted(config), ['POST /numbers', 'getUser'])
+
+        user = config['getUser']
+        self.assertEqual(user['url_path'], '/v1/users/{user_id}')
+        self.assertEqual(user['status'], '200')
+        self.assertEqual(user['namespace'], 'users')
+
+        with open(os.path.join(self.dir, 'response', 'json', user['response'])) as f:
+            self.assertEqual(loads(f.read()), {'id': 12345, 'ratio': -1.25e-3, 'big': 6.02E+23})
+
+        numbers = config['POST /numbers']
+        self.assertEqual(numbers['status'], '200')
+
+        with open(os.path.join(self.dir, 'response', 'json', numbers['response'])) as f:
+            self.assertEqual(loads(f.read()), {'n': 10.5})
+
+# ################################################################################################################################
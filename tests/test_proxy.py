@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2014 Dariusz Suchojad <dsuch at zato.io>
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+# stdlib
+import os
+from httplib import HTTPException
+
+# ConfigObj
+from configobj import ConfigObj
+
+# gevent
+from gevent import socket
+from gevent.server import StreamServer
+
+# Zato
+from zato.apimox.proxy import ConnectionPool
+
+# Tests
+from tests.base import ServerTestCase
+
+# ################################################################################################################################
+
+class Upstream(object):
+    """ Responds to each request with a keep-alive response and then, if close_after is set, closes the connection anyway,
+    as servers do once their keep-alive timeouts expire.
+    """
+    def __init__(self, close_after=False):
+        self.close_after = close_after
+        self.requests = []
+        self.server = StreamServer(('127.0.0.1', 0), self.handle)
+        self.server.start()
+        self.address = 'http://127.0.0.1:{}'.format(self.server.server_port)
+
+    def handle(self, sock, address):
+        f = sock.makefile('rb')
+
+        while True:
+            line = f.readline()
+            if not line:
+                break
+
+            length = 0
+            while True:
+                header = f.readline()
+                if header in ('\r\n', '\n', ''):
+                    break
+                name, value = header.split(':', 1)
+                if name.lower() == 'content-length':
+                    length = int(value)
+
+            self.requests.append((line.split()[0], f.read(length)))
+
+            data = 'resp-{}'.format(len(self.requests))
+            sock.sendall('HTTP/1.1 200 OK\r\nContent-Type: text/plain\r\nContent-Length: {}\r\n\r\n{}'.format(len(data), data))
+
+            if self.close_after:
+                break
+
+        f.close()
+        sock.close()
+
+    def stop(self):
+        self.server.stop()
+
+# ################################################################################################################################
+
+class ConnectionPoolTestCase(ServerTestCase):
+
+    def setUp(self):
+        super(ConnectionPoolTestCase, self).setUp()
+        self.upstream = Upstream(close_after=True)
+        self.pool = ConnectionPool(self.upstream.address)
+
+    def tearDown(self):
+        self.upstream.stop()
+        super(ConnectionPoolTestCase, self).tearDown()
+
+    def test_idle_conn_closed_retried(self):
+        self.assertEqual(self.pool.request('GET', '/a', None, {})[2], 'resp-1')
+        self.assertEqual(self.pool.idle.qsize(), 1)
+
+        self.assertEqual(self.pool.request('GET', '/a', None, {})[2], 'resp-2')
+        self.assertEqual([method for method, _ in self.upstream.requests], ['GET', 'GET'])
+
+    def test_non_idempotent_not_retried_after_send(self):
+        self.pool.request('GET', '/a', None, {})
+        self.assertRaises((socket.error, HTTPException), self.pool.request, 'POST', '/a', 'abc', {})
+        self.assertEqual([method for method, _ in self.upstream.requests], ['GET'])
+
+    def test_new_conn_not_retried(self):
+        port = self.upstream.server.server_port
+        self.upstream.stop()
+
+        pool = ConnectionPool('http://127.0.0.1:{}'.format(port))
+        self.assertRaises(socket.error, pool.request, 'GET', '/a', None, {})
+
+# ################################################################################################################################
+
+class ProxyTestCase(ServerTestCase):
+
+    def test_upstream_down(self):
+        sock = socket.socket()
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+        sock.close()
+
+        server = self.get_http_server([], proxy_upstream='http://127.0.0.1:{}'.format(port))
+        status, headers, data = self.call(server, '/a')
+
+        self.assertEqual(status, '502 Bad Gateway')
+        self.assertEqual(headers['Content-Type'], 'text/plain')
+        self.assertEqual(data, 'Could not forward request to upstream server\n')
+
+    def test_recorded_namespace(self):
+        upstream = Upstream()
+
+        try:
+            server = self.get_http_server([], proxy_upstream=upstream.address, **{'vhost_billing.example.com': 'billing'})
+
+            status, _, data = self.call(server, '/a', headers={'Host': 'billing.example.com'})
+            self.assertEqual((status, data), ('200 OK', 'resp-1'))
+
+            # The recording serves the same request next time but only in the namespace the request was in
+            status, _, data = self.call(server, '/a', headers={'Host': 'billing.example.com'})
+            self.assertEqual((status, data), ('200 OK', 'resp-1'))
+
+            status, _, data = self.call(server, '/a')
+            self.assertEqual((status, data), ('200 OK', 'resp-2'))
+
+            recorded = ConfigObj(os.path.join(self.dir, 'http', 'recorded.ini'))
+            self.assertEqual(sorted(section.get('namespace', 'default') for section in recorded.values()), ['billing', 'default'])
+        finally:
+            upstream.stop()
+
+    def record(self, dedupe, data):
+        """ Records a response the way a worker of its own would, i.e. with a proxy that recorded nothing before.
+        """
+        server = self.get_http_server([], proxy_upstream='http://127.0.0.1:1', proxy_dedupe=str(dedupe))
+        environ = {'REQUEST_METHOD': 'GET', 'PATH_INFO': '/a', 'QUERY_STRING': ''}
+        server.proxy.save(environ, 200, [('Content-Type', 'text/plain')], data)
+
+        return server
+
+    def get_recorded(self):
+        return ConfigObj(os.path.join(self.dir, 'http', 'recorded.ini'))
+
+    def test_recorded_once(self):
+        self.record(True, 'resp-1')
+        server = self.record(True, 'resp-2')
+
+        self.assertEqual(len(self.get_recorded()), 1)
+        self.assertEqual(server.get_mocks(), [])
+
+    def test_recorded_replaced(self):
+        self.record(False, 'resp-1')
+        server = self.record(False, 'resp-2')
+
+        recorded = self.get_recorded()
+        self.assertEqual(len(recorded), 1)
+        self.assertEqual(self.call(server, '/a')[2], 'resp-2')
+
+        with open(os.path.join(self.dir, 'http', 'response', 'txt', recorded.values()[0]['response'])) as f:
+            self.assertEqual(f.read(), 'resp-2')
+
+# ################################################################################################################################
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2014 Dariusz Suchojad <dsuch at zato.io>
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+# stdlib
+import os
+from unittest import TestCase
+
+# Zato
+from zato.apimox.state import Scenario, SCENARIO_START, Sequence, SEQUENCE_ONCE, SEQUENCE_RANDOM, SEQUENCE_ROUND_ROBIN, \
+     SharedState
+
+# Tests
+from tests.base import ServerTestCase
+
+# ################################################################################################################################
+
+class SharedStateTestCase(TestCase):
+
+    def test_slots(self):
+        state = SharedState(2)
+
+        a = state.get_slot('a')
+        b = state.get_slot('b')
+
+        self.assertEqual(sorted([a, b]), [0, 1])
+        self.assertEqual(state.get_slot('a'), a)
+        self.assertRaises(ValueError, state.get_slot, 'c')
+
+    def test_same_slot_for_str_and_unicode(self):
+        state = SharedState(16)
+        self.assertEqual(state.get_slot(('bucket', 'a')), state.get_slot((u'bucket', u'a')))
+
+    def test_slots_assigned_by_other_processes(self):
+        state = SharedState(16)
+        read_fd, write_fd = os.pipe()
+
+        # Each process assigns slots in a different order and it's the first one to do it that assigns each
+        pid = os.fork()
+        if not pid:
+            try:
+                os.close(read_fd)
+                os.write(write_fd, ','.join(str(state.get_slot(key)) for key in 'abcde'))
+            finally:
+                os._exit(0)
+
+        os.close(write_fd)
+        os.waitpid(pid, 0)
+
+        child = [int(slot) for slot in os.read(read_fd, 100).split(',')]
+        os.close(read_fd)
+
+        self.assertEqual([state.get_slot(key) for key in 'edcba'], child[::-1])
+        self.assertEqual(len(set(child)), 5)
+
+    def test_incr(self):
+        state = SharedState(1)
+        slot = state.get_slot('a')
+
+        self.assertEqual([state.incr(slot, modulo=3) for _ in range(4)], [0, 1, 2, 0])
+
+        state.reset()
+        self.assertEqual([state.incr(slot, limit=2) for _ in range(4)], [0, 1, 2, 2])
+
+    def test_compare_and_set(self):
+        state = SharedState(1)
+        slot = state.get_slot('a')
+
+        self.assertTrue(state.compare_and_set(slot, 0, 5))
+        self.assertFalse(state.compare_and_set(slot, 0, 6))
+        self.assertEqual(state.get(slot), 5)
+
+    def test_shared_with_forked_processes(self):
+        state = SharedState(1)
+        slot = state.get_slot('a')
+
+        pid = os.fork()
+        if not pid:
+            try:
+                for _ in range(100):
+                    state.incr(slot)
+            finally:
+                os._exit(0)
+
+        for _ in range(100):
+            state.incr(slot)
+
+        os.waitpid(pid, 0)
+        self.assertEqual(state.get(slot), 200)
+
+# ################################################################################################################################
+
+class SequenceTestCase(TestCase):
+
+    def test_round_robin_with_weights(self):
+        sequence = Sequence(SharedState(1), 'a', SEQUENCE_ROUND_ROBIN, ['x', 'y'], [2, 1])
+        self.assertEqual([sequence.get_next() for _ in range(6)], ['x', 'x', 'y', 'x', 'x', 'y'])
+
+    def test_once(self):
+        sequence = Sequence(SharedState(1), 'a', SEQUENCE_ONCE, ['x', 'y', 'z'], [1, 1, 1])
+        self.assertEqual([sequence.get_next() for _ in range(5)], ['x', 'y', 'z', 'z', 'z'])
+
+        sequence.reset()
+        self.assertEqual(sequence.get_next(), 'x')
+
+    def test_random(self):
+        sequence = Sequence(SharedState(1), 'a', SEQUENCE_RANDOM, ['x', 'y'], [1, 0])
+        self.assertEqual(set(sequence.get_next() for _ in range(20)), {'x'})
+
+    def test_invalid_mode(self):
+        self.assertRaises(ValueError, Sequence, SharedState(1), 'a', 'no-such-mode', ['x'], [1])
+
+# ################################################################################################################################
+
+class ScenarioTestCase(TestCase):
+
+    def test_move(self):
+        scenario = Scenario(SharedState(1), 'order')
+        paid = scenario.get_state_id('paid')
+        shipped = scenario.get_state_id('shipped')
+
+        self.assertEqual(scenario.get_current(), SCENARIO_START)
+        self.assertTrue(scenario.move(scenario.get_state_id(SCENARIO_START), paid))
+        self.assertTrue(scenario.is_in(paid))
+
+        # Someone else moved it already
+        self.assertFalse(scenario.move(scenario.get_state_id(SCENARIO_START), shipped))
+        self.assertEqual(scenario.get_current(), 'paid')
+
+        self.assertTrue(scenario.move(None, shipped))
+        self.assertEqual(scenario.get_current(), 'shipped')
+
+        scenario.reset()
+        self.assertEqual(scenario.get_current(), SCENARIO_START)
+
+# ################################################################################################################################
+
+class ServerStateTestCase(ServerTestCase):
+
+    def test_sequence_and_scenario(self):
+        server = self.get_http_server([
+            ('Seq', {'url_path': '/seq', 'response_1': '{"n": 1}', 'response_2': '{"n": 2}', 'sequence': 'once'}),
+            ('Pay', {'url_path': '/pay', 'scenario': 'order', 'scenario_state': 'start', 'scenario_next': 'paid',
+                'response': '{"paid": true}'}),
+            ('Ship', {'url_path': '/ship', 'scenario': 'order', 'scenario_state': 'paid', 'response': '{"shipped": true}'}),
+        ])
+
+        self.assertEqual([self.call(server, '/seq')[2] for _ in range(3)], ['{"n": 1}', '{"n": 2}', '{"n": 2}'])
+
+        self.assertTrue(self.call(server, '/ship')[0].startswith('412'))
+        self.assertEqual(self.call(server, '/pay')[2], '{"paid": true}')
+        self.assertEqual(self.call(server, '/ship')[2], '{"shipped": true}')
+
+        # The scenario has moved on so /pay is no longer active
+        self.assertTrue(self.call(server, '/pay')[0].startswith('412'))
+
+        state = server.admin.on_get_state({}, '')
+        self.assertEqual(state, {'scenarios': {'order': 'paid'}, 'sequences': {'Seq': 1}})
+
+        server.admin.on_reset_state({}, '')
+        self.assertEqual(self.call(server, '/seq')[2], '{"n": 1}')
+        self.assertEqual(self.call(server, '/pay')[2], '{"paid": true}')
+
+# ################################################################################################################################
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2014 Dariusz Suchojad <dsuch at zato.io>
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+# stdlib
+from unittest import TestCase
+
+# Bunch
+from bunch import Bunch
+
+# Zato
+from zato.apimox.state import SharedState
+from zato.apimox.template import Template
+
+# ################################################################################################################################
+
+def get_match(path_params=None, qs=None, environ=None):
+    return Bunch(path_params=path_params or {}, wsgi_environ_qs=qs or {}, wsgi_environ=environ or {})
+
+# ################################################################################################################################
+
+class TemplateTestCase(TestCase):
+
+    def test_compile_chunks(self):
+        template = Template('a{{uuid}}{{ counter }}b')
+
+        self.assertEqual(len(template.chunks), 4)
+        self.assertEqual(template.chunks[0], 'a')
+        self.assertTrue(callable(template.chunks[1]))
+        self.assertTrue(callable(template.chunks[2]))
+        self.assertEqual(template.chunks[3], 'b')
+
+    def test_no_slots(self):
+        template = Template('{"a": 1}')
+        self.assertEqual(template.chunks, ['{"a": 1}'])
+        self.assertEqual(template.render(get_match()), '{"a": 1}')
+
+    def test_render_named_slots(self):
+        template = Template('{{path.id}}/{{qs.lang}}/{{header.X-Request-ID}}/{{header.Content-Type}}/{{qs.missing}}.')
+        match = get_match({'id': '5'}, {'lang': 'en'}, {'HTTP_X_REQUEST_ID': 'abc', 'CONTENT_TYPE': 'text/plain'})
+
+        self.assertEqual(template.render(match), '5/en/abc/text/plain/.')
+
+    def test_counter(self):
+        template = Template('{{counter}}')
+        self.assertEqual([template.render(get_match()) for _ in range(3)], ['1', '2', '3'])
+
+    def test_shared_counter(self):
+        state = SharedState(16)
+
+        # Same as one template in two workers
+        first, second = Template('{{counter}}'), Template('{{counter}}')
+        first.bind(state, ('counter', 'A', 0))
+        second.bind(state, ('counter', 'A', 0))
+
+        self.assertEqual([template.render(get_match()) for template in (first, second, first, second)], ['1', '2', '3', '4'])
+
+        second.reset()
+        self.assertEqual(first.render(get_match()), '1')
+
+    def test_uuid(self):
+        template = Template('{{uuid}}')
+        first, second = template.render(get_match()), template.render(get_match())
+
+        self.assertEqual(len(first), 32)
+        self.assertNotEqual(first, second)
+
+    def test_invalid_slots(self):
+        self.assertRaises(ValueError, Template, '{{path}}')
+        self.assertRaises(ValueError, Template, '{{uuid.name}}')
+        self.assertRaises(ValueError, Template, '{{no_such_slot}}')
+
+# ################################################################################################################################
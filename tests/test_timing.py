@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2014 Dariusz Suchojad <dsuch at zato.io>
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+# stdlib
+from json import loads
+from unittest import TestCase
+
+# Zato
+from zato.apimox.timing import BUCKETS, Histogram, monotonic, Timings
+
+# Tests
+from tests.base import ServerTestCase
+
+# ################################################################################################################################
+
+class MonotonicTestCase(TestCase):
+
+    def test_monotonic(self):
+        first = monotonic()
+        self.assertLessEqual(first, monotonic())
+
+# ################################################################################################################################
+
+class HistogramTestCase(TestCase):
+
+    def test_empty(self):
+        out = Histogram().to_dict()
+
+        self.assertEqual(out['count'], 0)
+        self.assertEqual(out['mean_usec'], 0)
+        self.assertEqual(out['buckets'], {})
+        self.assertEqual(out['p99_usec'], 0)
+
+    def test_buckets(self):
+        histogram = Histogram()
+
+        # A duration equal to an upper bound is in that bucket
+        for usec in (5, 10, 11, 2000000):
+            histogram.add(usec)
+
+        out = histogram.to_dict()
+
+        self.assertEqual(out['count'], 4)
+        self.assertEqual(out['max_usec'], 2000000)
+        self.assertEqual(out['buckets'], {'le_10': 2, 'le_25': 1, 'inf': 1})
+
+    def test_percentiles(self):
+        histogram = Histogram()
+
+        for _ in xrange(90):
+            histogram.add(20)
+
+        for _ in xrange(10):
+            histogram.add(400)
+
+        self.assertEqual(histogram.get_percentile(50), 25)
+        self.assertEqual(histogram.get_percentile(90), 25)
+        self.assertEqual(histogram.get_percentile(99), 500)
+
+    def test_percentile_unbounded(self):
+        histogram = Histogram()
+        histogram.add(BUCKETS[-1] * 3)
+
+        self.assertEqual(histogram.get_percentile(50), BUCKETS[-1] * 3)
+
+    def test_reset(self):
+        histogram = Histogram()
+        histogram.add(1)
+        histogram.reset()
+
+        self.assertEqual((histogram.count, histogram.total, histogram.max), (0, 0, 0))
+
+# ################################################################################################################################
+
+class TimerTestCase(TestCase):
+
+    def test_phases(self):
+        timings = Timings()
+        timer = timings.get_timer()
+
+        timer.mark('read')
+        timer.add('score', monotonic())
+        timer.add('score', monotonic())
+        timer.mark('match')
+        timer.close()
+
+        self.assertEqual(sorted(timings.phases), ['match', 'read', 'score', 'total', 'write'])
+
+        # Nested phases are summed up into a single duration per request
+        self.assertEqual(timings.phases['score'].count, 1)
+        self.assertEqual(timings.phases['total'].count, 1)
+
+    def test_reset(self):
+        timings = Timings()
+        timings.get_timer().close()
+        timings.reset()
+
+        self.assertEqual(timings.to_dict(), {})
+
+# ################################################################################################################################
+
+class ServerTimingsTestCase(ServerTestCase):
+
+    def test_timings(self):
+        server = self.get_http_server([('Test', {'url_path': '/a', 'response': '{"a":1}'})], timing='True')
+
+        for _ in xrange(3):
+            self.assertEqual(self.call(server, '/a')[0], '200 OK')
+
+        status, _, data = self.call(server, '/__apimox/timings')
+        phases = loads(data)['phases']
+
+        self.assertEqual(status, '200 OK')
+        self.assertEqual(phases['total']['count'], 3)
+        self.assertEqual(phases['write']['count'], 3)
+        self.assertIn('match', phases)
+
+        self.call(server, '/__apimox/timings', method='DELETE')
+        self.assertEqual(loads(self.call(server, '/__apimox/timings')[2])['phases'], {})
+
+    def test_timings_disabled(self):
+        server = self.get_http_server([('Test', {'url_path': '/a', 'response': '{"a":1}'})])
+
+        self.assertIsNone(server.timings)
+        self.assertEqual(self.call(server, '/__apimox/timings')[0], '404 Not Found')
+
+# ################################################################################################################################
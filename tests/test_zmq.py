@@ -0,0 +1,286 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2014 Dariusz Suchojad <dsuch at zato.io>
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+# stdlib
+import logging, os
+from threading import Thread
+from time import sleep, time
+from unittest import TestCase
+
+# ZeroMQ
+import zmq
+
+# Zato
+from zato.apimox.capture import read_capture
+from zato.apimox.zmq_ import AsyncWriter, Stats, ZMQServer
+
+# Tests
+from tests.base import ServerTestCase
+
+# ################################################################################################################################
+
+# How long to wait for messages to be received, in seconds
+WAIT_TIMEOUT = 10
+
+# ################################################################################################################################
+
+class RecordingHandler(logging.Handler):
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+class LoggingTestCase(TestCase):
+    """ Collects what zato.apimox.zmq_ logs.
+    """
+    def setUp(self):
+        self.handler = RecordingHandler()
+        self.logger = logging.getLogger('zato.apimox.zmq_')
+        self.level = self.logger.level
+        self.logger.addHandler(self.handler)
+        self.logger.setLevel(logging.INFO)
+
+    def tearDown(self):
+        self.logger.removeHandler(self.handler)
+        self.logger.setLevel(self.level)
+
+# ################################################################################################################################
+
+class StatsTestCase(LoggingTestCase):
+
+    def test_add(self):
+        stats = Stats()
+        stats.add(3)
+        stats.add(5)
+
+        self.assertEqual((stats.msgs, stats.batches, stats.max_batch), (8, 2, 5))
+
+    def test_log_if_due(self):
+        stats = Stats(0)
+        stats.add(4)
+        stats.log_if_due()
+
+        self.assertEqual(len(self.handler.messages), 1)
+        self.assertTrue(self.handler.messages[0].startswith('Received 4 msgs'))
+        self.assertEqual((stats.msgs, stats.batches, stats.max_batch), (0, 0, 0))
+
+    def test_not_due(self):
+        stats = Stats(3600)
+        stats.add(4)
+        stats.log_if_due()
+
+        self.assertEqual(self.handler.messages, [])
+        self.assertEqual(stats.msgs, 4)
+
+# ################################################################################################################################
+
+class AsyncWriterTestCase(LoggingTestCase):
+
+    def test_write(self):
+        writer = AsyncWriter()
+        writer.write([([b'a', b'b'], 1), ([b'c'], 2)])
+
+        self.assertEqual(self.handler.messages, ['a\nb\nc'])
+
+    def test_close_writes_queued_batches(self):
+        writer = AsyncWriter()
+        writer.start()
+        writer.put([([b'a'], 1)])
+        writer.put([([b'b'], 2)])
+        writer.close()
+
+        self.assertFalse(writer.is_alive())
+        self.assertEqual(self.handler.messages, ['a', 'b'])
+
+# ################################################################################################################################
+
+class RulesTestCase(ServerTestCase):
+
+    def get_server(self, mocks):
+        self.write_config('zmq', mocks, log_file_rep='rep_zmq.log')
+        return ZMQServer('rep', self.dir, 'rep')
+
+    def test_get_reply(self):
+        self.write_response('zmq', 'pong.txt', 'pong')
+
+        server = self.get_server([
+            ('Exact', {'match': 'ping', 'response': 'pong.txt'}),
+            ('Short prefix', {'match': 'get', 'match_type': 'prefix', 'response': '{"prefix": "short"}'}),
+            ('Long prefix', {'match': 'get_user', 'match_type': 'prefix', 'response': '{"prefix": "long"}'}),
+            ('Regex', {'match': r'user:(?P<user_id>\d+)', 'match_type': 'regex', 'template': 'True',
+                'response': '{"user_id": {{path.user_id}}}'}),
+        ])
+
+        self.assertEqual(server.get_reply('ping', 'none'), 'pong')
+        self.assertEqual(server.get_reply('get_user:1', 'none'), '{"prefix": "long"}')
+        self.assertEqual(server.get_reply('get_order:1', 'none'), '{"prefix": "short"}')
+        self.assertEqual(server.get_reply('user:5', 'none'), '{"user_id": 5}')
+        self.assertEqual(server.get_reply('nothing', 'none'), 'none')
+
+    def test_missing_response_file(self):
+        server = self.get_server([('Exact', {'match': 'ping', 'response': 'pong.txt'})])
+        self.assertEqual(server.get_reply('ping', 'none'), '(Response not found)')
+
+    def test_invalid_match_type(self):
+        self.assertRaises(ValueError, self.get_server, [('Exact', {'match': 'ping', 'match_type': 'no-such-type'})])
+
+# ################################################################################################################################
+
+class FakeSocket(object):
+    def __init__(self):
+        self.sent = []
+
+    def send_multipart(self, frames, copy=True):
+        self.sent.append(frames)
+
+class SendMessagesTestCase(ServerTestCase):
+
+    def get_server(self, socket_type, mocks, **apimox):
+        self.write_config('zmq', mocks, **dict({'log_file_{}'.format(socket_type): 'zmq.log'}, **apimox))
+        return ZMQServer(socket_type, self.dir, socket_type)
+
+    def send(self, server):
+        socket = FakeSocket()
+        server.send_messages(socket, server.config.mocks_config.apimox)
+        return socket.sent
+
+    def test_count_and_topic(self):
+        self.write_response('zmq', 'event.json', '{"event": 2}')
+
+        server = self.get_server('push', [
+            ('A', {'message': '{"event": 1}'}),
+            ('B', {'message': 'event.json'}),
+        ], count='3', topic='events')
+
+        self.assertEqual(self.send(server), [['events', '{"event": 1}'], ['events', '{"event": 2}'], ['events', '{"event": 1}']])
+
+    def test_bursts_do_not_exceed_count(self):
+        server = self.get_server('push', [('A', {'message': '{}'})], count='5', burst='2')
+        self.assertEqual(len(self.send(server)), 5)
+
+    def test_template(self):
+        server = self.get_server('push', [('A', {'message': '{"n": {{counter}}}', 'template': 'True'})], count='2')
+        self.assertEqual(self.send(server), [['{"n": 1}'], ['{"n": 2}']])
+
+    def test_pub_delay_not_counted_in_duration(self):
+        server = self.get_server('pub', [('A', {'message': '{}'})], duration='0.2', pub_delay='0.3', rate='100')
+        self.assertTrue(len(self.send(server)) > 5)
+
+    def test_no_messages(self):
+        server = self.get_server('push', [])
+        self.assertRaises(ValueError, self.send, server)
+
+# ################################################################################################################################
+
+class SocketTestCase(ServerTestCase, LoggingTestCase):
+    """ Runs a server's loop over a real socket in a thread of its own, stopped by terminating the socket's context.
+    """
+    def setUp(self):
+        ServerTestCase.setUp(self)
+        LoggingTestCase.setUp(self)
+        self.context = zmq.Context()
+
+    def tearDown(self):
+        self.context.destroy(linger=0)
+        LoggingTestCase.tearDown(self)
+        ServerTestCase.tearDown(self)
+
+    def start(self, socket_type, mocks, func_name, *args, **apimox):
+        """ Returns the address a server listens on and a function that stops it.
+        """
+        self.write_config('zmq', mocks, **dict({'log_file_{}'.format(socket_type): 'zmq.log',
+            '{}_port'.format(socket_type): '*'}, **apimox))
+
+        server = ZMQServer(socket_type, self.dir, socket_type)
+        config = server.config.mocks_config.apimox
+        socket = server.get_socket(config)
+        del self.handler.messages[:]
+
+        def run():
+            try:
+                getattr(server, func_name)(socket, config, *args)
+            except zmq.ContextTerminated:
+                socket.close(linger=0)
+
+        thread = Thread(target=run)
+        thread.start()
+
+        def stop():
+            socket.context.term()
+            thread.join()
+
+        return socket.getsockopt(zmq.LAST_ENDPOINT), stop
+
+    def connect(self, socket_type, address):
+        socket = self.context.socket(socket_type)
+        socket.setsockopt(zmq.RCVTIMEO, WAIT_TIMEOUT * 1000)
+        socket.connect(address)
+        return socket
+
+    def get_batches(self):
+        return [msg.split('\n') for msg in self.handler.messages if msg.startswith('msg\n')]
+
+    def test_router_replies(self):
+        address, stop = self.start('router', [('Ping', {'match': 'ping', 'response': '{"pong": 1}'})], 'serve_replies')
+
+        try:
+            req = self.connect(zmq.REQ, address)
+            req.send(b'ping')
+            self.assertEqual(req.recv_multipart(), [b'{"pong": 1}'])
+
+            # What a DEALER sends is all message, empty frames in it included, as there is no delimiter after its identity
+            dealer = self.connect(zmq.DEALER, address)
+            dealer.send_multipart([b'ping', b'', b'x'])
+            self.assertEqual(dealer.recv_multipart(), [b'{"pong": 1}'])
+
+            # Unless it sends one on its own, same as REQ does
+            dealer.send_multipart([b'', b'ping'])
+            self.assertEqual(dealer.recv_multipart(), [b'', b'{"pong": 1}'])
+
+            dealer.send_multipart([b'other'])
+            self.assertEqual(dealer.recv_multipart(), [b'No matching mock found'])
+        finally:
+            stop()
+
+    def test_rep_replies(self):
+        address, stop = self.start('rep', [('Ping', {'match': 'ping', 'response': '{"pong": 1}'})], 'serve_replies')
+
+        try:
+            req = self.connect(zmq.REQ, address)
+            req.send(b'ping')
+            self.assertEqual(req.recv_multipart(), [b'{"pong": 1}'])
+        finally:
+            stop()
+
+    def test_recv_batches(self):
+        address, stop = self.start('pull', [], 'recv_batches', 10, capture='True')
+
+        try:
+            push = self.connect(zmq.PUSH, address)
+            sent = [[b'msg', str(idx).encode()] for idx in xrange(100)]
+
+            for msg in sent:
+                push.send_multipart(msg)
+
+            until = time() + WAIT_TIMEOUT
+            while sum(len(batch) for batch in self.get_batches()) < 200 and time() < until:
+                sleep(0.01)
+        finally:
+            stop()
+
+        # Each message is two frames, each logged on a line of its own
+        batches = self.get_batches()
+        self.assertEqual(sum(batches, []), sum(sent, []))
+        self.assertTrue(all(len(batch) <= 20 for batch in batches))
+        self.assertEqual([frames for _, frames in read_capture(os.path.join(self.dir, 'zmq', 'logs', 'pull.capture'))], sent)
+
+# ################################################################################################################################